@@ -0,0 +1,99 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Microbenchmark of ``MessageSocket.receive`` against the previous chunked
+receive, to be run in an environment with maggy installed:
+
+    python benchmarks/framing.py
+
+Messages of 1 KB, 1 MB and 50 MB are sent over a local socket pair and the
+receive throughput is reported for both implementations. The chunked
+receive is quadratic in the message size, a single 50 MB message takes it
+several minutes.
+"""
+
+import socket
+import struct
+import threading
+import time
+
+from pyspark import cloudpickle
+
+from maggy.core import rpc
+
+SIZES = [("1 KB", 1024, 2000), ("1 MB", 1024 ** 2, 50), ("50 MB", 50 * 1024 ** 2, 1)]
+
+
+def chunked_receive(sock):
+    """The receive implementation before preallocated framing."""
+    data = b""
+    recv_done = False
+    recv_len = -1
+    while not recv_done:
+        buf = sock.recv(1024 * 2)
+        if buf is None or len(buf) == 0:
+            raise Exception("socket closed")
+        if recv_len == -1:
+            recv_len = struct.unpack(">I", buf[:4])[0]
+            data += buf[4:]
+            recv_len -= len(data)
+        else:
+            data += buf
+            recv_len -= len(buf)
+        recv_done = recv_len == 0
+    return cloudpickle.loads(data)
+
+
+def _bench(receive, size, repeat):
+    msg = {"type": "FINAL", "logs": b"x" * size}
+    frame = cloudpickle.dumps(msg)
+    frame = struct.pack(">I", len(frame)) + frame
+
+    reader, writer = socket.socketpair()
+    # the chunked receive can't handle back to back messages, so messages are
+    # sent one at a time like requests of the protocol
+    received = threading.Semaphore(0)
+
+    def _send():
+        for _ in range(repeat):
+            writer.sendall(frame)
+            received.acquire()
+
+    sender = threading.Thread(target=_send)
+    start = time.perf_counter()
+    sender.start()
+    for _ in range(repeat):
+        receive(reader)
+        received.release()
+    duration = time.perf_counter() - start
+    sender.join()
+    reader.close()
+    writer.close()
+    return size * repeat / duration / 1024 ** 2
+
+
+def main():
+    message_socket = rpc.MessageSocket()
+    print("{:>8} {:>14} {:>14}".format("size", "chunked MB/s", "framed MB/s"))
+    for name, size, repeat in SIZES:
+        chunked = _bench(chunked_receive, size, repeat)
+        framed = _bench(message_socket.receive, size, repeat)
+        print("{:>8} {:>14.1f} {:>14.1f}".format(name, chunked, framed), flush=True)
+
+
+if __name__ == "__main__":
+    main()
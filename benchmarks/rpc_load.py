@@ -0,0 +1,147 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Load benchmark for the experiment driver's RPC server, to be run in an
+environment with maggy installed.
+
+Connects a number of ``rpc.Client`` instances to a server on localhost and
+lets them send heartbeats concurrently, reporting throughput and latency:
+
+    python benchmarks/rpc_load.py --engine asyncio --clients 2000
+
+Every client opens one socket, so the select() based server fails beyond
+roughly 1000 clients. The soft limit of open files is raised to the hard
+limit, but the hard limit might need to be raised for large runs.
+"""
+
+import argparse
+import resource
+import socket
+import statistics
+import threading
+import time
+
+from maggy.core import rpc
+
+
+class FakeDriver(object):
+    """Implements the parts of ``ExperimentDriver`` the server relies on."""
+
+    experiment_type = "optimization"
+    experiment_done = False
+    num_trials = 1
+    hb_interval_min = 1
+    hb_interval_max = 1
+
+    def __init__(self):
+        self._secret = "benchmark"
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    def add_message(self, msg):
+        with self.lock:
+            self.messages += 1
+
+    def get_trial(self, trial_id):
+        raise KeyError(trial_id)
+
+    def _log(self, log_msg):
+        print(log_msg)
+
+
+def _free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def _run_clients(clients, requests, latencies, barrier):
+    barrier.wait()
+    for _ in range(requests):
+        for client in clients:
+            start = time.perf_counter()
+            client._request("METRIC", {"value": 0.5, "step": 1}, None, "")
+            latencies.append(time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--engine", choices=["select", "asyncio"], default="asyncio")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    # bind to localhost without registering with Hopsworks
+    rpc.server_host_port = ("127.0.0.1", _free_port())
+    driver = FakeDriver()
+    if args.engine == "asyncio":
+        server = rpc.AsyncServer(args.clients)
+    else:
+        server = rpc.Server(args.clients)
+    server_addr = server.start(driver)
+
+    start = time.perf_counter()
+    clients = [
+        rpc.Client(server_addr, partition_id, 0, 1, driver._secret)
+        for partition_id in range(args.clients)
+    ]
+    connect_time = time.perf_counter() - start
+
+    barrier = threading.Barrier(args.threads + 1)
+    latencies = [[] for _ in range(args.threads)]
+    threads = [
+        threading.Thread(
+            target=_run_clients,
+            args=(clients[i :: args.threads], args.requests, latencies[i], barrier),
+        )
+        for i in range(args.threads)
+    ]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    duration = time.perf_counter() - start
+
+    for client in clients:
+        client.close()
+    server.stop()
+
+    all_latencies = sorted(x for thread_lat in latencies for x in thread_lat)
+    print("engine:       {}".format(args.engine))
+    print("connections:  {}".format(args.clients))
+    print("connect time: {:.3f} s".format(connect_time))
+    print("requests:     {}".format(len(all_latencies)))
+    print("throughput:   {:.0f} req/s".format(len(all_latencies) / duration))
+    print(
+        "latency:      median {:.3f} ms, p99 {:.3f} ms".format(
+            1000 * statistics.median(all_latencies),
+            1000 * all_latencies[int(0.99 * (len(all_latencies) - 1))],
+        )
+    )
+    print("handled:      {}".format(driver.messages))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+"""
+Execution backends, running the trial executors of an experiment either on
+Spark executors or in local processes.
+"""
+
+import json
+import multiprocessing
+import os
+import time
+
+from hops import constants as hopsconstants
+from hops import hdfs as hopshdfs
+from hops import util as hopsutil
+from hops.experiment_impl.util import experiment_utils
+from pyspark import cloudpickle
+
+from maggy import util
+from maggy.core import storage
+from maggy.core.localfs import LocalFileSystem
+
+
+class SparkBackend(object):
+    """Runs one trial executor per Spark executor of the application and
+    registers the experiment and its driver with Hopsworks.
+    """
+
+    name = "spark"
+
+    def __init__(self):
+        self.fs = hopshdfs
+        self._sc = None
+
+    @property
+    def sc(self):
+        if self._sc is None:
+            self._sc = hopsutil._find_spark().sparkContext
+        return self._sc
+
+    def app_id(self):
+        return str(self.sc.applicationId)
+
+    def num_executors(self):
+        return util.num_executors(self.sc)
+
+    def executor_resources(self):
+        """Returns memory and gpus per executor as strings."""
+        return (
+            str(self.sc._conf.get("spark.executor.memory")),
+            str(self.sc._conf.get("spark.executor.gpus")),
+        )
+
+    def get_logdir(self, app_id, run_id):
+        return experiment_utils._get_logdir(app_id, run_id)
+
+    def register_driver(self, exp_driver, host, port):
+        """Registers the experiment driver with Hopsworks, to show its logs
+        in Jupyter."""
+        method = hopsconstants.HTTP_CONFIG.HTTP_POST
+        resource_url = (
+            hopsconstants.DELIMITERS.SLASH_DELIMITER
+            + hopsconstants.REST_CONFIG.HOPSWORKS_REST_RESOURCE
+            + hopsconstants.DELIMITERS.SLASH_DELIMITER
+            + "maggy"
+            + hopsconstants.DELIMITERS.SLASH_DELIMITER
+            + "drivers"
+        )
+        json_contents = {
+            "hostIp": host,
+            "port": port,
+            "appId": self.app_id(),
+            "secret": exp_driver._secret,
+        }
+        json_embeddable = json.dumps(json_contents)
+        headers = {
+            hopsconstants.HTTP_CONFIG.HTTP_CONTENT_TYPE: hopsconstants.HTTP_CONFIG.HTTP_APPLICATION_JSON
+        }
+
+        try:
+            response = hopsutil.send_request(
+                method, resource_url, data=json_embeddable, headers=headers
+            )
+
+            if (response.status_code // 100) != 2:
+                print("No connection to Hopsworks for logging.")
+                exp_driver._log("No connection to Hopsworks for logging.")
+        except Exception as e:
+            print("Connection failed to Hopsworks. No logging.")
+            exp_driver._log(e)
+            exp_driver._log("Connection failed to Hopsworks. No logging.")
+
+    def start_experiment(
+        self, app_id, run_id, name, function, hp, description, direction, key
+    ):
+        """Sets the Spark job group and registers the experiment with
+        Hopsworks.
+
+        :return: The experiment json attached to the application directory.
+        :rtype: dict
+        """
+        self.sc.setJobGroup(os.environ["ML_ID"], "{0} | {1}".format(name, function))
+
+        experiment_json = experiment_utils._populate_experiment(
+            name, function, "MAGGY", hp, description, app_id, direction, key,
+        )
+        return experiment_utils._attach_experiment_xattr(
+            app_id, run_id, experiment_json, "CREATE"
+        )
+
+    def update_experiment(self, app_id, run_id, experiment_json):
+        experiment_utils._attach_experiment_xattr(
+            app_id, run_id, experiment_json, "REPLACE"
+        )
+
+    def finalize_experiment(self, *args):
+        """Attaches the experiment outcome, see `util._finalize_experiment`."""
+        util._finalize_experiment(*args)
+
+    def run(self, wrapper_fun, num_executors):
+        """Runs `wrapper_fun` on `num_executors` Spark executors and blocks
+        until all of them returned."""
+        node_rdd = self.sc.parallelize(range(num_executors), num_executors)
+        node_rdd.foreachPartition(wrapper_fun)
+
+    def stop(self):
+        self.sc.setJobGroup("", "")
+
+
+class LocalBackend(object):
+    """Runs the trial executors in processes on the local machine, without
+    Spark or Hopsworks. Logs and results are written below a local directory
+    instead of HopsFS and the experiment is not registered with Hopsworks.
+
+    The executor processes are forked from a fork server, a process started
+    without the threads of the experiment driver, so they don't inherit locks
+    held by those threads. Like on Spark, the training function is serialized
+    with cloudpickle. Starting the fork server imports the main module again,
+    so a script running an experiment has to guard it with
+    ``if __name__ == "__main__":``. Not supported on Windows.
+    """
+
+    name = "local"
+
+    def __init__(self, num_executors=None, root=None):
+        """
+        :param num_executors: Number of executor processes, defaults to the
+            number of cpus.
+        :type num_executors: int
+        :param root: Directory the experiments directory is created in,
+            defaults to the current working directory.
+        :type root: str
+        """
+        self._num_executors = num_executors or os.cpu_count() or 1
+        self.fs = LocalFileSystem(root)
+        self._app_id = "local-{}".format(int(time.time() * 1000))
+
+    def app_id(self):
+        return self._app_id
+
+    def num_executors(self):
+        return self._num_executors
+
+    def executor_resources(self):
+        return "None", "None"
+
+    def get_logdir(self, app_id, run_id):
+        return self.fs.project_path() + "Experiments/{}_{}".format(app_id, run_id)
+
+    def register_driver(self, exp_driver, host, port):
+        pass
+
+    def start_experiment(
+        self, app_id, run_id, name, function, hp, description, direction, key
+    ):
+        return None
+
+    def update_experiment(self, app_id, run_id, experiment_json):
+        pass
+
+    def finalize_experiment(self, *args):
+        pass
+
+    def run(self, wrapper_fun, num_executors):
+        """Runs `wrapper_fun` in `num_executors` processes and blocks until
+        all of them exited.
+
+        :raises Exception: An executor process failed.
+        """
+        # the driver threads are running, forking the driver itself could
+        # deadlock the executors on a lock held by one of them
+        ctx = multiprocessing.get_context("forkserver")
+        payload = cloudpickle.dumps(wrapper_fun)
+        processes = [
+            ctx.Process(target=_run_executor, args=(payload, partition_id, self.fs))
+            for partition_id in range(num_executors)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        failed = [
+            str(partition_id)
+            for partition_id, process in enumerate(processes)
+            if process.exitcode != 0
+        ]
+        if failed:
+            raise Exception(
+                "Local executor(s) {} failed, see their logs in the "
+                "experiment directory.".format(", ".join(failed))
+            )
+
+    def stop(self):
+        pass
+
+
+def _run_executor(payload, partition_id, fs):
+    """Entry point of the executor processes of the local backend."""
+    os.environ[util.LOCAL_PARTITION_ENV_VAR] = str(partition_id)
+    storage.use(fs)
+    wrapper_fun = cloudpickle.loads(payload)
+    wrapper_fun(iter([partition_id]))
+
+
+def get_backend(backend):
+    """Returns the execution backend for `backend`, either 'spark', 'local'
+    or a backend object, and selects its file system for storage.
+
+    :raises Exception: `backend` is not a known backend.
+    """
+    if backend == "spark":
+        backend = SparkBackend()
+    elif backend == "local":
+        backend = LocalBackend()
+    elif not isinstance(backend, (SparkBackend, LocalBackend)):
+        raise Exception(
+            "Unknown execution backend: should be either 'spark', 'local' or a "
+            "backend object, but it is '{0}'.".format(str(backend))
+        )
+    storage.use(backend.fs)
+    return backend
@@ -0,0 +1,439 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Compact binary encoding of the RPC messages between executors and the
+experiment driver.
+
+Messages are dictionaries with a ``type`` key. For the fixed-shape message
+types the fields known by the schema are struct-packed, everything else ends
+up in an ``extras`` section that is pickled. cloudpickle is only used when
+the extras contain code, such as the ``model_function`` of ablation trials.
+
+A binary message starts with a magic byte, the protocol version and the
+message type code::
+
+    | MAGIC (1) | VERSION (1) | TYPE (1) | fields ... | extras tag (1) | extras |
+
+Since version 2 the header is followed by a request id, which replies carry
+over from their request, so a client can match out of order responses on a
+multiplexed connection::
+
+    | MAGIC (1) | VERSION (1) | TYPE (1) | RID (4) | fields ... |
+
+A request id of 0 means the message has none, otherwise it is decoded into
+the ``rid`` key of the message.
+
+Every schema field is preceded by a tag byte, marking it as absent, None or
+present. Messages pickled by clients speaking the legacy protocol start with
+the pickle protocol opcode instead of the magic byte and are decoded with
+cloudpickle, their version is reported as ``LEGACY``.
+"""
+
+import math
+import pickle
+import struct
+import sys
+
+from pyspark import cloudpickle
+
+MAGIC = 0x4D
+LEGACY = 0
+VERSION = 2
+# first version with request ids in the header
+RID_VERSION = 2
+
+# first byte of pickles with protocol 2 or higher
+_PICKLE_PROTO = 0x80
+
+_HEADER = struct.Struct(">BBB")
+_RID = struct.Struct(">I")
+_I32 = struct.Struct(">i")
+_U32 = struct.Struct(">I")
+_F64 = struct.Struct(">d")
+_METRIC = struct.Struct(">Bdd")
+_METRIC_BATCH = struct.Struct(">BII")
+
+_ABSENT = 0
+_NONE = 1
+_VALUE = 2
+
+_EXTRAS_NONE = 0
+_EXTRAS_PICKLE = 1
+_EXTRAS_CLOUDPICKLE = 2
+
+# first byte of an encoded metric sample or batch
+_SAMPLE_NONE = 0
+_SAMPLE_FLOAT = 1
+_SAMPLE_INT = 2
+_SAMPLE_BATCH = 3
+
+_TRIAL_ID_HEX = 1
+_TRIAL_ID_STR = 2
+
+# message type names by code, code 0 is reserved for unknown types
+TYPES = [
+    None,
+    "REG",
+    "QUERY",
+    "METRIC",
+    "FINAL",
+    "GET",
+    "LOG",
+    "OK",
+    "STOP",
+    "GSTOP",
+    "TRIAL",
+    "ERR",
+    "CHALLENGE",
+    "AUTH",
+]
+_TYPE_CODES = {name: code for code, name in enumerate(TYPES) if name is not None}
+
+_REQUEST = [("partition_id", "i32"), ("secret", "str")]
+
+# struct-packed fields per message type, in encoding order
+SCHEMAS = {
+    "REG": _REQUEST,
+    "QUERY": _REQUEST + [("data", "bool")],
+    "METRIC": _REQUEST + [("trial_id", "tid"), ("logs", "str"), ("data", "metric")],
+    "FINAL": _REQUEST + [("trial_id", "tid"), ("logs", "str"), ("data", "f64")],
+    "GET": _REQUEST + [("trial_id", "tid"), ("data", "f64")],
+    "LOG": _REQUEST,
+    "OK": [("hb_interval", "f64")],
+    "STOP": [("hb_interval", "f64")],
+    "GSTOP": [],
+    "TRIAL": [("trial_id", "tid")],
+    "ERR": [],
+    "CHALLENGE": [("data", "bytes")],
+    "AUTH": [("data", "bytes")],
+}
+
+
+def _encode_i32(value, out):
+    if type(value) is not int:
+        return False
+    try:
+        out.append(_I32.pack(value))
+    except struct.error:
+        return False
+    return True
+
+
+def _decode_i32(data, offset):
+    return _I32.unpack_from(data, offset)[0], offset + 4
+
+
+def _encode_str(value, out):
+    if type(value) is not str:
+        return False
+    encoded = value.encode("utf-8")
+    out.append(_U32.pack(len(encoded)))
+    out.append(encoded)
+    return True
+
+
+def _decode_str(data, offset):
+    length = _U32.unpack_from(data, offset)[0]
+    offset += 4
+    return str(data[offset : offset + length], "utf-8"), offset + length
+
+
+def _encode_bytes(value, out):
+    if type(value) is not bytes:
+        return False
+    out.append(_U32.pack(len(value)))
+    out.append(value)
+    return True
+
+
+def _decode_bytes(data, offset):
+    length = _U32.unpack_from(data, offset)[0]
+    offset += 4
+    return bytes(data[offset : offset + length]), offset + length
+
+
+def _encode_bool(value, out):
+    if type(value) is not bool:
+        return False
+    out.append(b"\x01" if value else b"\x00")
+    return True
+
+
+def _decode_bool(data, offset):
+    return data[offset] == 1, offset + 1
+
+
+def _encode_f64(value, out):
+    # numpy scalars are pickled to preserve their type
+    if type(value) is not float and type(value) is not int:
+        return False
+    if type(value) is int and abs(value) > 2 ** 53:
+        return False
+    # ints are restored as ints
+    out.append(b"\x01" if type(value) is int else b"\x00")
+    out.append(_F64.pack(value))
+    return True
+
+
+def _decode_f64(data, offset):
+    value = _F64.unpack_from(data, offset + 1)[0]
+    if data[offset] == 1:
+        value = int(value)
+    return value, offset + 9
+
+
+def _encode_tid(value, out):
+    """Trial ids are 16 character hex digests, which pack into 8 bytes."""
+    if type(value) is not str:
+        return False
+    if len(value) == 16:
+        try:
+            packed = bytes.fromhex(value)
+        except ValueError:
+            packed = None
+        if packed is not None and packed.hex() == value:
+            out.append(bytes([_TRIAL_ID_HEX]))
+            out.append(packed)
+            return True
+    out.append(bytes([_TRIAL_ID_STR]))
+    return _encode_str(value, out)
+
+
+def _decode_tid(data, offset):
+    if data[offset] == _TRIAL_ID_HEX:
+        value = bytes(data[offset + 1 : offset + 9]).hex()
+        offset += 9
+    else:
+        value, offset = _decode_str(data, offset + 1)
+    # intern trial ids, the driver sees the same ids over and over
+    return sys.intern(value), offset
+
+
+def _pack_sample(metric, step):
+    """Packs a metric and its step as float64 pair, or returns None if they
+    don't fit."""
+    if metric is not None and type(metric) is not float and type(metric) is not int:
+        return None
+    if type(step) is not int or abs(step) > 2 ** 53:
+        return None
+    if metric is None:
+        return _METRIC.pack(_SAMPLE_NONE, math.nan, step)
+    # remember int metrics to restore them as ints
+    flag = _SAMPLE_FLOAT if type(metric) is float else _SAMPLE_INT
+    return _METRIC.pack(flag, metric, step)
+
+
+def _unpack_sample(data, offset):
+    flag, metric, step = _METRIC.unpack_from(data, offset)
+    if flag == _SAMPLE_NONE:
+        metric = None
+    elif flag == _SAMPLE_INT:
+        metric = int(metric)
+    return metric, int(step)
+
+
+def _encode_metric(value, out):
+    """Encodes the metric data sent with heartbeats, either a single
+    ``{"value": metric, "step": step}`` sample or a batch
+    ``{"batch": [(step, metric), ...], "dropped": n}``, as float64
+    metric/step pairs.
+    """
+    if type(value) is not dict or len(value) != 2:
+        return False
+    if "batch" in value:
+        batch = value["batch"]
+        dropped = value.get("dropped")
+        if type(batch) is not list or type(dropped) is not int:
+            return False
+        if not 0 <= dropped < 2 ** 32:
+            return False
+        samples = []
+        for sample in batch:
+            if type(sample) is not tuple or len(sample) != 2:
+                return False
+            packed = _pack_sample(sample[1], sample[0])
+            if packed is None:
+                return False
+            samples.append(packed)
+        out.append(_METRIC_BATCH.pack(_SAMPLE_BATCH, dropped, len(samples)))
+        out.extend(samples)
+        return True
+    packed = _pack_sample(value.get("value"), value.get("step"))
+    if packed is None:
+        return False
+    out.append(packed)
+    return True
+
+
+def _decode_metric(data, offset):
+    if data[offset] == _SAMPLE_BATCH:
+        _, dropped, count = _METRIC_BATCH.unpack_from(data, offset)
+        offset += _METRIC_BATCH.size
+        batch = []
+        for _ in range(count):
+            metric, step = _unpack_sample(data, offset)
+            batch.append((step, metric))
+            offset += _METRIC.size
+        return {"batch": batch, "dropped": dropped}, offset
+    metric, step = _unpack_sample(data, offset)
+    return {"value": metric, "step": step}, offset + _METRIC.size
+
+
+_ENCODERS = {
+    "i32": _encode_i32,
+    "str": _encode_str,
+    "bytes": _encode_bytes,
+    "bool": _encode_bool,
+    "f64": _encode_f64,
+    "tid": _encode_tid,
+    "metric": _encode_metric,
+}
+
+_DECODERS = {
+    "i32": _decode_i32,
+    "str": _decode_str,
+    "bytes": _decode_bytes,
+    "bool": _decode_bool,
+    "f64": _decode_f64,
+    "tid": _decode_tid,
+    "metric": _decode_metric,
+}
+
+
+def _dump_extras(extras):
+    """Pickles the fields that are not part of the schema, cloudpickle is
+    only used if they contain code that plain pickle can't serialize.
+    """
+    try:
+        return _EXTRAS_PICKLE, pickle.dumps(extras, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return _EXTRAS_CLOUDPICKLE, cloudpickle.dumps(extras)
+
+
+# schemas with resolved encoder and decoder functions
+_COMPILED = {
+    name: [(key, _ENCODERS[kind], _DECODERS[kind]) for key, kind in schema]
+    for name, schema in SCHEMAS.items()
+}
+
+_MISSING = object()
+
+
+def dumps(msg, version=VERSION):
+    """Serializes a message dictionary with the given protocol ``version``.
+
+    :param msg: The message, containing at least a ``type`` key.
+    :type msg: dict
+    :param version: Protocol version, ``LEGACY`` to pickle the whole message.
+    :type version: int
+    :return: The serialized message.
+    :rtype: bytes
+    """
+    if version == LEGACY:
+        return cloudpickle.dumps(msg)
+
+    msg_type = msg.get("type")
+    code = _TYPE_CODES.get(msg_type, 0)
+    out = [_HEADER.pack(MAGIC, version, code)]
+    if code == 0:
+        schema = []
+        # keys that are encoded by the schema, the type is part of the header
+        encoded = set()
+    else:
+        schema = _COMPILED[msg_type]
+        encoded = {"type"}
+
+    if version >= RID_VERSION:
+        rid = msg.get("rid")
+        if type(rid) is int and 0 < rid < 2 ** 32:
+            out.append(_RID.pack(rid))
+            encoded.add("rid")
+        else:
+            out.append(_RID.pack(0))
+
+    for key, encoder, _ in schema:
+        value = msg.get(key, _MISSING)
+        if value is _MISSING:
+            out.append(b"\x00")
+        elif value is None:
+            out.append(b"\x01")
+            encoded.add(key)
+        else:
+            tag_index = len(out)
+            out.append(b"\x02")
+            if encoder(value, out):
+                encoded.add(key)
+            else:
+                # value does not fit the schema, send it with the extras
+                del out[tag_index:]
+                out.append(b"\x00")
+
+    if len(encoded) < len(msg):
+        extras = {k: v for k, v in msg.items() if k not in encoded}
+        tag, payload = _dump_extras(extras)
+        out.append(bytes([tag]))
+        out.append(payload)
+    else:
+        out.append(b"\x00")
+
+    return b"".join(out)
+
+
+def loads(data):
+    """Deserializes a message produced by ``dumps`` with any protocol version.
+
+    :param data: The serialized message.
+    :type data: bytes-like
+    :raises ValueError: The data is neither a legacy nor a binary message.
+    :return: The message dictionary and the protocol version it was sent with.
+    :rtype: tuple
+    """
+    if data[0] == _PICKLE_PROTO:
+        return cloudpickle.loads(data), LEGACY
+    if len(data) < _HEADER.size:
+        raise ValueError("Message too short: {} bytes".format(len(data)))
+    magic, version, code = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version > VERSION:
+        raise ValueError(
+            "Unknown message format (magic {}, version {})".format(magic, version)
+        )
+
+    msg = {}
+    offset = _HEADER.size
+    if version >= RID_VERSION:
+        rid = _RID.unpack_from(data, offset)[0]
+        offset += _RID.size
+        if rid != 0:
+            msg["rid"] = rid
+    if code != 0:
+        msg_type = TYPES[code]
+        msg["type"] = msg_type
+        for key, _, decoder in _COMPILED[msg_type]:
+            tag = data[offset]
+            offset += 1
+            if tag == _VALUE:
+                msg[key], offset = decoder(data, offset)
+            elif tag == _NONE:
+                msg[key] = None
+
+    tag = data[offset]
+    if tag == _EXTRAS_PICKLE:
+        msg.update(pickle.loads(data[offset + 1 :]))
+    elif tag == _EXTRAS_CLOUDPICKLE:
+        msg.update(cloudpickle.loads(data[offset + 1 :]))
+
+    return msg, version
@@ -21,19 +21,30 @@ maggy.
 import queue
 import threading
 import json
+import math
 import os
 import secrets
 import time
+from collections import deque
 from datetime import datetime
 
 from hops import constants as hopsconstants
-from hops import hdfs as hopshdfs
-from hops import util as hopsutil
 from hops.experiment_impl.util import experiment_utils
 
 from maggy import util
 from maggy.optimizer import AbstractOptimizer, RandomSearch, Asha, SingleRun
-from maggy.core import rpc
+from maggy.core import rpc, storage
+from maggy.core.backends import SparkBackend
+from maggy.core.journal import Journal
+from maggy.core.logbuffer import LogBuffer
+from maggy.core.logwriter import AsyncLogWriter
+from maggy.core.metrics import MetricsRegistry, MetricsServer
+from maggy.core.parking import IdleParking
+from maggy.core.persistence import PersistencePipeline
+from maggy.core.resultcache import ResultCache
+from maggy.core.statistics import RunningStatistics
+from maggy.core.timeline import Timeline
+from maggy.core.utilization import Utilization
 from maggy.trial import Trial
 from maggy.earlystop import AbstractEarlyStop, MedianStoppingRule, NoStoppingRule
 from maggy.searchspace import Searchspace
@@ -48,6 +59,26 @@ driver_secret = None
 class ExperimentDriver(object):
 
     SECRET_BYTES = 8
+    # seconds after which a parked idle executor is retried, if no trial
+    # finalized in the meantime
+    IDLE_RETRY_INTERVAL = 1.0
+    # share of the worker thread's time the heartbeats of all executors may
+    # take up, when the heartbeat interval is adapted to the load
+    HB_TARGET_LOAD = 0.5
+    # seconds over which the aggregate heartbeat rate is measured
+    HB_RATE_WINDOW = 10.0
+    # executor logs kept for sparkmagic, older logs are dropped if nobody
+    # polls them
+    MAX_EXECUTOR_LOG_BYTES = 1024 * 1024
+    # maximum number of concurrent writes of trial snapshots and results
+    PERSISTENCE_WORKERS = 4
+    # a running trial is a straggler if it runs longer than the median trial
+    # and reports steps at less than this share of the median step rate
+    STRAGGLER_RATE = 0.5
+    # seconds between two checks for stragglers while executors are idle
+    SPECULATION_INTERVAL = 1.0
+    # suffix of the trial id of a speculative copy of a straggler
+    SPECULATIVE_SUFFIX = "-s1"
 
     # @Moritz:
     # for now, we infer the experiment type (an optimization experiment or an ablation study)
@@ -66,15 +97,97 @@ class ExperimentDriver(object):
         self._final_store = []
         self._trial_store = {}
         self.num_executors = kwargs.get("num_executors")
+        # trials running at the same time on each executor, every trial slot
+        # registers and is scheduled like an executor of its own
+        self.trials_per_executor = kwargs.get("trials_per_executor", 1)
+        if (
+            not isinstance(self.trials_per_executor, int)
+            or self.trials_per_executor < 1
+        ):
+            raise Exception(
+                "The experiment's trials per executor should be a positive integer, "
+                "but it is {0} (of type '{1}').".format(
+                    str(self.trials_per_executor),
+                    type(self.trials_per_executor).__name__,
+                )
+            )
+        # hash function of the ids of trials created from now on
+        Trial.set_id_scheme(kwargs.get("trial_id_scheme", "md5"))
+        # points of the learning curve kept per trial, None for all
+        self.max_metric_history = kwargs.get("max_metric_history")
+        if self.max_metric_history is not None and (
+            not isinstance(self.max_metric_history, int) or self.max_metric_history < 2
+        ):
+            raise Exception(
+                "The experiment's maximum metric history should be an integer "
+                "of at least 2, but it is {0} (of type '{1}').".format(
+                    str(self.max_metric_history),
+                    type(self.max_metric_history).__name__,
+                )
+            )
         self._message_q = queue.Queue()
         self.name = kwargs.get("name")
         self.experiment_done = False
         self.worker_done = False
+        # executors the optimizer has no trial for at the moment
+        self._idle = IdleParking(ExperimentDriver.IDLE_RETRY_INTERVAL)
+        # number of times the worker loop woke up, useful to verify that the
+        # driver does not consume cpu while waiting
+        self.worker_wakeups = 0
+        # metrics the executors dropped because their buffer was full
+        self.dropped_metrics = 0
+        # statistics of the final metrics, optionally with the list of all
+        self.stats = RunningStatistics(kwargs.get("export_metric_list", False))
         self.hb_interval = kwargs.get("hb_interval")
+        # bounds of the heartbeat interval suggested to the executors, the
+        # interval is fixed if they are equal
+        self.hb_interval_min = kwargs.get("hb_interval_min") or self.hb_interval
+        self.hb_interval_max = kwargs.get("hb_interval_max") or self.hb_interval
+        if self.hb_interval_min > self.hb_interval_max:
+            raise Exception(
+                "The experiment's minimum heartbeat interval ({0}) should not be "
+                "greater than its maximum heartbeat interval ({1}).".format(
+                    self.hb_interval_min, self.hb_interval_max
+                )
+            )
+        # moving average of the seconds the worker thread takes per message
+        self.msg_latency = 0.0
+        # heartbeats received in total and the aggregate heartbeat rate of
+        # all executors in messages per second, measured over HB_RATE_WINDOW
+        self.hb_count = 0
+        self.hb_rate = 0.0
+        self._hb_window = (time.time(), 0)
         self.description = kwargs.get("description")
         self.experiment_type = experiment_type
         self.es_interval = kwargs.get("es_interval")
         self.es_min = kwargs.get("es_min")
+        # continue the experiment recorded in the journal of log_dir
+        self.resume = kwargs.get("resume", False)
+        # unfinished trials of a resumed experiment, dispatched before asking
+        # the optimizer for new ones
+        self._redispatch = deque()
+        # run speculative copies of straggler trials on idle executors
+        self.speculation = kwargs.get("speculation", False)
+        # speculative copies by trial id, mapped to their original trial
+        self._speculative = {}
+        # ids of the runs that lost against their speculative copy or
+        # original, their final metric is discarded
+        self._cancelled = set()
+        # the optimizer has no more trials, executors are kept for
+        # speculative copies until all trials are finalized
+        self._no_more_trials = False
+        self._speculation_check = 0
+        self.speculative_launches = 0
+        self.speculative_wins = 0
+        # step rates and durations in seconds of the finalized trials, to
+        # detect stragglers
+        self._step_rates = RunningStatistics()
+        self._run_times = RunningStatistics()
+        # number of trials queued per executor ahead of its current trial, if
+        # the optimizer supports prefetching
+        self.prefetch_depth = kwargs.get("prefetch_depth", 1)
+        # executors that continued with a prefetched trial right away
+        self.prefetch_hits = 0
 
         # TYPE-SPECIFIC EXPERIMENT SETUP
         if self.experiment_type == "optimization":
@@ -207,8 +320,10 @@ class ExperimentDriver(object):
                 if ablator.lower() == "loco":
                     self.ablator = LOCO(ablation_study, self._final_store)
                     self.num_trials = self.ablator.get_number_of_trials()
-                    if self.num_executors > self.num_trials:
-                        self.num_executors = self.num_trials
+                    if self.num_executors * self.trials_per_executor > self.num_trials:
+                        self.num_executors = int(
+                            math.ceil(self.num_trials / self.trials_per_executor)
+                        )
                 else:
                     raise Exception(
                         "The experiment's ablation study policy should either be a string ('loco') "
@@ -230,6 +345,9 @@ class ExperimentDriver(object):
                 )
 
             self.result = {"best_val": "n.a.", "num_trials": 0, "early_stopped": "n.a"}
+
+            if self.resume:
+                raise Exception("Ablation experiments can't be resumed.")
         else:
             raise Exception(
                 "Unknown experiment type. experiment_type should be either 'optimization' or 'ablation', "
@@ -237,27 +355,129 @@ class ExperimentDriver(object):
             )
 
         # FINALIZE EXPERIMENT SETUP
-        self.server = rpc.Server(self.num_executors)
+        self.num_slots = self.num_executors * self.trials_per_executor
+        server_engine = kwargs.get("server_engine", "select")
+        if server_engine == "select":
+            self.server = rpc.Server(self.num_slots)
+        elif server_engine == "asyncio":
+            self.server = rpc.AsyncServer(self.num_slots)
+        else:
+            raise Exception(
+                "The experiment's server engine should be either 'select' or 'asyncio', "
+                "but it is {0} (of type '{1}').".format(
+                    str(server_engine), type(server_engine).__name__
+                )
+            )
         if not driver_secret:
             driver_secret = self._generate_secret(ExperimentDriver.SECRET_BYTES)
         self._secret = driver_secret
         self.job_start = datetime.now()
-        self.executor_logs = ""
+        # executor logs buffered until sparkmagic polls them
+        self.executor_logs = LogBuffer(ExperimentDriver.MAX_EXECUTOR_LOG_BYTES)
         self.maggy_log = ""
         self.log_lock = threading.RLock()
         self.log_file = kwargs.get("log_dir") + "/maggy.log"
         self.log_dir = kwargs.get("log_dir")
+        # spark or local execution of the trial executors
+        self.backend = kwargs.get("backend") or SparkBackend()
         self.exception = None
 
         # Open File desc for HDFS to log
-        if not hopshdfs.exists(self.log_file):
-            hopshdfs.dump("", self.log_file)
-        self.fd = hopshdfs.open_file(self.log_file, flags="w")
+        if not storage.exists(self.log_file):
+            storage.dump("", self.log_file)
+        self.fd = storage.open_file(self.log_file, flags="w")
+        # writes to HDFS happen in the background, to not stall scheduling
+        self.log_writer = AsyncLogWriter(self.fd)
+        # writes trial snapshots and results in the background
+        self.persistence = PersistencePipeline(
+            storage.dump, ExperimentDriver.PERSISTENCE_WORKERS
+        )
+        # scheduling events to resume the experiment after a crash, written
+        # by a single thread to keep the journal files in order
+        self.journal_writer = PersistencePipeline(storage.dump, 1)
+        self.journal = Journal(self.log_dir + "/journal", self.journal_writer)
+        # spans of the scheduling lifecycle per executor, exported at the end
+        self.timeline = Timeline()
+        # time since which each executor waits for its next trial, and the
+        # seconds it was parked idle in the meantime
+        self._wait_since = {}
+        self._idle_in_wait = {}
+        # seconds the executors were busy, idle etc.
+        self.utilization = Utilization()
+        # results of earlier experiments, trials found in it are not run
+        self.result_cache = None
+        if kwargs.get("result_cache"):
+            self.result_cache = ResultCache(
+                kwargs.get("result_cache"),
+                kwargs.get("cache_fingerprint"),
+                max_entries=kwargs.get("result_cache_size", 10000),
+                ttl=kwargs.get("result_cache_ttl"),
+            )
+        # metrics in the Prometheus text format, served on `metrics_port`
+        self.metrics_port = kwargs.get("metrics_port")
+        self._metrics_server = None
+        self._register_metrics()
+
+    def _register_metrics(self):
+        self.metrics = MetricsRegistry()
+        self.message_count = self.metrics.counter(
+            "maggy_messages_total", "Messages handled by the driver server by type."
+        )
+        self.message_latency = self.metrics.histogram(
+            "maggy_message_handler_seconds",
+            "Seconds the driver server takes to handle a message by type.",
+        )
+        self.early_stop_count = self.metrics.counter(
+            "maggy_early_stops_total", "Trials stopped by the early stopping rule."
+        )
+        self.metrics.gauge(
+            "maggy_message_queue_depth",
+            "Messages waiting for the driver worker thread.",
+            self._message_q.qsize,
+        )
+        self.metrics.gauge("maggy_trials", "Trials by status.", self._trials_by_status)
+        self.metrics.gauge(
+            "maggy_executor_idle_seconds",
+            "Seconds executors spent parked without a trial.",
+            lambda: {
+                (("partition", str(partition_id)),): seconds
+                for partition_id, seconds in list(self._idle.parked_time.items())
+            },
+        )
+        self.metrics.gauge(
+            "maggy_persistence_pending",
+            "Writes queued or running in the persistence pipeline.",
+            lambda: self.persistence.pending + self.journal_writer.pending,
+        )
+        self.metrics.gauge(
+            "maggy_persistence_lag_seconds",
+            "Seconds the oldest pending write has been waiting.",
+            lambda: max(self.persistence.lag(), self.journal_writer.lag()),
+        )
+
+    def _trials_by_status(self):
+        """Counts the trials by status, called by the metrics endpoint."""
+        counts = dict.fromkeys(
+            [Trial.PENDING, Trial.SCHEDULED, Trial.RUNNING, Trial.ERROR], 0
+        )
+        for trial in list(self._trial_store.values()):
+            counts[trial.status] = counts.get(trial.status, 0) + 1
+        counts[Trial.FINALIZED] = len(self._final_store)
+        return {(("status", status),): count for status, count in counts.items()}
 
     def init(self, job_start):
 
         self.server_addr = self.server.start(self)
 
+        if self.metrics_port is not None:
+            self._metrics_server = MetricsServer(self.metrics, port=self.metrics_port)
+            port = self._metrics_server.start()
+            self._log(
+                "Metrics endpoint: http://{}:{}/metrics".format(
+                    self.server_addr[0], port
+                )
+            )
+
         self.job_start = job_start
 
         if self.experiment_type == "optimization":
@@ -268,6 +488,8 @@ class ExperimentDriver(object):
             self.optimizer.final_store = self._final_store
             self.optimizer.direction = self.direction
             self.optimizer.initialize()
+            if self.resume:
+                self._resume()
         elif self.experiment_type == "ablation":
             self.ablator.initialize()
 
@@ -347,16 +569,99 @@ class ExperimentDriver(object):
                 + "\n"
             )
 
+        self._account_end(job_end)
+        wall_time = job_end - self.job_start
+        self.result["utilization"] = self.utilization.to_dict(wall_time, self.num_slots)
+        results += (
+            "EXECUTOR time -- "
+            + self.utilization.describe(wall_time, self.num_slots)
+            + "\n"
+        )
+
+        if self.prefetch_hits > 0:
+            self.result["prefetch_hits"] = self.prefetch_hits
+            self._log("Trials started from prefetch: {}".format(self.prefetch_hits))
+        if self.speculative_launches > 0:
+            self.result["speculative_launches"] = self.speculative_launches
+            self.result["speculative_wins"] = self.speculative_wins
+            self._log(
+                "Speculative copies: {} launched, {} won".format(
+                    self.speculative_launches, self.speculative_wins
+                )
+            )
+        if self.result_cache is not None:
+            self.result["cache_hits"] = self.result_cache.hits
+            self.result["cache_misses"] = self.result_cache.misses
+            self._log(
+                "Result cache: {} hits, {} misses".format(
+                    self.result_cache.hits, self.result_cache.misses
+                )
+            )
+            self.persistence.submit(self.result_cache.dumps(), self.result_cache.path)
+
         print(results)
 
         self._log(results)
+        self._log("Worker loop wakeups: {}".format(self.worker_wakeups))
+        if self.server.gap_count > 0:
+            self.result["avg_trial_gap"] = self.server.gap_total / self.server.gap_count
+            self.result["max_trial_gap"] = self.server.gap_max
+            self._log(
+                "Trial-to-trial gap: avg {:.3f}s, max {:.3f}s".format(
+                    self.result["avg_trial_gap"], self.result["max_trial_gap"]
+                )
+            )
+        if self._idle.parked_time:
+            self.result["idle_time"] = self._idle.parked_time
+            self._log("Seconds parked idle: {}".format(self._idle.parked_time))
+        if self.hb_count > 0:
+            self.result["hb_rate"] = self.hb_count / (job_end - self.job_start)
+            self._log(
+                "Heartbeats: {}, avg {:.2f}/s, last {:.2f}/s".format(
+                    self.hb_count, self.result["hb_rate"], self.hb_rate
+                )
+            )
+        if self.executor_logs.dropped_chunks > 0:
+            self._log(
+                "Dropped executor logs: {} chunks, {} bytes".format(
+                    self.executor_logs.dropped_chunks, self.executor_logs.dropped_bytes
+                )
+            )
+        self._log(
+            "Log writer: queue depth {}, write latency avg {:.3f}s, "
+            "max {:.3f}s".format(
+                self.log_writer.queue_depth,
+                self.log_writer.write_latency,
+                self.log_writer.max_write_latency,
+            )
+        )
+        if self.dropped_metrics > 0:
+            self.result["dropped_metrics"] = self.dropped_metrics
+            self._log("Dropped metrics: {}".format(self.dropped_metrics))
 
-        hopshdfs.dump(
+        self.persistence.submit(
             json.dumps(self.result, default=util.json_default_numpy),
             self.log_dir + "/result.json",
         )
-        sc = hopsutil._find_spark().sparkContext
-        hopshdfs.dump(self.json(sc), self.log_dir + "/maggy.json")
+        self.persistence.submit(self.json(), self.log_dir + "/maggy.json")
+        self.persistence.submit(
+            self.timeline.dumps(self.name or "maggy"), self.log_dir + "/timeline.json"
+        )
+
+        # replaces the journal segments with a single snapshot
+        self.journal.compact()
+
+        # wait until all trials, results and journal files are written
+        self.persistence.flush()
+        self.journal_writer.flush()
+        self._log(
+            "Persisted artifacts: {} written, {} retries".format(
+                self.persistence.written + self.journal_writer.written,
+                self.persistence.retries + self.journal_writer.retries,
+            )
+        )
+        for path, exc in self.persistence.failed + self.journal_writer.failed:
+            self._log("ERROR: failed to write {}: {}".format(path, exc))
 
         return self.result
 
@@ -364,11 +669,337 @@ class ExperimentDriver(object):
         return self._trial_store[trial_id]
 
     def add_trial(self, trial):
+        trial.max_history = self.max_metric_history
         self._trial_store[trial.trial_id] = trial
 
     def add_message(self, msg):
         self._message_q.put(msg)
 
+    def suggest_hb_interval(self):
+        """Suggests the heartbeat interval to the executors, based on the load
+        of the worker thread. Called by the server thread.
+
+        The interval is chosen such that the heartbeats of all executors keep
+        the worker thread busy ``HB_TARGET_LOAD`` of the time, and it grows
+        while messages queue up.
+        """
+        interval = self.num_slots * self.msg_latency / ExperimentDriver.HB_TARGET_LOAD
+        interval *= 1 + self._message_q.qsize() / self.num_slots
+        return min(self.hb_interval_max, max(self.hb_interval_min, interval))
+
+    def _count_heartbeat(self):
+        """Counts a heartbeat and updates the aggregate heartbeat rate once per
+        ``HB_RATE_WINDOW``."""
+        now = time.time()
+        self.hb_count += 1
+        window_start, count = self._hb_window
+        count += 1
+        if now - window_start >= ExperimentDriver.HB_RATE_WINDOW:
+            self.hb_rate = count / (now - window_start)
+            self._hb_window = (now, 0)
+        else:
+            self._hb_window = (window_start, count)
+
+    def _resume(self):
+        """Restores the trials recorded in the journal. Finalized trials are
+        added to the results, unfinished ones are run again from scratch."""
+        trials, final_order = self.journal.load()
+        self.optimizer.restore(list(trials.values()))
+        for trial_id in final_order:
+            trial = trials[trial_id]
+            self._final_store.append(trial)
+            self._update_result(trial)
+        for trial in trials.values():
+            if trial.status != Trial.FINALIZED:
+                trial.status = Trial.PENDING
+                trial.early_stop = False
+                trial.clear_metrics()
+                self.journal.requeued(trial.trial_id)
+                self._redispatch.append(trial)
+        if final_order:
+            self.maggy_log = self._update_maggy_log()
+        self._log(
+            "Resumed experiment: {} trials finalized, {} to run again".format(
+                len(final_order), len(self._redispatch)
+            )
+        )
+
+    def _get_suggestion(self, trial=None, prefetch=False):
+        """Returns the next trial to schedule, unfinished trials of a resumed
+        experiment first, and records new trials in the journal."""
+        if self._redispatch:
+            return self._redispatch.popleft()
+        if self._no_more_trials:
+            return None
+        if prefetch:
+            trial = self.optimizer.prefetch()
+        elif self.experiment_type == "optimization":
+            trial = self.optimizer.get_suggestion(trial)
+        elif self.experiment_type == "ablation":
+            trial = self.ablator.get_trial(trial)
+        if isinstance(trial, Trial):
+            self.journal.created(trial)
+        return trial
+
+    def _next_trial(self, trial=None, prefetch=False):
+        """Returns the next trial to dispatch. Trials with a cached result
+        are finalized right away instead."""
+        trial = self._get_suggestion(trial, prefetch)
+        while self.result_cache is not None and isinstance(trial, Trial):
+            cached = self.result_cache.get(trial.trial_id)
+            if cached is None:
+                break
+            with trial.lock:
+                trial.status = Trial.FINALIZED
+                trial.final_metric = cached["final_metric"]
+                trial.duration = cached["duration"]
+                trial.append_metrics(
+                    zip(cached["step_history"], cached["metric_history"])
+                )
+            self._finalize_trial(trial)
+            trial = self._get_suggestion(trial, prefetch)
+        if prefetch:
+            return trial if isinstance(trial, Trial) else None
+        if trial is None or trial == "IDLE":
+            # take over a trial queued for a busy executor
+            stolen = self.server.reservations.steal_prefetched()
+            if stolen is not None:
+                return self.get_trial(stolen)
+        if trial is None and self.speculation and self._unfinished():
+            # keep the executor for speculative copies of stragglers
+            self._no_more_trials = True
+            return "IDLE"
+        return trial
+
+    def _schedule_next(self, partition_id, trial=None):
+        """Schedules the next trial on the executor with ``partition_id``,
+        which finished ``trial``."""
+        trial = self._next_trial(trial)
+        if trial is None:
+            self.server.reservations.assign_trial(partition_id, None)
+            self.experiment_done = True
+        elif trial == "IDLE":
+            self._idle.park(partition_id)
+            self.server.reservations.assign_trial(partition_id, None)
+        else:
+            self._assign_trial(partition_id, trial)
+
+    def _unfinished(self):
+        """Returns True if trials are running, apart from cancelled runs."""
+        return any(trial_id not in self._cancelled for trial_id in self._trial_store)
+
+    def _resolve_run(self, trial_id):
+        """Removes the run with ``trial_id``, which sent its final metric,
+        from the running trials. If the run has a speculative copy or is
+        one, the first to finish wins and the other one is stopped.
+
+        :return: The trial to finalize, or None if the run lost.
+        :rtype: Trial
+        """
+        run = self._trial_store.pop(trial_id)
+        if trial_id in self._cancelled:
+            self._cancelled.discard(trial_id)
+            return None
+
+        if self.speculation and not run.early_stop:
+            run_time = time.time() - run.start
+            self._run_times.update(run_time)
+            self._step_rates.update(run.num_steps / max(run_time, 1e-6))
+
+        original = self._speculative.pop(trial_id, None)
+        if original is not None:
+            # the speculative copy won, it finalizes the original trial. The
+            # original run is stopped through an object of its own, which
+            # keeps its start for the timeline
+            self.speculative_wins += 1
+            attempt = Trial(original.params, trial_type=original.trial_type)
+            with original.lock:
+                attempt.trial_id = original.trial_id
+                attempt.start = original.start
+                attempt.status = original.status
+                attempt.max_history = original.max_history
+                original.copy_metrics(run)
+                original.early_stop = run.early_stop
+            self._cancel(attempt.trial_id, attempt)
+            return original
+
+        copy_id = trial_id + ExperimentDriver.SPECULATIVE_SUFFIX
+        if self._speculative.pop(copy_id, None) is not None:
+            self._cancel(copy_id, self._trial_store[copy_id])
+        return run
+
+    def _cancel(self, trial_id, run):
+        """Stops the run with ``trial_id`` through its early stopping flag.
+        ``run`` is looked up for the flag until its final metric arrives."""
+        run.set_early_stop()
+        self._trial_store[trial_id] = run
+        self._cancelled.add(trial_id)
+
+    def _speculate(self):
+        """Launches speculative copies of straggler trials on parked
+        executors."""
+        now = time.time()
+        if (
+            now - self._speculation_check < ExperimentDriver.SPECULATION_INTERVAL
+            or self._run_times.count == 0
+        ):
+            return
+        self._speculation_check = now
+
+        median_run_time = self._run_times.median
+        median_rate = self._step_rates.median
+        stragglers = []
+        for trial_id, trial in self._trial_store.items():
+            if (
+                trial.status != Trial.RUNNING
+                or trial_id in self._cancelled
+                or trial_id in self._speculative
+                or trial_id + ExperimentDriver.SPECULATIVE_SUFFIX in self._speculative
+            ):
+                continue
+            run_time = now - trial.start
+            rate = trial.num_steps / max(run_time, 1e-6)
+            if median_rate > 0:
+                slow = (
+                    run_time >= median_run_time
+                    and rate < ExperimentDriver.STRAGGLER_RATE * median_rate
+                )
+            else:
+                # trials don't report steps, only their run time tells
+                slow = run_time * ExperimentDriver.STRAGGLER_RATE >= median_run_time
+            if slow:
+                stragglers.append((rate, trial.start, trial))
+
+        # slowest first
+        stragglers.sort(key=lambda s: (s[0], s[1]))
+        for partition_id, (_, _, trial) in zip(self._idle.parked(), stragglers):
+            copy = Trial(trial.params, trial_type=trial.trial_type)
+            copy.trial_id = trial.trial_id + ExperimentDriver.SPECULATIVE_SUFFIX
+            self._speculative[copy.trial_id] = trial
+            self.speculative_launches += 1
+            self._log("Speculative copy of straggler {}".format(trial.trial_id))
+            self._unpark(partition_id)
+            self._assign_trial(partition_id, copy)
+
+    def _finalize_trial(self, trial):
+        """Adds the finalized ``trial`` to the results."""
+        self._final_store.append(trial)
+        self.journal.finalized(trial)
+
+        # update result dictionary
+        self._update_result(trial)
+        # keep for later in case tqdm doesn't work
+        self.maggy_log = self._update_maggy_log()
+        self._log(self.maggy_log)
+
+        # persist a snapshot in the background
+        self.persistence.submit(
+            trial.to_json(), self.log_dir + "/" + trial.trial_id + "/trial.json"
+        )
+
+    def _assign_trial(self, partition_id, trial):
+        """Schedules ``trial`` on the executor with ``partition_id``."""
+        with trial.lock:
+            trial.start = time.time()
+            trial.status = Trial.SCHEDULED
+            # add before assigning, a waiting executor gets the trial at once
+            self.add_trial(trial)
+            self.server.reservations.assign_trial(partition_id, trial.trial_id)
+        self.journal.scheduled(trial.trial_id, partition_id)
+        self._prefetch(partition_id)
+
+    def _prefetch(self, partition_id):
+        """Queues trials for the executor with ``partition_id`` up to the
+        prefetch depth, as far as the optimizer hands them out early."""
+        if self.experiment_type != "optimization":
+            return
+        reservations = self.server.reservations
+        while reservations.num_prefetched(partition_id) < self.prefetch_depth:
+            trial = self._next_trial(prefetch=True)
+            if trial is None:
+                return
+            with trial.lock:
+                trial.status = Trial.SCHEDULED
+                self.add_trial(trial)
+                reservations.prefetch_trial(partition_id, trial.trial_id)
+            self.journal.scheduled(trial.trial_id, partition_id)
+
+    def _retry_idle(self, partition_ids):
+        """Asks the optimizer for trials for parked executors."""
+        for i, partition_id in enumerate(partition_ids):
+            trial = self._next_trial()
+            if trial == "IDLE":
+                # no work for now, renew the deadline of all remaining ones
+                for parked_id in partition_ids[i:]:
+                    self._idle.park(parked_id)
+                return
+            self._unpark(partition_id)
+            if trial is None:
+                self.server.reservations.assign_trial(partition_id, None)
+                self.experiment_done = True
+            else:
+                self._assign_trial(partition_id, trial)
+
+    def _unpark(self, partition_id):
+        """Unparks an idle executor and records its idle span."""
+        parked = self._idle.unpark(partition_id)
+        if parked is not None:
+            now = time.time()
+            self.timeline.span(partition_id, "idle", now - parked, now, "executor")
+            self.utilization.add(partition_id, "idle", parked)
+            self._idle_in_wait[partition_id] = (
+                self._idle_in_wait.get(partition_id, 0.0) + parked
+            )
+
+    def _trace_run(self, partition_id, run, end, wasted, **args):
+        """Records the span of ``run`` on the executor, preceded by the
+        executor waiting for it, and accounts for their time."""
+        start = run.start
+        wait_since = self._wait_since.pop(partition_id, None)
+        if wait_since is not None:
+            # a trial repeated after a failure keeps its original start
+            start = max(start, wait_since)
+            self.timeline.span(partition_id, "wait", wait_since, start, "executor")
+            self.utilization.add(
+                partition_id,
+                "gap",
+                start - wait_since - self._idle_in_wait.pop(partition_id, 0.0),
+            )
+        self.timeline.span(partition_id, run.trial_id, start, end, "trial", **args)
+        self.utilization.add(partition_id, "wasted" if wasted else "busy", end - start)
+        self._wait_since[partition_id] = end
+
+    def _account_end(self, job_end):
+        """Closes the waits of the executors at the end of the experiment,
+        they were idle after their last trial."""
+        for partition_id in self._idle.parked():
+            self._unpark(partition_id)
+        for partition_id, wait_since in list(self._wait_since.items()):
+            self.timeline.span(partition_id, "wait", wait_since, job_end, "executor")
+            self.utilization.add(
+                partition_id,
+                "idle",
+                job_end - wait_since - self._idle_in_wait.pop(partition_id, 0.0),
+            )
+        self._wait_since.clear()
+
+    def _next_timeout(self, time_earlystop_check):
+        """Seconds until the next deadline the worker has to wake up for, or
+        None if the worker can block until the next message arrives.
+        """
+        deadlines = []
+        idle_deadline = self._idle.next_deadline()
+        if idle_deadline is not None:
+            deadlines.append(idle_deadline)
+        if self.earlystop_check != NoStoppingRule.earlystop_check:
+            deadlines.append(time_earlystop_check + self.es_interval)
+        journal_deadline = self.journal.next_deadline()
+        if journal_deadline is not None:
+            deadlines.append(journal_deadline)
+        if not deadlines:
+            return None
+        return max(0, min(deadlines) - time.time())
+
     def _start_worker(self):
         def _target_function(self):
 
@@ -379,11 +1010,25 @@ class ExperimentDriver(object):
 
                 while not self.worker_done:
                     trial = None
-                    # get a message
+                    # get a message, block until one arrives or the next
+                    # deadline (early stopping check, idle retry) expires
                     try:
-                        msg = self._message_q.get_nowait()
+                        msg = self._message_q.get(
+                            timeout=self._next_timeout(time_earlystop_check)
+                        )
                     except queue.Empty:
                         msg = {"type": None}
+                    self.worker_wakeups += 1
+                    msg_start = time.time()
+
+                    # write buffered journal events that are due
+                    self.journal.maybe_flush(msg_start)
+
+                    # retry idle executors whose deadline expired
+                    if self.experiment_type == "optimization":
+                        self._retry_idle(self._idle.due())
+                        if self.speculation and len(self._idle) > 0:
+                            self._speculate()
 
                     if self.earlystop_check != NoStoppingRule.earlystop_check:
                         if (time.time() - time_earlystop_check) >= self.es_interval:
@@ -405,136 +1050,139 @@ class ExperimentDriver(object):
                                     self._log("Trials to stop: {}".format(to_stop))
                                 for trial_id in to_stop:
                                     self.get_trial(trial_id).set_early_stop()
+                                    self.journal.early_stopped(trial_id)
+                                    self.early_stop_count.inc()
 
                     # depending on message do the work
                     # 1. METRIC
                     if msg["type"] == "METRIC":
+                        self._count_heartbeat()
                         # append executor logs if in the message
                         logs = msg.get("logs", None)
                         if logs is not None:
                             with self.log_lock:
-                                self.executor_logs = self.executor_logs + logs
+                                self.executor_logs.append(logs)
 
                         if msg["trial_id"] is not None and msg["data"] is not None:
-                            self.get_trial(msg["trial_id"]).append_metric(msg["data"])
+                            self.get_trial(msg["trial_id"]).append_metrics(
+                                msg["data"]["batch"]
+                            )
+                            # the metrics of lost runs are not replayed
+                            if (
+                                msg["data"]["batch"]
+                                and msg["trial_id"] not in self._cancelled
+                            ):
+                                self.journal.metrics(
+                                    msg["trial_id"], msg["data"]["batch"]
+                                )
+                            self.dropped_metrics += msg["data"]["dropped"]
 
                     # 2. BLACKLIST the trial
                     elif msg["type"] == "BLACK":
-                        trial = self.get_trial(msg["trial_id"])
-                        with trial.lock:
-                            trial.status = Trial.SCHEDULED
-                            self.server.reservations.assign_trial(
-                                msg["partition_id"], msg["trial_id"]
-                            )
+                        self.timeline.instant(
+                            msg["partition_id"],
+                            "BLACK",
+                            msg_start,
+                            "executor",
+                            trial_id=msg["trial_id"],
+                        )
+                        self._trace_run(
+                            msg["partition_id"],
+                            self.get_trial(msg["trial_id"]),
+                            msg_start,
+                            True,
+                            failed=True,
+                        )
+                        if msg["trial_id"] in self._cancelled:
+                            # a lost run is not repeated
+                            self._resolve_run(msg["trial_id"])
+                            self._schedule_next(msg["partition_id"])
+                        else:
+                            trial = self.get_trial(msg["trial_id"])
+                            with trial.lock:
+                                trial.status = Trial.SCHEDULED
+                                self.server.reservations.assign_trial(
+                                    msg["partition_id"], msg["trial_id"]
+                                )
+                            self.journal.scheduled(msg["trial_id"], msg["partition_id"])
 
                     # 3. FINAL
                     elif msg["type"] == "FINAL":
-                        # set status
-                        # get trial only once
-                        trial = self.get_trial(msg["trial_id"])
-
                         logs = msg.get("logs", None)
                         if logs is not None:
                             with self.log_lock:
-                                self.executor_logs = self.executor_logs + logs
-
-                        # finalize the trial object
-                        with trial.lock:
-                            trial.status = Trial.FINALIZED
-                            trial.final_metric = msg["data"]
-                            trial.duration = experiment_utils._seconds_to_milliseconds(
-                                time.time() - trial.start
-                            )
-
-                        # move trial to the finalized ones
-                        self._final_store.append(trial)
-                        self._trial_store.pop(trial.trial_id)
-
-                        # update result dictionary
-                        self._update_result(trial)
-                        # keep for later in case tqdm doesn't work
-                        self.maggy_log = self._update_maggy_log()
-                        self._log(self.maggy_log)
-
-                        hopshdfs.dump(
-                            trial.to_json(),
-                            self.log_dir + "/" + trial.trial_id + "/trial.json",
+                                self.executor_logs.append(logs)
+
+                        run = self.get_trial(msg["trial_id"])
+                        self._trace_run(
+                            msg["partition_id"],
+                            run,
+                            msg_start,
+                            run.early_stop or msg["trial_id"] in self._cancelled,
+                            metric=msg["data"],
+                            early_stopped=run.early_stop,
                         )
 
-                        # assign new trial
-                        if self.experiment_type == "optimization":
-                            trial = self.optimizer.get_suggestion(trial)
-                        elif self.experiment_type == "ablation":
-                            trial = self.ablator.get_trial(trial)
-                        if trial is None:
-                            self.server.reservations.assign_trial(
-                                msg["partition_id"], None
-                            )
-                            self.experiment_done = True
-                        elif trial == "IDLE":
-                            self.add_message(
-                                {
-                                    "type": "IDLE",
-                                    "partition_id": msg["partition_id"],
-                                    "idle_start": time.time(),
-                                }
-                            )
-                            self.server.reservations.assign_trial(
-                                msg["partition_id"], None
-                            )
-                        else:
+                        # move trial out of the running ones, the results of
+                        # lost speculative runs are discarded
+                        trial = self._resolve_run(msg["trial_id"])
+                        if trial is not None:
+                            # finalize the trial object
                             with trial.lock:
-                                trial.start = time.time()
-                                trial.status = Trial.SCHEDULED
-                                self.server.reservations.assign_trial(
-                                    msg["partition_id"], trial.trial_id
+                                trial.status = Trial.FINALIZED
+                                trial.final_metric = msg["data"]
+                                trial.duration = experiment_utils._seconds_to_milliseconds(
+                                    time.time() - trial.start
                                 )
-                                self.add_trial(trial)
 
-                    # 4. Let executor be idle
-                    elif msg["type"] == "IDLE":
-                        # execute only every 0.1 seconds but do not block thread
+                            self._finalize_trial(trial)
+                            # early stopped trials did not produce a final result
+                            if self.result_cache is not None and not trial.early_stop:
+                                self.result_cache.put(trial)
+
+                        # assign new trial, unless the executor continued
+                        # with a prefetched one
+                        if msg.get("prefetched") is not None:
+                            self.prefetch_hits += 1
+                            self._prefetch(msg["partition_id"])
+                        else:
+                            self._schedule_next(msg["partition_id"], trial)
+
+                        # a finalized trial might unblock parked executors
                         if (
                             self.experiment_type == "optimization"
-                            and time.time() - msg["idle_start"] > 0.1
+                            and len(self._idle) > 0
                         ):
-                            trial = self.optimizer.get_suggestion()
-                            if trial is None:
-                                self.server.reservations.assign_trial(
-                                    msg["partition_id"], None
-                                )
-                                self.experiment_done = True
-                            elif trial == "IDLE":
-                                # reset timeout
-                                msg["idle_start"] = time.time()
-                                self.add_message(msg)
-                            else:
-                                with trial.lock:
-                                    trial.start = time.time()
-                                    trial.status = Trial.SCHEDULED
-                                    self.server.reservations.assign_trial(
-                                        msg["partition_id"], trial.trial_id
-                                    )
-                                    self.add_trial(trial)
-                        elif self.experiment_type == "optimization":
-                            self.add_message(msg)
+                            self._retry_idle(self._idle.parked())
 
                     # 4. REG
                     elif msg["type"] == "REG":
-                        if self.experiment_type == "optimization":
-                            trial = self.optimizer.get_suggestion()
-                        elif self.experiment_type == "ablation":
-                            trial = self.ablator.get_trial()
+                        self.timeline.instant(
+                            msg["partition_id"], "REG", msg_start, "executor"
+                        )
+                        if msg["partition_id"] not in self.utilization:
+                            self.utilization.add(
+                                msg["partition_id"],
+                                "startup",
+                                msg_start - self.job_start,
+                            )
+                        self._wait_since[msg["partition_id"]] = msg_start
+                        trial = self._next_trial()
                         if trial is None:
                             self.experiment_done = True
+                        elif trial == "IDLE":
+                            self._idle.park(msg["partition_id"])
                         else:
-                            with trial.lock:
-                                trial.start = time.time()
-                                trial.status = Trial.SCHEDULED
-                                self.server.reservations.assign_trial(
-                                    msg["partition_id"], trial.trial_id
-                                )
-                                self.add_trial(trial)
+                            self._assign_trial(msg["partition_id"], trial)
+
+                    # executors waiting for a trial are told to stop
+                    if self.experiment_done:
+                        self.server.release_gets()
+
+                    if msg["type"] is not None:
+                        self.msg_latency = 0.9 * self.msg_latency + 0.1 * (
+                            time.time() - msg_start
+                        )
             except Exception as exc:
                 # Exception can't be propagated to parent thread
                 # therefore log the exception and fail experiment
@@ -549,27 +1197,36 @@ class ExperimentDriver(object):
     def stop(self):
         """Stop the Driver's worker thread and server."""
         self.worker_done = True
+        # wake up the worker thread in case it is blocked waiting for messages
+        self.add_message({"type": None})
         self.server.stop()
-        self.fd.flush()
-        self.fd.close()
-
-    def json(self, sc):
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
+        self.persistence.close()
+        self.journal_writer.close()
+        # writes the pending log messages and closes the file
+        self.log_writer.close()
+
+    def json(self):
         """Get all relevant experiment information in JSON format.
         """
+        memory_per_executor, gpus_per_executor = self.backend.executor_resources()
         user = None
         if hopsconstants.ENV_VARIABLES.HOPSWORKS_USER_ENV_VAR in os.environ:
             user = os.environ[hopsconstants.ENV_VARIABLES.HOPSWORKS_USER_ENV_VAR]
 
         experiment_json = {
-            "project": hopshdfs.project_name(),
+            "project": storage.project_name(),
             "user": user,
             "name": self.name,
             "module": "maggy",
-            "app_id": str(sc.applicationId),
+            "app_id": self.backend.app_id(),
             "start": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.job_start)),
-            "memory_per_executor": str(sc._conf.get("spark.executor.memory")),
-            "gpus_per_executor": str(sc._conf.get("spark.executor.gpus")),
+            "memory_per_executor": memory_per_executor,
+            "gpus_per_executor": gpus_per_executor,
             "executors": self.num_executors,
+            "trials_per_executor": self.trials_per_executor,
             "logdir": self.log_dir,
             # 'versioned_resources': versioned_resources,
             "description": self.description,
@@ -617,82 +1274,43 @@ class ExperimentDriver(object):
         param_string = trial.params
         trial_id = trial.trial_id
 
-        if self.experiment_type == "optimization":
-            # First finalized trial
-            if self.result.get("best_id", None) is None:
-                self.result = {
-                    "best_id": trial_id,
-                    "best_val": metric,
-                    "best_hp": param_string,
-                    "worst_id": trial_id,
-                    "worst_val": metric,
-                    "worst_hp": param_string,
-                    "avg": metric,
-                    "metric_list": [metric],
-                    "num_trials": 1,
-                    "early_stopped": 0,
-                }
-
-                if trial.early_stop:
-                    self.result["early_stopped"] += 1
+        self.stats.update(metric, trial_id)
 
-                return
+        if self.experiment_type == "optimization":
             if self.direction == "max":
-                if metric > self.result["best_val"]:
-                    self.result["best_val"] = metric
-                    self.result["best_id"] = trial_id
-                    self.result["best_hp"] = param_string
-                if metric < self.result["worst_val"]:
-                    self.result["worst_val"] = metric
-                    self.result["worst_id"] = trial_id
-                    self.result["worst_hp"] = param_string
-            elif self.direction == "min":
-                if metric < self.result["best_val"]:
-                    self.result["best_val"] = metric
-                    self.result["best_id"] = trial_id
-                    self.result["best_hp"] = param_string
-                if metric > self.result["worst_val"]:
-                    self.result["worst_val"] = metric
-                    self.result["worst_id"] = trial_id
-                    self.result["worst_hp"] = param_string
-
+                best_id, worst_id = self.stats.max_id, self.stats.min_id
+            else:
+                best_id, worst_id = self.stats.min_id, self.stats.max_id
+            params_key = "hp"
         elif self.experiment_type == "ablation":
-
             # pop function values and trial_type from parameters, since we don't need them
             param_string.pop("dataset_function", None)
             param_string.pop("model_function", None)
-            # First finalized trial
-            if self.result.get("best_id", None) is None:
-                self.result = {
-                    "best_id": trial_id,
-                    "best_val": metric,
-                    "best_config": param_string,
-                    "worst_id": trial_id,
-                    "worst_val": metric,
-                    "worst_config": param_string,
-                    "avg": metric,
-                    "metric_list": [metric],
-                    "num_trials": 1,
-                    "early_stopped": 0,
-                }
-                return
-
             # for ablation we always consider 'max' as "the direction"
-            if metric > self.result["best_val"]:
-                self.result["best_id"] = trial_id
-                self.result["best_val"] = metric
-                self.result["best_config"] = param_string
-            elif metric < self.result["worst_val"]:
-                self.result["worst_id"] = trial_id
-                self.result["worst_val"] = metric
-                self.result["worst_config"] = param_string
-
-        # update results and average regardless of experiment type
-        self.result["metric_list"].append(metric)
+            best_id, worst_id = self.stats.max_id, self.stats.min_id
+            params_key = "config"
+
+        # First finalized trial
+        if self.result.get("best_id", None) is None:
+            self.result = {"num_trials": 0, "early_stopped": 0}
+
+        if best_id == trial_id:
+            self.result["best_id"] = trial_id
+            self.result["best_val"] = metric
+            self.result["best_" + params_key] = param_string
+        if worst_id == trial_id:
+            self.result["worst_id"] = trial_id
+            self.result["worst_val"] = metric
+            self.result["worst_" + params_key] = param_string
+
+        # update results and statistics regardless of experiment type
         self.result["num_trials"] += 1
-        self.result["avg"] = sum(self.result["metric_list"]) / float(
-            len(self.result["metric_list"])
-        )
+        self.result["avg"] = self.stats.mean
+        self.result["std"] = self.stats.std
+        self.result["median"] = self.stats.median
+        self.result["p90"] = self.stats.p90
+        if self.stats.values is not None:
+            self.result["metric_list"] = self.stats.values
 
         if trial.early_stop:
             self.result["early_stopped"] += 1
@@ -739,13 +1357,11 @@ class ExperimentDriver(object):
         spark magic.
         """
         with self.log_lock:
-            temp = self.executor_logs
             # clear the executor logs since they are being sent
-            self.executor_logs = ""
-            return self.result, temp
+            return self.result, self.executor_logs.drain()
 
     def _log(self, log_msg):
         """Logs a string to the maggy driver log file.
         """
         msg = datetime.now().isoformat() + ": " + str(log_msg)
-        self.fd.write((msg + "\n").encode())
+        self.log_writer.write((msg + "\n").encode())
@@ -0,0 +1,305 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Write-ahead journal of the scheduling events of an experiment, to resume an
+experiment after the experiment driver crashed.
+"""
+
+import json
+import time
+from collections import OrderedDict
+
+
+from maggy import util
+from maggy.core import storage
+from maggy.trial import Trial
+
+
+class Journal(object):
+    """Append-only journal of scheduling events, compacted with snapshots.
+
+    The experiment driver records the events of its worker thread: trials
+    being created, scheduled, receiving metrics, early stopped, requeued
+    after a resume and finalized. Events are numbered, buffered and written
+    as segment files ``segment-<first>-<last>.jsonl`` with one json event per
+    line, when the buffer is full or ``flush_interval`` seconds after its
+    first event.
+    Every ``snapshot_events`` events, the state of all trials is written to
+    a snapshot ``snapshot-<seq>.json`` and the segments it covers are
+    deleted, so replaying stays fast for long experiments. Writes go through
+    a persistence pipeline and only need whole-file writes of the storage.
+    The pipeline must have a single worker, so a snapshot is written before
+    the segments it covers are deleted and segments are written in order.
+
+    Replaying loads the latest snapshot and applies the events of the
+    segments that follow it.
+
+    Not thread-safe, only to be used by the experiment driver worker thread.
+    """
+
+    SEGMENT_PREFIX = "segment-"
+    SNAPSHOT_PREFIX = "snapshot-"
+
+    def __init__(
+        self,
+        directory,
+        pipeline,
+        flush_events=1000,
+        flush_interval=5.0,
+        snapshot_events=10000,
+        fs=storage,
+    ):
+        """
+        :param directory: Directory of the journal files.
+        :type directory: str
+        :param pipeline: Pipeline writing the journal files in the background,
+            with a single worker.
+        :type pipeline: PersistencePipeline
+        :param flush_events: Number of buffered events that triggers a write.
+        :type flush_events: int
+        :param flush_interval: Seconds after which buffered events are
+            written.
+        :type flush_interval: float
+        :param snapshot_events: Number of events after which the journal is
+            compacted into a snapshot.
+        :type snapshot_events: int
+        :param fs: Storage module offering ``dump``, ``load``, ``ls``,
+            ``exists`` and ``delete`` like ``hops.hdfs``.
+        """
+        self.directory = directory
+        self.pipeline = pipeline
+        self.flush_events = flush_events
+        self.flush_interval = flush_interval
+        self.snapshot_events = snapshot_events
+        self.fs = fs
+        self.seq = 0
+        self._buffer = []
+        self._flush_deadline = None
+        self._snapshot_seq = 0
+        # all trials by id in creation order and the ids of the finalized
+        # ones in the order they finalized, the state of a snapshot
+        self._trials = OrderedDict()
+        self._final_order = []
+
+    def record(self, event_type, **data):
+        """Appends an event to the journal."""
+        self.seq += 1
+        data["seq"] = self.seq
+        data["type"] = event_type
+        if not self._buffer:
+            self._flush_deadline = time.time() + self.flush_interval
+        self._buffer.append(data)
+
+    def created(self, trial):
+        """Records a new trial of the optimizer or ablator."""
+        self._trials[trial.trial_id] = trial
+        self.record("created", trial=trial.to_dict())
+
+    def scheduled(self, trial_id, partition_id):
+        self.record("scheduled", trial_id=trial_id, partition_id=partition_id)
+
+    def metrics(self, trial_id, batch):
+        self.record("metrics", trial_id=trial_id, batch=batch)
+
+    def early_stopped(self, trial_id):
+        self.record("early_stop", trial_id=trial_id)
+
+    def requeued(self, trial_id):
+        """Records that an unfinished trial is run again from scratch after
+        the experiment was resumed."""
+        self.record("requeued", trial_id=trial_id)
+
+    def finalized(self, trial):
+        self._final_order.append(trial.trial_id)
+        self.record(
+            "finalized",
+            trial_id=trial.trial_id,
+            final_metric=trial.final_metric,
+            duration=trial.duration,
+            early_stop=trial.early_stop,
+        )
+
+    def next_deadline(self):
+        """Returns the time buffered events have to be written at, or None."""
+        if not self._buffer:
+            return None
+        return self._flush_deadline
+
+    def maybe_flush(self, now=None):
+        """Writes the buffered events if the buffer is full or its deadline
+        expired, and compacts the journal if it is due."""
+        if now is None:
+            now = time.time()
+        if self._buffer and (
+            len(self._buffer) >= self.flush_events or now >= self._flush_deadline
+        ):
+            self.flush()
+        if self.seq - self._snapshot_seq >= self.snapshot_events:
+            self.compact()
+
+    def flush(self):
+        """Writes the buffered events as a new segment."""
+        if not self._buffer:
+            return
+        first = self._buffer[0]["seq"]
+        data = "".join(
+            json.dumps(event, default=util.json_default_numpy) + "\n"
+            for event in self._buffer
+        )
+        self._buffer = []
+        self.pipeline.submit(
+            data,
+            self._path("{}{}-{}.jsonl".format(Journal.SEGMENT_PREFIX, first, self.seq)),
+        )
+
+    def compact(self):
+        """Writes a snapshot of all trials and deletes the journal files it
+        makes obsolete.
+
+        Only copies of the trials are taken on the calling thread, they are
+        serialized and written by the pipeline. Finalized trials don't change
+        anymore and are not copied.
+        """
+        self.flush()
+        trials = [
+            trial if trial.status == Trial.FINALIZED else trial.snapshot()
+            for trial in self._trials.values()
+        ]
+        self._snapshot_seq = self.seq
+        self.pipeline.run(
+            self._write_snapshot, self.seq, trials, list(self._final_order)
+        )
+        self.pipeline.run(self._delete_obsolete, self.seq)
+
+    def _write_snapshot(self, seq, trials, final_order):
+        """Serializes the copied ``trials`` and writes them as the snapshot
+        with ``seq``."""
+        snapshot = {
+            "seq": seq,
+            "trials": [trial.to_dict(metric_dict=False) for trial in trials],
+            "final_order": final_order,
+        }
+        self.fs.dump(
+            json.dumps(snapshot, default=util.json_default_numpy),
+            self._path("{}{}.json".format(Journal.SNAPSHOT_PREFIX, seq)),
+        )
+
+    def _delete_obsolete(self, snapshot_seq):
+        """Deletes the segments and snapshots covered by the snapshot with
+        ``snapshot_seq``, once the snapshot was written."""
+        if not self.fs.exists(
+            self._path("{}{}.json".format(Journal.SNAPSHOT_PREFIX, snapshot_seq))
+        ):
+            return
+        for name, _, last in self._list():
+            if last < snapshot_seq or (
+                last == snapshot_seq and name.startswith(Journal.SEGMENT_PREFIX)
+            ):
+                self.fs.delete(self._path(name))
+
+    def _path(self, name):
+        return self.directory + "/" + name
+
+    def _list(self):
+        """Returns the journal files as (name, first seq, last seq), ordered
+        by their last sequence number."""
+        if not self.fs.exists(self.directory):
+            return []
+        files = []
+        for path in self.fs.ls(self.directory):
+            name = path.rstrip("/").rsplit("/", 1)[-1]
+            if name.startswith(Journal.SEGMENT_PREFIX) and name.endswith(".jsonl"):
+                first, last = name[len(Journal.SEGMENT_PREFIX) : -6].split("-")
+                files.append((name, int(first), int(last)))
+            elif name.startswith(Journal.SNAPSHOT_PREFIX) and name.endswith(".json"):
+                seq = int(name[len(Journal.SNAPSHOT_PREFIX) : -5])
+                files.append((name, seq, seq))
+        files.sort(key=lambda f: (f[2], f[0].startswith(Journal.SEGMENT_PREFIX)))
+        return files
+
+    def load(self):
+        """Replays the journal in ``directory``, continuing it afterwards.
+
+        :return: All trials by id in creation order and the ids of the
+            finalized trials in the order they finalized.
+        :rtype: tuple
+        """
+        files = self._list()
+        trials = OrderedDict()
+        final_order = []
+        seq = 0
+
+        snapshots = [f for f in files if f[0].startswith(Journal.SNAPSHOT_PREFIX)]
+        if snapshots:
+            name, seq, _ = snapshots[-1]
+            snapshot = json.loads(self.fs.load(self._path(name)))
+            for trial_dict in snapshot["trials"]:
+                trial = Trial.from_dict(trial_dict)
+                trials[trial.trial_id] = trial
+            final_order = snapshot["final_order"]
+
+        for name, first, last in files:
+            if not name.startswith(Journal.SEGMENT_PREFIX) or last <= seq:
+                continue
+            if first > seq + 1:
+                # a segment is missing, e.g. because the driver crashed while
+                # writing it. The later events can't be applied consistently
+                # and their segments would clash with the continued journal.
+                self.fs.delete(self._path(name))
+                continue
+            for line in self.fs.load(self._path(name)).splitlines():
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if event["seq"] <= seq:
+                    continue
+                Journal._apply(event, trials, final_order)
+                seq = event["seq"]
+
+        self.seq = seq
+        self._snapshot_seq = seq
+        self._trials = trials
+        self._final_order = final_order
+        return trials, final_order
+
+    @staticmethod
+    def _apply(event, trials, final_order):
+        event_type = event["type"]
+        if event_type == "created":
+            trial = Trial.from_dict(event["trial"])
+            trials[trial.trial_id] = trial
+            return
+        trial = trials.get(event["trial_id"])
+        if trial is None:
+            # speculative copies of trials are not recorded as created
+            return
+        if event_type == "scheduled":
+            trial.status = Trial.SCHEDULED
+        elif event_type == "metrics":
+            trial.append_metrics(event["batch"])
+        elif event_type == "early_stop":
+            trial.early_stop = True
+        elif event_type == "requeued":
+            trial.status = Trial.PENDING
+            trial.early_stop = False
+            trial.clear_metrics()
+        elif event_type == "finalized":
+            trial.status = Trial.FINALIZED
+            trial.final_metric = event["final_metric"]
+            trial.duration = event["duration"]
+            trial.early_stop = event["early_stop"]
+            final_order.append(trial.trial_id)
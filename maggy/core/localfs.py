@@ -0,0 +1,83 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+"""
+Local file system with the interface of ``hops.hdfs`` used by maggy.
+"""
+
+import os
+import shutil
+
+
+class LocalFileSystem(object):
+    """Stores the files of experiments below a local root directory, which
+    takes the place of the Hopsworks project directory. Paths are absolute
+    local paths.
+    """
+
+    def __init__(self, root=None):
+        """
+        :param root: Directory taking the place of the project directory,
+            defaults to the current working directory.
+        :type root: str
+        """
+        self.root = os.path.abspath(root or os.getcwd())
+
+    def dump(self, data, path):
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        mode = "wb" if isinstance(data, bytes) else "w"
+        with open(path, mode) as f:
+            f.write(data)
+
+    def load(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def mkdir(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def ls(self, path):
+        return [os.path.join(path, name) for name in sorted(os.listdir(path))]
+
+    def delete(self, path, recursive=False):
+        if os.path.isdir(path):
+            if recursive:
+                shutil.rmtree(path)
+            else:
+                os.rmdir(path)
+        else:
+            os.remove(path)
+
+    def open_file(self, path, flags="rw"):
+        """Opens the file in binary mode, like files on HDFS. Flags are 'r',
+        'w', 'a' or 'rw' (read, and write from the start)."""
+        mode = {"r": "rb", "w": "wb", "a": "ab", "rw": "r+b"}[flags]
+        return open(path, mode)
+
+    def project_path(self):
+        return self.root + "/"
+
+    def project_name(self):
+        return os.path.basename(self.root)
@@ -0,0 +1,78 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Bounded buffer for the executor logs the experiment driver forwards to
+sparkmagic.
+"""
+
+from collections import deque
+
+
+class LogBuffer(object):
+    """Deque of log chunks holding at most ``max_bytes`` bytes of logs.
+
+    Appending a chunk to a full buffer drops the oldest chunks, the dropped
+    chunks and bytes are counted. The chunks are joined only once, when the
+    buffer is drained.
+
+    Not thread-safe, the experiment driver guards it with its log lock.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        :param max_bytes: Maximum size of the buffered logs in bytes, encoded
+            as UTF-8.
+        :type max_bytes: int
+        """
+        self.max_bytes = max_bytes
+        # deque of (chunk, size in bytes)
+        self._chunks = deque()
+        self.nbytes = 0
+        self.dropped_chunks = 0
+        self.dropped_bytes = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def append(self, chunk):
+        """Appends the log string ``chunk``, dropping the oldest chunks if the
+        buffer overflows. A chunk larger than the buffer is cut to its last
+        ``max_bytes`` bytes.
+        """
+        encoded = chunk.encode("utf-8")
+        size = len(encoded)
+        if size > self.max_bytes:
+            self.dropped_bytes += size - self.max_bytes
+            # cut at a character boundary
+            chunk = encoded[size - self.max_bytes :].decode("utf-8", "ignore")
+            size = len(chunk.encode("utf-8"))
+
+        while self._chunks and self.nbytes + size > self.max_bytes:
+            _, dropped = self._chunks.popleft()
+            self.nbytes -= dropped
+            self.dropped_chunks += 1
+            self.dropped_bytes += dropped
+
+        self._chunks.append((chunk, size))
+        self.nbytes += size
+
+    def drain(self):
+        """Removes all chunks and returns them joined to one string."""
+        logs = "".join(chunk for chunk, _ in self._chunks)
+        self._chunks.clear()
+        self.nbytes = 0
+        return logs
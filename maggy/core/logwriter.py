@@ -0,0 +1,137 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Background writer for the experiment driver's log file.
+"""
+
+import queue
+import threading
+import time
+
+# tells the writer thread to write the pending batch and to exit
+_CLOSE = object()
+
+
+class AsyncLogWriter(object):
+    """Writes log messages to a file descriptor from a dedicated thread, so
+    that the threads logging never block on storage.
+
+    Messages are queued in a bounded queue. The writer thread collects them
+    into batches and writes a batch when it reached ``batch_bytes`` or
+    ``flush_interval`` seconds after its first message. Messages that don't
+    fit the queue are dropped and counted.
+    """
+
+    def __init__(self, fd, max_queue=10000, batch_bytes=64 * 1024, flush_interval=1.0):
+        """
+        :param fd: File descriptor to write to, supporting ``write``, ``flush``
+            and ``close``.
+        :param max_queue: Maximum number of queued messages.
+        :type max_queue: int
+        :param batch_bytes: Batch size in bytes that triggers a write.
+        :type batch_bytes: int
+        :param flush_interval: Seconds after which a batch is written, even if
+            it is smaller than ``batch_bytes``.
+        :type flush_interval: float
+        """
+        self._fd = fd
+        self._queue = queue.Queue(maxsize=max_queue)
+        self.batch_bytes = batch_bytes
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.errors = 0
+        # number of batches written, moving average and maximum of the
+        # seconds a batch write took
+        self.writes = 0
+        self.write_latency = 0.0
+        self.max_write_latency = 0.0
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        """Number of messages waiting to be written."""
+        return self._queue.qsize()
+
+    def write(self, data):
+        """Queues ``data`` bytes for writing, without blocking."""
+        try:
+            self._queue.put_nowait(data)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """Writes all queued messages, then flushes and closes the file
+        descriptor. Blocks until the writer thread is done."""
+        self._queue.put(_CLOSE)
+        self._thread.join()
+
+    def _run(self):
+        batch = []
+        batch_size = 0
+        deadline = None
+        while True:
+            timeout = None
+            if batch:
+                timeout = max(0, deadline - time.monotonic())
+            try:
+                data = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                data = None
+
+            if data is not None and data is not _CLOSE:
+                if not batch:
+                    deadline = time.monotonic() + self.flush_interval
+                batch.append(data)
+                batch_size += len(data)
+                # a steady stream of messages must not delay the write
+                # beyond the flush interval
+                if batch_size < self.batch_bytes and time.monotonic() < deadline:
+                    continue
+
+            if batch:
+                self._write(b"".join(batch))
+                batch = []
+                batch_size = 0
+
+            if data is _CLOSE:
+                break
+
+        if self.dropped > 0:
+            self._write(
+                "Log writer dropped {} messages\n".format(self.dropped).encode()
+            )
+        try:
+            self._fd.flush()
+            self._fd.close()
+        except Exception:
+            self.errors += 1
+
+    def _write(self, data):
+        start = time.monotonic()
+        try:
+            self._fd.write(data)
+            self._fd.flush()
+        except Exception:
+            # a failing file system must not kill the writer thread
+            self.errors += 1
+            return
+        latency = time.monotonic() - start
+        self.writes += 1
+        self.write_latency = 0.9 * self.write_latency + 0.1 * latency
+        self.max_write_latency = max(self.max_write_latency, latency)
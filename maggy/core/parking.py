@@ -0,0 +1,112 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Parking lot for executors that the optimizer currently has no work for.
+"""
+
+import heapq
+import time
+
+
+class IdleParking(object):
+    """Heap of idle executors keyed by the deadline of their next retry.
+
+    Executors are parked when the optimizer returns "IDLE" for them. The
+    experiment driver retries them when a trial finalizes or when their
+    deadline expires. Heap entries are invalidated lazily, so parking and
+    unparking are O(log n) and the driver never has to scan all executors.
+
+    Not thread-safe, only to be used by the experiment driver worker thread.
+    """
+
+    def __init__(self, retry_interval):
+        """
+        :param retry_interval: Seconds after which a parked executor is
+            retried even if no trial finalized in the meantime.
+        :type retry_interval: float
+        """
+        self.retry_interval = retry_interval
+        # heap of (deadline, sequence number, partition_id)
+        self._heap = []
+        self._seq = 0
+        # maps partition_id to (parked since, sequence number of heap entry)
+        self._parked = {}
+        # accumulated seconds each partition spent parked
+        self.parked_time = {}
+
+    def __len__(self):
+        return len(self._parked)
+
+    def __contains__(self, partition_id):
+        return partition_id in self._parked
+
+    def park(self, partition_id, now=None):
+        """Parks ``partition_id`` until the next retry deadline. If the
+        partition is parked already, only its deadline is renewed.
+        """
+        if now is None:
+            now = time.time()
+        since = self._parked.get(partition_id, (now, None))[0]
+        self._seq += 1
+        self._parked[partition_id] = (since, self._seq)
+        heapq.heappush(self._heap, (now + self.retry_interval, self._seq, partition_id))
+
+    def unpark(self, partition_id, now=None):
+        """Removes ``partition_id`` from the parking and returns the seconds
+        it spent parked, or None if it was not parked.
+        """
+        if partition_id not in self._parked:
+            return None
+        if now is None:
+            now = time.time()
+        since, _ = self._parked.pop(partition_id)
+        parked = now - since
+        self.parked_time[partition_id] = (
+            self.parked_time.get(partition_id, 0.0) + parked
+        )
+        return parked
+
+    def parked(self):
+        """Returns the parked partition ids, longest waiting first."""
+        return sorted(self._parked, key=lambda p: self._parked[p][0])
+
+    def due(self, now=None):
+        """Returns the parked partition ids whose retry deadline expired.
+
+        The partitions stay parked, they have to be either unparked or parked
+        again to renew their deadline.
+        """
+        if now is None:
+            now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, seq, partition_id = heapq.heappop(self._heap)
+            # skip entries that were renewed or unparked in the meantime
+            entry = self._parked.get(partition_id)
+            if entry is not None and entry[1] == seq:
+                due.append(partition_id)
+        return due
+
+    def next_deadline(self):
+        """Returns the earliest retry deadline or None if nothing is parked."""
+        while self._heap:
+            deadline, seq, partition_id = self._heap[0]
+            entry = self._parked.get(partition_id)
+            if entry is not None and entry[1] == seq:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
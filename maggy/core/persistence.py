@@ -0,0 +1,126 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Background persistence of trial and experiment artifacts.
+"""
+
+import threading
+import time
+from concurrent import futures
+
+
+class PersistencePipeline(object):
+    """Writes snapshots of artifacts, such as finalized trials, to storage in
+    the background with a bounded number of writer threads.
+
+    Snapshots are serialized before they are submitted, so later changes to
+    the objects don't affect what is written. Failed writes are retried with
+    exponential backoff. ``flush`` waits for all submitted writes.
+    """
+
+    def __init__(self, dump, max_workers=4, max_retries=3, retry_delay=0.5):
+        """
+        :param dump: Function writing a string to a path, e.g. ``hdfs.dump``.
+        :type dump: callable
+        :param max_workers: Maximum number of concurrent writes.
+        :type max_workers: int
+        :param max_retries: How often a failed write is retried.
+        :type max_retries: int
+        :param retry_delay: Seconds before the first retry, doubled for every
+            further retry.
+        :type retry_delay: float
+        """
+        self._dump = dump
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._executor = futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        # futures of the submitted writes to the time they were submitted
+        self._pending = {}
+        self.written = 0
+        self.retries = 0
+        # (path or function name, exception) of the writes that failed after
+        # all retries
+        self.failed = []
+
+    def submit(self, data, path):
+        """Schedules writing the serialized snapshot ``data`` to ``path``."""
+        self._submit(path, self._dump, data, path)
+
+    def run(self, func, *args):
+        """Schedules calling ``func(*args)`` in the background, with the same
+        retries as writes, e.g. to clean up files."""
+        self._submit(func.__name__, func, *args)
+
+    def _submit(self, name, func, *args):
+        future = self._executor.submit(self._call, name, func, *args)
+        with self._lock:
+            self._pending[future] = time.time()
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.pop(future, None)
+
+    def _call(self, name, func, *args):
+        for attempt in range(self.max_retries + 1):
+            try:
+                func(*args)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    with self._lock:
+                        self.failed.append((name, e))
+                    return
+                with self._lock:
+                    self.retries += 1
+                time.sleep(self.retry_delay * 2 ** attempt)
+            else:
+                with self._lock:
+                    self.written += 1
+                return
+
+    @property
+    def pending(self):
+        """Number of writes that are queued or running."""
+        return len(self._pending)
+
+    def lag(self, now=None):
+        """Returns the seconds the oldest pending write has been waiting, 0 if
+        nothing is pending."""
+        with self._lock:
+            oldest = min(self._pending.values(), default=None)
+        if oldest is None:
+            return 0.0
+        return (now or time.time()) - oldest
+
+    def flush(self, timeout=None):
+        """Blocks until all writes submitted so far are done.
+
+        :param timeout: Maximum number of seconds to wait, None to wait until
+            all writes are done.
+        :type timeout: float
+        :return: True if all writes are done.
+        :rtype: bool
+        """
+        with self._lock:
+            pending = list(self._pending)
+        _, not_done = futures.wait(pending, timeout)
+        return not not_done
+
+    def close(self):
+        """Waits for all writes and stops the writer threads."""
+        self._executor.shutdown(wait=True)
@@ -19,22 +19,51 @@ API Module for the user to include in his training code.
 
 """
 import threading
+from collections import deque
 from datetime import datetime
 
-from hops import hdfs as hopshdfs
-
 from maggy import constants
-from maggy.core import exceptions
+from maggy.core import exceptions, storage
 
 
 class Reporter(object):
     """
     Thread-safe store for sending a metric and logs from executor to driver
+
+    Every broadcasted metric is kept in a bounded buffer until the next
+    heartbeat ships it to the driver. If more than ``buffer_size`` metrics
+    are broadcasted between two heartbeats, either the oldest or the newest
+    ones are dropped, depending on ``drop_policy``, and counted.
     """
 
-    def __init__(self, log_file, partition_id, task_attempt, print_executor):
+    DROP_OLDEST = "oldest"
+    DROP_NEWEST = "newest"
+
+    def __init__(
+        self,
+        log_file,
+        partition_id,
+        task_attempt,
+        print_executor,
+        buffer_size=1000,
+        drop_policy=DROP_OLDEST,
+    ):
+        if drop_policy not in (Reporter.DROP_OLDEST, Reporter.DROP_NEWEST):
+            raise ValueError(
+                "Unknown metric drop policy '{}', should be either '{}' or "
+                "'{}'".format(drop_policy, Reporter.DROP_OLDEST, Reporter.DROP_NEWEST)
+            )
         self.metric = None
         self.step = -1
+        self.buffer_size = buffer_size
+        self.drop_policy = drop_policy
+        # (step, metric) pairs broadcasted since the last heartbeat, a full
+        # deque with maxlen discards the oldest pair on append
+        self.metrics = deque(
+            maxlen=buffer_size if drop_policy == Reporter.DROP_OLDEST else None
+        )
+        # number of metrics dropped since the last heartbeat
+        self.dropped = 0
         self.lock = threading.RLock()
         self.stop = False
         self.trial_id = None
@@ -47,9 +76,9 @@ class Reporter(object):
 
         # Open executor log file descriptor
         # This log is for all maggy system related log messages
-        if not hopshdfs.exists(log_file):
-            hopshdfs.dump("", log_file)
-        self.fd = hopshdfs.open_file(log_file, flags="w")
+        if not storage.exists(log_file):
+            storage.dump("", log_file)
+        self.fd = storage.open_file(log_file, flags="w")
         self.trial_fd = None
 
     def init_logger(self, trial_log_file):
@@ -57,9 +86,9 @@ class Reporter(object):
         """
         self.trial_log_file = trial_log_file
         # Open trial log file descriptor
-        if not hopshdfs.exists(self.trial_log_file):
-            hopshdfs.dump("", self.trial_log_file)
-        self.trial_fd = hopshdfs.open_file(self.trial_log_file, flags="w")
+        if not storage.exists(self.trial_log_file):
+            storage.dump("", self.trial_log_file)
+        self.trial_fd = storage.open_file(self.trial_log_file, flags="w")
 
     def close_logger(self):
         """Savely closes the file descriptors of the log files.
@@ -96,6 +125,12 @@ class Reporter(object):
             else:
                 self.step = step
                 self.metric = metric
+                if len(self.metrics) >= self.buffer_size:
+                    self.dropped += 1
+                    if self.drop_policy == Reporter.DROP_OLDEST:
+                        self.metrics.append((step, metric))
+                else:
+                    self.metrics.append((step, metric))
             if self.stop:
                 raise exceptions.EarlyStopException(metric)
 
@@ -130,12 +165,18 @@ class Reporter(object):
                 )
 
     def get_data(self):
-        """Returns the metric and logs to be sent to the experiment driver.
+        """Returns the metrics broadcasted since the last call as a list of
+        (step, metric) pairs, the number of dropped metrics and the logs to
+        be sent to the experiment driver.
         """
         with self.lock:
             log_to_send = self.logs
             self.logs = ""
-            return self.metric, self.step, log_to_send
+            metrics = list(self.metrics)
+            self.metrics.clear()
+            dropped = self.dropped
+            self.dropped = 0
+            return metrics, dropped, log_to_send
 
     def reset(self):
         """
@@ -145,6 +186,8 @@ class Reporter(object):
         with self.lock:
             self.metric = None
             self.step = -1
+            self.metrics.clear()
+            self.dropped = 0
             self.stop = False
             self.trial_id = None
             self.fd.flush()
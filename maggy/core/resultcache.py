@@ -0,0 +1,150 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Persistent cache of trial results, shared across experiments.
+"""
+
+import hashlib
+import inspect
+import json
+import time
+from collections import OrderedDict
+
+
+from maggy import util
+from maggy.core import storage
+
+
+def fingerprint(map_fun, optimization_key):
+    """Computes the fingerprint of an experiment, results are only reused
+    between experiments with the same fingerprint.
+
+    The fingerprint covers the source code of the training function and the
+    optimized metric. Changes of the data the function reads are not
+    detected, use a different cache for them.
+
+    :param map_fun: User defined experiment containing the model training.
+    :type map_fun: function
+    :param optimization_key: Name of the metric to be optimized.
+    :type optimization_key: str
+    :return: Sixteen character truncated md5 hash
+    :rtype: str
+    """
+    try:
+        code = inspect.getsource(map_fun).encode("utf-8")
+    except (OSError, TypeError):
+        # source is not available, e.g. for functions defined in a shell
+        code = map_fun.__code__.co_code
+    md5 = hashlib.md5(code)
+    md5.update(str(optimization_key).encode("utf-8"))
+    return md5.hexdigest()[:16]
+
+
+class ResultCache(object):
+    """Results of finalized trials keyed by the experiment fingerprint and
+    the trial id, which is a stable hash of the hyperparameters.
+
+    The cache is loaded from a json file when it is created and written back
+    with `dumps` at the end of the experiment. It holds at most
+    ``max_entries`` results, evicting the least recently used ones, and
+    results older than ``ttl`` seconds expire. Experiments running at the
+    same time on the same cache file overwrite each other's new results.
+
+    Not thread-safe, only to be used by the experiment driver worker thread.
+    """
+
+    def __init__(
+        self, path, experiment_fingerprint, max_entries=10000, ttl=None, fs=storage
+    ):
+        """
+        :param path: Path of the cache file.
+        :type path: str
+        :param experiment_fingerprint: Fingerprint of the experiment, see
+            `fingerprint`.
+        :type experiment_fingerprint: str
+        :param max_entries: Maximum number of cached results.
+        :type max_entries: int
+        :param ttl: Seconds after which a cached result expires, None to keep
+            results until they are evicted.
+        :type ttl: float
+        :param fs: Storage module offering ``exists`` and ``load`` like
+            ``hops.hdfs``.
+        """
+        self.path = path
+        self.fingerprint = experiment_fingerprint
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # entries in least recently used order
+        self._entries = OrderedDict()
+        if fs.exists(path):
+            self.loads(fs.load(path))
+
+    def _key(self, trial_id):
+        return self.fingerprint + "/" + trial_id
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["time"] > self.ttl
+
+    def get(self, trial_id):
+        """Returns the cached result of the trial with ``trial_id`` as
+        dictionary with the ``final_metric``, the ``metric_history``,
+        ``step_history`` and ``duration``, or None."""
+        key = self._key(trial_id)
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry, time.time()):
+            del self._entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, trial):
+        """Caches the result of the finalized ``trial``."""
+        key = self._key(trial.trial_id)
+        self._entries[key] = {
+            "final_metric": trial.final_metric,
+            "metric_history": list(trial.metric_history),
+            "step_history": list(trial.step_history),
+            "duration": trial.duration,
+            "time": time.time(),
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def dumps(self):
+        """Serializes the cache, to be written to ``path``."""
+        return json.dumps(
+            {"entries": list(self._entries.items())}, default=util.json_default_numpy
+        )
+
+    def loads(self, data):
+        """Adds the unexpired entries of a serialized cache."""
+        now = time.time()
+        for key, entry in json.loads(data)["entries"]:
+            if not self._expired(entry, now):
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -14,27 +14,38 @@
 #   limitations under the License.
 #
 
+import asyncio
+import hashlib
+import hmac
 import threading
 import struct
-from pyspark import cloudpickle
 import time
 import select
 import socket
 import secrets
-import json
+import weakref
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 from maggy.trial import Trial
+from maggy.core import codec
 
-from hops import constants as hopsconstants
-from hops import util as hopsutil
 from hops.experiment_impl.util import experiment_utils
 
 MAX_RETRIES = 3
-BUFSIZE = 1024 * 2
+# seconds to wait for the reply to a request, on top of the time the server
+# may hold a long polling GET request
+REQUEST_TIMEOUT = 60
 
 server_host_port = None
 
 
+def _auth_digest(secret, challenge):
+    """HMAC of a handshake ``challenge`` keyed with the driver ``secret``."""
+    return hmac.new(secret.encode(), challenge, hashlib.sha256).digest()
+
+
 class Reservations(object):
     """Thread-safe store for worker reservations.
 
@@ -53,6 +64,8 @@ class Reservations(object):
         self.lock = threading.RLock()
         self.reservations = {}
         self.check_done = False
+        # called with the partition_id whenever a trial gets assigned
+        self.listener = None
 
     def add(self, meta):
         """
@@ -62,10 +75,15 @@ class Reservations(object):
             :meta: a dictonary of metadata about a node
         """
         with self.lock:
+            # trials prefetched for a re-registering executor are kept
+            previous = self.reservations.get(meta["partition_id"], None)
             self.reservations[meta["partition_id"]] = {
                 "host_port": meta["host_port"],
                 "task_attempt": meta["task_attempt"],
                 "trial_id": meta["trial_id"],
+                # trial slot of the executor, the partition_id identifies it
+                "slot": meta.get("slot", 0),
+                "prefetched": previous["prefetched"] if previous else deque(),
             }
 
             if self.remaining() == 0:
@@ -113,41 +131,111 @@ class Reservations(object):
         """
         with self.lock:
             self.reservations.get(partition_id, None)["trial_id"] = trial_id
+        if trial_id is not None and self.listener is not None:
+            self.listener(partition_id)
+
+    def prefetch_trial(self, partition_id, trial_id):
+        """Queues trial with ``trial_id`` to be assigned to the reservation
+        with ``partition_id`` once its current trial is finalized.
+
+        Args:
+            partition_id: An id to identify the spark executor.
+            trial_id: The id of the prefetched trial.
+        """
+        with self.lock:
+            self.reservations[partition_id]["prefetched"].append(trial_id)
+
+    def num_prefetched(self, partition_id):
+        """Get the number of trials queued for ``partition_id``."""
+        with self.lock:
+            return len(self.reservations[partition_id]["prefetched"])
+
+    def next_prefetched(self, partition_id):
+        """Assigns the next queued trial to ``partition_id``, or None if its
+        queue is empty.
+
+        Args:
+            partition_id: An id to identify the spark executor.
+
+        Returns:
+            trial_id of the assigned trial
+        """
+        with self.lock:
+            prefetched = self.reservations[partition_id]["prefetched"]
+            trial_id = prefetched.popleft() if prefetched else None
+            self.assign_trial(partition_id, trial_id)
+        return trial_id
+
+    def steal_prefetched(self):
+        """Removes a queued trial from the longest queue, to assign it to an
+        executor that ran out of work.
+
+        Returns:
+            trial_id of the removed trial, or None if all queues are empty
+        """
+        with self.lock:
+            longest = max(
+                (r["prefetched"] for r in self.reservations.values()),
+                key=len,
+                default=None,
+            )
+            if not longest:
+                return None
+            return longest.pop()
 
 
 class MessageSocket(object):
-    """Abstract class w/ length-prefixed socket send/receive functions."""
+    """Abstract class w/ length-prefixed socket send/receive functions.
+
+    Messages are encoded with ``protocol``, unless a message was received on
+    the socket before, in that case replies use the protocol version of the
+    peer.
+    """
+
+    def __init__(self, protocol=codec.VERSION):
+        self.protocol = protocol
+        # protocol versions of the peers by socket
+        self._peer_protocols = weakref.WeakKeyDictionary()
+        # serialize writes by socket, replies can be sent from several threads
+        self._write_locks = weakref.WeakKeyDictionary()
+        self._write_locks_lock = threading.Lock()
 
     def receive(self, sock):
         """
         Receive a message on ``sock``
 
+        Reads the length header first and then the payload directly into a
+        buffer of the exact size.
+
         Args:
             sock:
 
         Returns:
 
         """
-        msg = None
-        data = b""
-        recv_done = False
-        recv_len = -1
-        while not recv_done:
-            buf = sock.recv(BUFSIZE)
-            if buf is None or len(buf) == 0:
-                raise Exception("socket closed")
-            if recv_len == -1:
-                recv_len = struct.unpack(">I", buf[:4])[0]
-                data += buf[4:]
-                recv_len -= len(data)
-            else:
-                data += buf
-                recv_len -= len(buf)
-            recv_done = recv_len == 0
+        header = bytearray(4)
+        self._recv_into(sock, memoryview(header))
+        data = bytearray(struct.unpack(">I", header)[0])
+        self._recv_into(sock, memoryview(data))
 
-        msg = cloudpickle.loads(data)
+        msg, self._peer_protocols[sock] = codec.loads(data)
         return msg
 
+    def _recv_into(self, sock, view):
+        """
+        Fill ``view`` completely with bytes received on ``sock``.
+
+        Args:
+            sock:
+            view: memoryview of the buffer to fill
+
+        """
+        while len(view) > 0:
+            nbytes = sock.recv_into(view)
+            if nbytes == 0:
+                raise Exception("socket closed")
+            view = view[nbytes:]
+
     def send(self, sock, msg):
         """
         Send ``msg`` to destination ``sock``.
@@ -159,9 +247,14 @@ class MessageSocket(object):
         Returns:
 
         """
-        data = cloudpickle.dumps(msg)
+        data = codec.dumps(msg, self._peer_protocols.get(sock, self.protocol))
         buf = struct.pack(">I", len(data)) + data
-        sock.sendall(buf)
+        with self._write_locks_lock:
+            lock = self._write_locks.get(sock)
+            if lock is None:
+                lock = self._write_locks[sock] = threading.Lock()
+        with lock:
+            sock.sendall(buf)
 
 
 class Server(MessageSocket):
@@ -169,6 +262,8 @@ class Server(MessageSocket):
 
     reservations = None
     done = False
+    # random bytes the client has to sign during the handshake
+    CHALLENGE_BYTES = 16
 
     def __init__(self, count):
         """
@@ -176,8 +271,24 @@ class Server(MessageSocket):
         Args:
             count:
         """
+        super().__init__()
         assert count > 0
         self.reservations = Reservations(count)
+        self.reservations.listener = self._release_get
+        # long polling GET requests waiting for a trial by partition_id, as
+        # tuples of (socket, experiment driver, deadline, request id)
+        self._pending_gets = {}
+        # time of the last FINAL message by partition_id
+        self._final_times = {}
+        # request id of the last FINAL message by partition_id
+        self._final_rids = {}
+        # statistics of the gap between FINAL and the next TRIAL in seconds
+        self.gap_count = 0
+        self.gap_total = 0.0
+        self.gap_max = 0.0
+        # handshake state by connection, the challenge sent to the client or
+        # True once the client answered it
+        self._sessions = weakref.WeakKeyDictionary()
 
     def await_reservations(self, sc, status={}, timeout=600):
         """
@@ -204,6 +315,21 @@ class Server(MessageSocket):
         print("All reservations completed")
         return self.reservations.get()
 
+    def _dispatch(self, sock, msg, exp_driver):
+        """Handles a message and records its type and handler latency in the
+        metrics of the experiment driver, if it has them."""
+        start = time.time()
+        try:
+            self._handle_message(sock, msg, exp_driver)
+        finally:
+            msg_type = str(msg.get("type"))
+            message_count = getattr(exp_driver, "message_count", None)
+            if message_count is not None:
+                message_count.inc(type=msg_type)
+            message_latency = getattr(exp_driver, "message_latency", None)
+            if message_latency is not None:
+                message_latency.observe(time.time() - start, type=msg_type)
+
     def _handle_message(self, sock, msg, exp_driver):
         """
         Handles a  message dictionary. Expects a 'type' and 'data' attribute in
@@ -220,8 +346,13 @@ class Server(MessageSocket):
 
         # Prepare message
         send = {}
+        # clients with multiplexed connections match replies by request id
+        if "rid" in msg:
+            send["rid"] = msg["rid"]
 
         if msg_type == "REG":
+            # request ids of a new client start over
+            self._final_rids.pop(msg["partition_id"], None)
             # check if executor was registered before and retrieve lost trial
             lost_trial = self.reservations.get_assigned_trial(msg["partition_id"])
             if lost_trial is not None:
@@ -245,9 +376,22 @@ class Server(MessageSocket):
             send["type"] = "QUERY"
             send["data"] = self.reservations.done()
         elif msg_type == "METRIC":
+            data = msg.get("data")
+            if data is not None and "batch" not in data:
+                # heartbeat of a client without metric batching, it only
+                # carries the latest metric
+                value = data.get("value")
+                msg["data"] = {
+                    "batch": [] if value is None else [(data.get("step"), value)],
+                    "dropped": 0,
+                }
             # add metric msg to the exp driver queue
             exp_driver.add_message(msg)
 
+            # let the executor adapt its heartbeat interval to the load
+            if exp_driver.hb_interval_min < exp_driver.hb_interval_max:
+                send["hb_interval"] = exp_driver.suggest_hb_interval()
+
             if msg["trial_id"] is None:
                 send["type"] = "OK"
                 MessageSocket.send(self, sock, send)
@@ -270,32 +414,48 @@ class Server(MessageSocket):
             else:
                 send["type"] = "OK"
         elif msg_type == "FINAL":
-            # reset the reservation to avoid sending the same trial again
-            self.reservations.assign_trial(msg["partition_id"], None)
-
             send["type"] = "OK"
+            # a client that lost the connection before the reply arrived
+            # sends the FINAL again with the same request id
+            rid = msg.get("rid")
+            if rid is not None and self._final_rids.get(msg["partition_id"]) == rid:
+                MessageSocket.send(self, sock, send)
+                return
+            self._final_rids[msg["partition_id"]] = rid
+
+            # continue with a prefetched trial right away, or reset the
+            # reservation to avoid sending the same trial again
+            next_trial_id = self.reservations.next_prefetched(msg["partition_id"])
+            if next_trial_id is not None:
+                next_trial = exp_driver.get_trial(next_trial_id)
+                with next_trial.lock:
+                    next_trial.start = time.time()
+            # tells the experiment driver that the executor has a trial
+            msg["prefetched"] = next_trial_id
+            self._final_times[msg["partition_id"]] = time.time()
 
             # add metric msg to the exp driver queue
             exp_driver.add_message(msg)
         elif msg_type == "GET":
-            # lookup reservation to find assigned trial
-            trial_id = self.reservations.get_assigned_trial(msg["partition_id"])
-
-            # trial_id needs to be none because experiment_done can be true but
-            # the assigned trial might not be finalized yet
-            if exp_driver.experiment_done and trial_id is None:
-                send["type"] = "GSTOP"
-            else:
-                send["type"] = "TRIAL"
-
-            send["trial_id"] = trial_id
-
-            # retrieve trial information
-            if trial_id is not None:
-                send["data"] = exp_driver.get_trial(trial_id).params
-                exp_driver.get_trial(trial_id).status = Trial.RUNNING
-            else:
-                send["data"] = None
+            # the executor can ask to wait up to `data` seconds for a trial
+            timeout = msg.get("data", None)
+            with self.reservations.lock:
+                if (
+                    timeout
+                    and not exp_driver.experiment_done
+                    and self.reservations.get_assigned_trial(msg["partition_id"])
+                    is None
+                ):
+                    # reply as soon as a trial is assigned or on timeout
+                    self._pending_gets[msg["partition_id"]] = (
+                        sock,
+                        exp_driver,
+                        time.monotonic() + timeout,
+                        msg.get("rid"),
+                    )
+                    self._schedule_get_expiry(timeout)
+                    return
+                send.update(self._trial_response(msg["partition_id"], exp_driver))
         elif msg_type == "LOG":
             # get data from experiment driver
             result, log = exp_driver._get_logs()
@@ -314,6 +474,92 @@ class Server(MessageSocket):
 
         MessageSocket.send(self, sock, send)
 
+    def _trial_response(self, partition_id, exp_driver):
+        """Builds the reply to a GET message from the trial assigned to
+        ``partition_id``.
+        """
+        send = {}
+        # lookup reservation to find assigned trial
+        trial_id = self.reservations.get_assigned_trial(partition_id)
+
+        # trial_id needs to be none because experiment_done can be true but
+        # the assigned trial might not be finalized yet
+        if exp_driver.experiment_done and trial_id is None:
+            send["type"] = "GSTOP"
+        else:
+            send["type"] = "TRIAL"
+
+        send["trial_id"] = trial_id
+
+        # retrieve trial information
+        if trial_id is not None:
+            send["data"] = exp_driver.get_trial(trial_id).params
+            exp_driver.get_trial(trial_id).status = Trial.RUNNING
+
+            final_time = self._final_times.pop(partition_id, None)
+            if final_time is not None:
+                gap = time.time() - final_time
+                self.gap_count += 1
+                self.gap_total += gap
+                self.gap_max = max(self.gap_max, gap)
+        else:
+            send["data"] = None
+        return send
+
+    def _release_get(self, partition_id):
+        """Replies to the waiting GET request of ``partition_id``, if there is
+        one. Can be called from any thread.
+        """
+        with self.reservations.lock:
+            pending = self._pending_gets.pop(partition_id, None)
+            if pending is None:
+                return
+            sock, exp_driver, _, rid = pending
+            send = self._trial_response(partition_id, exp_driver)
+            if rid is not None:
+                send["rid"] = rid
+        try:
+            MessageSocket.send(self, sock, send)
+        except Exception as e:
+            # the listener closes the socket when it notices
+            _ = e
+
+    def release_gets(self):
+        """Replies to all waiting GET requests, e.g. when the experiment is
+        done.
+        """
+        with self.reservations.lock:
+            partition_ids = list(self._pending_gets)
+        for partition_id in partition_ids:
+            self._release_get(partition_id)
+
+    def _expire_gets(self):
+        """Replies to the waiting GET requests whose timeout expired."""
+        now = time.monotonic()
+        with self.reservations.lock:
+            expired = [
+                partition_id
+                for partition_id, (_, _, deadline, _) in self._pending_gets.items()
+                if deadline <= now
+            ]
+        for partition_id in expired:
+            self._release_get(partition_id)
+
+    def _next_get_expiry(self):
+        """Seconds until the next waiting GET request expires, or None."""
+        with self.reservations.lock:
+            if not self._pending_gets:
+                return None
+            deadline = min(p[2] for p in self._pending_gets.values())
+        return max(0, deadline - time.monotonic())
+
+    def _schedule_get_expiry(self, timeout):
+        """Hook for server engines to make sure ``_expire_gets`` is called
+        after ``timeout`` seconds. The select loop computes its timeout from
+        ``_next_get_expiry`` instead.
+        """
+        pass
+
     def get_assigned_trial_id(self, partition_id):
         """Returns the id of the assigned trial, given a ``partition_id``.
 
@@ -325,12 +571,58 @@ class Server(MessageSocket):
         """
         return self.reservations.get_assigned_trial(partition_id)
 
-    def start(self, exp_driver):
+    def _authenticate(self, sock, msg, exp_driver):
+        """Checks whether ``msg`` may be dispatched and answers the handshake
+        messages.
+
+        A connection authenticates once, by answering a random challenge
+        with the HMAC of the challenge keyed with the driver secret. Its
+        messages are trusted afterwards. On other connections every message
+        has to carry the secret, like the ones of legacy clients. Raises an
+        exception otherwise, so the client socket gets closed.
+
+        Returns:
+            False if ``msg`` was a handshake message and has been answered
         """
-        Start listener in a background thread.
+        session = self._sessions.get(sock)
+        if session is True:
+            return True
+
+        msg_type = msg["type"]
+        if msg_type == "CHALLENGE":
+            challenge = secrets.token_bytes(Server.CHALLENGE_BYTES)
+            self._sessions[sock] = challenge
+            MessageSocket.send(self, sock, {"type": "CHALLENGE", "data": challenge})
+            return False
+        if msg_type == "AUTH":
+            digest = msg.get("data")
+            if (
+                session is None
+                or type(digest) is not bytes
+                or not secrets.compare_digest(
+                    digest, _auth_digest(exp_driver._secret, session)
+                )
+            ):
+                exp_driver._log("ERROR: failed handshake")
+                raise Exception
+            self._sessions[sock] = True
+            MessageSocket.send(self, sock, {"type": "OK"})
+            return False
+
+        secret = msg.get("secret")
+        if secret is None or not secrets.compare_digest(secret, exp_driver._secret):
+            exp_driver._log("SERVER secret: {}".format(exp_driver._secret))
+            exp_driver._log("ERROR: wrong secret {}".format(secret))
+            raise Exception
+        return True
+
+    def _bind(self, exp_driver, backlog=10):
+        """Creates the listening server socket. On first use the socket is
+        bound to a free port and the driver is registered with the execution
+        backend, e.g. Hopsworks.
 
         Returns:
-            address of the Server as a tuple of (host, port)
+            the listening socket
         """
         global server_host_port
 
@@ -343,52 +635,31 @@ class Server(MessageSocket):
             port = server_sock.getsockname()[1]
             server_host_port = (host, port)
 
-            # register this driver with Hopsworks
-            sc = hopsutil._find_spark().sparkContext
-            app_id = str(sc.applicationId)
-
-            method = hopsconstants.HTTP_CONFIG.HTTP_POST
-            resource_url = (
-                hopsconstants.DELIMITERS.SLASH_DELIMITER
-                + hopsconstants.REST_CONFIG.HOPSWORKS_REST_RESOURCE
-                + hopsconstants.DELIMITERS.SLASH_DELIMITER
-                + "maggy"
-                + hopsconstants.DELIMITERS.SLASH_DELIMITER
-                + "drivers"
-            )
-            json_contents = {
-                "hostIp": host,
-                "port": port,
-                "appId": app_id,
-                "secret": exp_driver._secret,
-            }
-            json_embeddable = json.dumps(json_contents)
-            headers = {
-                hopsconstants.HTTP_CONFIG.HTTP_CONTENT_TYPE: hopsconstants.HTTP_CONFIG.HTTP_APPLICATION_JSON
-            }
-
-            try:
-                response = hopsutil.send_request(
-                    method, resource_url, data=json_embeddable, headers=headers
-                )
-
-                if (response.status_code // 100) != 2:
-                    print("No connection to Hopsworks for logging.")
-                    exp_driver._log("No connection to Hopsworks for logging.")
-            except Exception as e:
-                print("Connection failed to Hopsworks. No logging.")
-                exp_driver._log(e)
-                exp_driver._log("Connection failed to Hopsworks. No logging.")
+            exp_driver.backend.register_driver(exp_driver, host, port)
         else:
             server_sock.bind(server_host_port)
-        server_sock.listen(10)
+        server_sock.listen(backlog)
+        return server_sock
+
+    def start(self, exp_driver):
+        """
+        Start listener in a background thread.
+
+        Returns:
+            address of the Server as a tuple of (host, port)
+        """
+        server_sock = self._bind(exp_driver)
 
         def _listen(self, sock, driver):
             CONNECTIONS = []
             CONNECTIONS.append(sock)
 
             while not self.done:
-                read_socks, _, _ = select.select(CONNECTIONS, [], [], 60)
+                timeout = self._next_get_expiry()
+                if timeout is None or timeout > 60:
+                    timeout = 60
+                read_socks, _, _ = select.select(CONNECTIONS, [], [], timeout)
+                self._expire_gets()
                 for sock in read_socks:
                     if sock == server_sock:
                         client_sock, client_addr = sock.accept()
@@ -397,21 +668,8 @@ class Server(MessageSocket):
                     else:
                         try:
                             msg = self.receive(sock)
-
-                            # raise exception if secret does not match
-                            # so client socket gets closed
-                            if not secrets.compare_digest(
-                                msg["secret"], exp_driver._secret
-                            ):
-                                exp_driver._log(
-                                    "SERVER secret: {}".format(exp_driver._secret)
-                                )
-                                exp_driver._log(
-                                    "ERROR: wrong secret {}".format(msg["secret"])
-                                )
-                                raise Exception
-
-                            self._handle_message(sock, msg, driver)
+                            if self._authenticate(sock, msg, driver):
+                                self._dispatch(sock, msg, driver)
                         except Exception as e:
                             _ = e
                             sock.close()
@@ -432,37 +690,302 @@ class Server(MessageSocket):
         self.done = True
 
 
+class _TransportSocket(object):
+    """Wraps an asyncio transport to offer the blocking socket methods used
+    by ``Server._handle_message``.
+
+    Writes from other threads than the event loop thread are handed over to
+    the loop, since asyncio transports are not thread-safe.
+    """
+
+    def __init__(self, server, transport):
+        self.server = server
+        self.transport = transport
+
+    def _call(self, func, *args):
+        if threading.get_ident() == self.server._loop_thread:
+            func(*args)
+        else:
+            self.server._loop.call_soon_threadsafe(func, *args)
+
+    def sendall(self, buf):
+        self._call(self.transport.write, buf)
+
+    def close(self):
+        self._call(self.transport.close)
+
+
+class _MessageProtocol(asyncio.Protocol):
+    """Parses length-prefixed messages from a connection into its own read
+    buffer and dispatches complete messages to the server.
+    """
+
+    def __init__(self, server, exp_driver):
+        self.server = server
+        self.exp_driver = exp_driver
+        self.buffer = bytearray()
+        self.sock = None
+
+    def connection_made(self, transport):
+        self.sock = _TransportSocket(self.server, transport)
+
+    def data_received(self, data):
+        self.buffer += data
+        offset = 0
+        try:
+            while len(self.buffer) - offset >= 4:
+                msg_len = struct.unpack_from(">I", self.buffer, offset)[0]
+                if len(self.buffer) - offset - 4 < msg_len:
+                    break
+                payload = bytes(self.buffer[offset + 4 : offset + 4 + msg_len])
+                offset += 4 + msg_len
+                msg, version = codec.loads(payload)
+                self.server._peer_protocols[self.sock] = version
+                if self.server._authenticate(self.sock, msg, self.exp_driver):
+                    self.server._dispatch(self.sock, msg, self.exp_driver)
+        except Exception as e:
+            _ = e
+            self.sock.close()
+        finally:
+            del self.buffer[:offset]
+
+
+class AsyncServer(Server):
+    """Socket server with length prefixed pickle messages based on asyncio.
+
+    Speaks the same protocol as ``Server``, but does not suffer from the
+    O(n) cost per wakeup and the FD_SETSIZE limit of select(), so it can
+    serve several thousand executor connections.
+    """
+
+    # queue of pending connections, executors connect at the same time
+    BACKLOG = 1024
+
+    def __init__(self, count):
+        super().__init__(count)
+        self._loop = None
+        self._loop_thread = None
+        self._stopped = None
+
+    def start(self, exp_driver):
+        """
+        Start the event loop in a background thread.
+
+        Returns:
+            address of the Server as a tuple of (host, port)
+        """
+        server_sock = self._bind(exp_driver, AsyncServer.BACKLOG)
+        server_sock.setblocking(False)
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        async def _serve(self, sock, driver):
+            self._stopped = asyncio.Event()
+            server = await self._loop.create_server(
+                lambda: _MessageProtocol(self, driver), sock=sock
+            )
+            ready.set()
+            await self._stopped.wait()
+            server.close()
+
+        def _run(self, sock, driver):
+            asyncio.set_event_loop(self._loop)
+            self._loop_thread = threading.get_ident()
+            try:
+                self._loop.run_until_complete(_serve(self, sock, driver))
+            finally:
+                ready.set()
+                self._loop.close()
+
+        t = threading.Thread(target=_run, args=(self, server_sock, exp_driver))
+        t.daemon = True
+        t.start()
+        ready.wait()
+
+        return server_host_port
+
+    def _schedule_get_expiry(self, timeout):
+        self._loop.call_later(timeout, self._expire_gets_async)
+
+    def _expire_gets_async(self):
+        self._expire_gets()
+        # timers might fire marginally early, retry the ones that were missed
+        timeout = self._next_get_expiry()
+        if timeout is not None and timeout < 0.01:
+            self._loop.call_later(timeout, self._expire_gets_async)
+
+    def stop(self):
+        """
+        Stop the server's event loop.
+        """
+        self.done = True
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+
 class Client(MessageSocket):
     """Client to register and await node reservations.
 
+    All requests of an executor share a single connection. Every request
+    carries a request id, which the server copies into its reply, so the
+    heartbeat thread and the main thread can have requests in flight at the
+    same time and replies can arrive out of order. A reader thread dispatches
+    the replies to the waiting requests. The connection is authenticated with
+    a handshake when it is opened, so requests don't carry the secret.
+
     Args:
         :server_addr: a tuple of (host, port) pointing to the Server.
+        :protocol: version of the message encoding, see ``maggy.core.codec``.
+        :poll_timeout: seconds the server holds a GET request until a trial is
+            assigned, 0 to poll every second instead.
+        :hb_interval_min: lower bound of the heartbeat interval suggested by
+            the server, defaults to ``hb_interval``.
+        :hb_interval_max: upper bound of the heartbeat interval suggested by
+            the server, defaults to ``hb_interval``.
     """
 
-    def __init__(self, server_addr, partition_id, task_attempt, hb_interval, secret):
-        # socket for main thread
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect(server_addr)
-        # socket for heartbeat thread
-        self.hb_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.hb_sock.connect(server_addr)
+    def __init__(
+        self,
+        server_addr,
+        partition_id,
+        task_attempt,
+        hb_interval,
+        secret,
+        protocol=codec.VERSION,
+        poll_timeout=30,
+        hb_interval_min=None,
+        hb_interval_max=None,
+    ):
+        super().__init__(protocol)
         self.server_addr = server_addr
         self.done = False
-        self.client_addr = (
-            experiment_utils._get_ip_address(),
-            self.sock.getsockname()[1],
-        )
         self.partition_id = partition_id
         self.task_attempt = task_attempt
         self.hb_interval = hb_interval
+        self.hb_interval_min = hb_interval_min or hb_interval
+        self.hb_interval_max = hb_interval_max or hb_interval
         self._secret = secret
+        self.poll_timeout = poll_timeout
+        # requests waiting for their reply by request id, as tuples of
+        # (socket the request was sent on, future of the reply)
+        self._waiters = {}
+        self._waiters_lock = threading.Lock()
+        self._last_rid = 0
+        # connections that broke, requests are not accepted on them anymore
+        self._dead = weakref.WeakSet()
+        # encoded frames waiting to be written by socket, whichever thread
+        # holds the write lock sends all of them with a single call
+        self._outbox = {}
+        self._outbox_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self.sock = None
+        self._connect()
+        self.client_addr = (
+            experiment_utils._get_ip_address(),
+            self.sock.getsockname()[1],
+        )
+
+    def _connect(self):
+        """Opens the connection to the server and starts the thread reading
+        the replies from it."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect(self.server_addr)
+        try:
+            self._handshake(sock)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+
+        t = threading.Thread(target=self._read_replies, args=(sock,))
+        t.daemon = True
+        t.start()
+
+    def _handshake(self, sock):
+        """Authenticates the connection ``sock`` by answering the challenge of
+        the server with the HMAC of the challenge keyed with the secret."""
+        MessageSocket.send(self, sock, {"type": "CHALLENGE"})
+        challenge = MessageSocket.receive(self, sock)["data"]
+        MessageSocket.send(
+            self, sock, {"type": "AUTH", "data": _auth_digest(self._secret, challenge)},
+        )
+        if MessageSocket.receive(self, sock)["type"] != "OK":
+            raise Exception("Authentication with the experiment driver failed")
+
+    def _reconnect(self, sock):
+        """Replaces the connection ``sock`` by a new one, unless another
+        thread did so already."""
+        with self._connect_lock:
+            if self.sock is sock:
+                self._fail_connection(sock, "reconnecting")
+                try:
+                    # wakes up the reader thread
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                sock.close()
+                self._connect()
+
+    def _fail_connection(self, sock, reason):
+        """Marks ``sock`` as dead and fails the requests waiting for a reply
+        on it, so they can be retried on a new connection."""
+        with self._waiters_lock:
+            self._dead.add(sock)
+            failed = [
+                rid for rid, (req_sock, _) in self._waiters.items() if req_sock is sock
+            ]
+            futures = [self._waiters.pop(rid)[1] for rid in failed]
+        for future in futures:
+            future.set_exception(
+                ConnectionError(
+                    "connection to the experiment driver lost: {}".format(reason)
+                )
+            )
+
+    def _read_replies(self, sock):
+        """Dispatches the replies received on ``sock`` to the waiting
+        requests, until the connection breaks."""
+        try:
+            while True:
+                resp = MessageSocket.receive(self, sock)
+                with self._waiters_lock:
+                    waiter = self._waiters.pop(resp.get("rid"), None)
+                if waiter is not None:
+                    waiter[1].set_result(resp)
+        except Exception as e:
+            self._fail_connection(sock, e)
+
+    def _write(self, sock, msg):
+        """Queues ``msg`` for sending on ``sock`` and flushes the queue,
+        unless another thread is sending already, which then takes the
+        message along. If sending fails, the connection is failed, including
+        the requests of other threads that were sent along."""
+        data = codec.dumps(msg, self._peer_protocols.get(sock, self.protocol))
+        with self._outbox_lock:
+            frames = self._outbox.setdefault(sock, [])
+            frames.append(struct.pack(">I", len(data)))
+            frames.append(data)
+        with self._write_lock:
+            with self._outbox_lock:
+                frames = self._outbox.pop(sock, None)
+            if frames:
+                try:
+                    sock.sendall(b"".join(frames))
+                except socket.error as e:
+                    self._fail_connection(sock, e)
+                    raise
 
-    def _request(self, req_sock, msg_type, msg_data=None, trial_id=None, logs=None):
-        """Helper function to wrap msg w/ msg_type."""
+    def _request(self, msg_type, msg_data=None, trial_id=None, logs=None):
+        """Helper function to wrap msg w/ msg_type and wait for the reply.
+
+        If the connection breaks or the reply does not arrive in time, the
+        client reconnects and sends the request again, up to ``MAX_RETRIES``
+        times.
+        """
         msg = {}
         msg["partition_id"] = self.partition_id
         msg["type"] = msg_type
-        msg["secret"] = self._secret
 
         if msg_type == "FINAL" or msg_type == "METRIC":
             msg["trial_id"] = trial_id
@@ -475,29 +998,49 @@ class Client(MessageSocket):
         #    msg['data'] = msg_data
         msg["data"] = msg_data
 
-        done = False
+        timeout = REQUEST_TIMEOUT
+        if msg_type == "GET" and msg_data:
+            timeout += msg_data
+
+        with self._waiters_lock:
+            # request ids are 32 bit, 0 is reserved for "no request id", a
+            # retried request keeps its id so the server can detect repeats
+            self._last_rid = self._last_rid % (2 ** 32 - 1) + 1
+            msg["rid"] = self._last_rid
+
         tries = 0
-        while not done and tries < MAX_RETRIES:
+        while True:
+            future = Future()
+            with self._waiters_lock:
+                req_sock = self.sock
+                if req_sock not in self._dead:
+                    self._waiters[msg["rid"]] = (req_sock, future)
             try:
-                MessageSocket.send(self, req_sock, msg)
-                done = True
-            except socket.error as e:
+                if req_sock in self._dead:
+                    raise ConnectionError("connection to the experiment driver lost")
+                self._write(req_sock, msg)
+                return future.result(timeout)
+            except (socket.error, FutureTimeoutError) as e:
+                with self._waiters_lock:
+                    self._waiters.pop(msg["rid"], None)
                 tries += 1
                 if tries >= MAX_RETRIES:
                     raise
                 print("Socket error: {}".format(e))
-                req_sock.close()
-                req_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                req_sock.connect(self.server_addr)
-
-        resp = MessageSocket.receive(self, req_sock)
-
-        return resp
+                try:
+                    self._reconnect(req_sock)
+                except socket.error as e:
+                    # counts as a failed try, the next one reconnects again
+                    print("Reconnecting failed: {}".format(e))
 
     def close(self):
-        """Close the client's sockets."""
+        """Close the client's socket."""
+        try:
+            # wakes up the reader thread
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
         self.sock.close()
-        self.hb_sock.close()
 
     def register(self, registration):
         """
@@ -509,13 +1052,13 @@ class Client(MessageSocket):
         Returns:
 
         """
-        resp = self._request(self.sock, "REG", registration)
+        resp = self._request("REG", registration)
         return resp
 
     def await_reservations(self):
         done = False
         while not done:
-            done = self._request(self.sock, "QUERY").get("data", False)
+            done = self._request("QUERY").get("data", False)
             time.sleep(1)
         print("All executors registered: {}".format(done))
         return done
@@ -525,12 +1068,12 @@ class Client(MessageSocket):
 
             while not self.done:
 
-                metric, step, logs = report.get_data()
-                data = {"value": metric, "step": step}
+                with report.lock:
+                    metrics, dropped, logs = report.get_data()
+                    trial_id = report.get_trial_id()
+                data = {"batch": metrics, "dropped": dropped}
 
-                resp = self._request(
-                    self.hb_sock, "METRIC", data, report.get_trial_id(), logs
-                )
+                resp = self._request("METRIC", data, trial_id, logs)
                 _ = self._handle_message(resp, report)
 
                 # sleep one second
@@ -543,14 +1086,19 @@ class Client(MessageSocket):
         reporter.log("Started metric heartbeat", False)
 
     def get_suggestion(self, reporter):
-        """Blocking call to get new parameter combination."""
+        """Blocking call to get new parameter combination.
+
+        With a ``poll_timeout`` the server replies as soon as a trial is
+        assigned to this executor, otherwise the server is polled every second.
+        """
         while not self.done:
-            resp = self._request(self.sock, "GET")
+            resp = self._request("GET", self.poll_timeout or None)
             trial_id, parameters = self._handle_message(resp, reporter) or (None, None)
 
             if trial_id is not None:
                 break
-            time.sleep(1)
+            if not self.poll_timeout:
+                time.sleep(1)
         return trial_id, parameters
 
     def stop(self):
@@ -570,6 +1118,12 @@ class Client(MessageSocket):
 
         """
         msg_type = msg["type"]
+        # follow the heartbeat interval suggested by the server
+        hb_interval = msg.get("hb_interval")
+        if hb_interval is not None:
+            self.hb_interval = min(
+                self.hb_interval_max, max(self.hb_interval_min, hb_interval)
+            )
         # if response is STOP command, early stop the training
         if msg_type == "STOP":
             reporter.early_stop()
@@ -586,9 +1140,14 @@ class Client(MessageSocket):
         # make sure heartbeat thread can't send between sending final metric
         # and resetting the reporter
         with reporter.lock:
-            _, _, logs = reporter.get_data()
-            resp = self._request(
-                self.sock, "FINAL", metric, reporter.get_trial_id(), logs
-            )
+            metrics, dropped, logs = reporter.get_data()
+            if metrics or dropped:
+                # ship the metrics broadcasted since the last heartbeat
+                self._request(
+                    "METRIC",
+                    {"batch": metrics, "dropped": dropped},
+                    reporter.get_trial_id(),
+                )
+            resp = self._request("FINAL", metric, reporter.get_trial_id(), logs)
             reporter.reset()
         return resp
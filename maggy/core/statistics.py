@@ -0,0 +1,201 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+"""
+Streaming statistics over the final metrics of an experiment's trials.
+"""
+
+import math
+
+
+class P2Quantile(object):
+    """Estimates a quantile of a stream in constant memory with the P²
+    algorithm of Jain and Chlamtac.
+
+    Five markers track the minimum, the p/2, p and (1+p)/2 quantiles and the
+    maximum. Their heights are adjusted with a piecewise parabolic
+    interpolation as observations arrive. Up to five observations the
+    quantile is exact.
+    """
+
+    def __init__(self, p):
+        """
+        :param p: The quantile to estimate, between 0 and 1.
+        :type p: float
+        """
+        if not 0 <= p <= 1:
+            raise ValueError("Quantile has to be between 0 and 1, got {}".format(p))
+        self.p = p
+        self._initial = []
+        # marker heights, actual and desired marker positions
+        self._heights = None
+        self._positions = None
+        self._desired = None
+        self._increments = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def add(self, value):
+        """Adds an observation to the stream."""
+        if self._heights is None:
+            self._initial.append(value)
+            if len(self._initial) == 5:
+                p = self.p
+                self._heights = sorted(self._initial)
+                self._positions = [0, 1, 2, 3, 4]
+                self._desired = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+            return
+
+        heights = self._heights
+        positions = self._positions
+        if value < heights[0]:
+            heights[0] = value
+            cell = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            cell = 3
+        else:
+            cell = 0
+            while value >= heights[cell + 1]:
+                cell += 1
+
+        for i in range(cell + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # move the middle markers if they are off their desired position
+        for i in range(1, 4):
+            offset = self._desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or (
+                offset <= -1 and positions[i - 1] - positions[i] < -1
+            ):
+                step = 1 if offset > 0 else -1
+                height = self._parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = self._linear(i, step)
+                heights[i] = height
+                positions[i] += step
+
+    def _parabolic(self, i, step):
+        q = self._heights
+        n = self._positions
+        return q[i] + step / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def _linear(self, i, step):
+        q = self._heights
+        n = self._positions
+        return q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+
+    def value(self):
+        """Returns the estimated quantile, or None without observations."""
+        if self._heights is not None:
+            return self._heights[2]
+        if not self._initial:
+            return None
+        # interpolate between the closest ranks of the few observations
+        values = sorted(self._initial)
+        rank = self.p * (len(values) - 1)
+        lower = int(math.floor(rank))
+        upper = min(lower + 1, len(values) - 1)
+        return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class RunningStatistics(object):
+    """Running statistics of the final metrics of trials, updated in
+    constant time per trial.
+
+    Keeps the count, the mean and variance with Welford's algorithm, the
+    minimum and maximum together with the ids of the trials that produced
+    them, and P² estimates of the median and the 90th percentile. Optionally
+    keeps the list of all metrics for export.
+
+    Not thread-safe, only to be used by the experiment driver worker thread.
+    """
+
+    def __init__(self, keep_values=False):
+        """
+        :param keep_values: Keep all metrics to export them as list.
+        :type keep_values: bool
+        """
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = None
+        self.min_id = None
+        self.max = None
+        self.max_id = None
+        self._median = P2Quantile(0.5)
+        self._p90 = P2Quantile(0.9)
+        self.values = [] if keep_values else None
+
+    def update(self, value, trial_id=None):
+        """Adds the final metric ``value`` of the trial with ``trial_id``."""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+        # ties keep the trial that reached the value first
+        if self.min is None or value < self.min:
+            self.min = value
+            self.min_id = trial_id
+        if self.max is None or value > self.max:
+            self.max = value
+            self.max_id = trial_id
+
+        self._median.add(value)
+        self._p90.add(value)
+        if self.values is not None:
+            self.values.append(value)
+
+    @property
+    def variance(self):
+        """Sample variance, 0 for less than two values."""
+        if self.count < 2:
+            return 0.0
+        return self._m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def median(self):
+        return self._median.value()
+
+    @property
+    def p90(self):
+        return self._p90.value()
+
+    def to_dict(self):
+        """Returns the statistics as dictionary, including the list of values
+        if they are kept."""
+        stats = {
+            "count": self.count,
+            "mean": self.mean,
+            "std": self.std,
+            "min": self.min,
+            "min_id": self.min_id,
+            "max": self.max,
+            "max_id": self.max_id,
+            "median": self.median,
+            "p90": self.p90,
+        }
+        if self.values is not None:
+            stats["values"] = list(self.values)
+        return stats
@@ -0,0 +1,82 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+"""
+File system experiments write their logs and results to.
+
+Forwards to ``hops.hdfs`` unless an execution backend selects another file
+system with `use`, e.g. the local file system of the local backend.
+"""
+
+from hops import hdfs as hopshdfs
+
+_fs = hopshdfs
+
+
+def use(fs):
+    """Selects the file system of the current process.
+
+    :param fs: Module or object offering the functions of this module like
+        ``hops.hdfs``.
+    """
+    global _fs
+    _fs = fs
+
+
+def current():
+    """Returns the selected file system."""
+    return _fs
+
+
+def dump(data, path):
+    return _fs.dump(data, path)
+
+
+def load(path):
+    return _fs.load(path)
+
+
+def exists(path):
+    return _fs.exists(path)
+
+
+def mkdir(path):
+    return _fs.mkdir(path)
+
+
+def isdir(path):
+    return _fs.isdir(path)
+
+
+def ls(path):
+    return _fs.ls(path)
+
+
+def delete(path, recursive=False):
+    return _fs.delete(path, recursive=recursive)
+
+
+def open_file(path, flags="rw"):
+    return _fs.open_file(path, flags=flags)
+
+
+def project_path():
+    return _fs.project_path()
+
+
+def project_name():
+    return _fs.project_name()
@@ -0,0 +1,126 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+"""
+Timeline of the scheduling lifecycle of an experiment in the Chrome Trace
+Event format, to be viewed in Perfetto or chrome://tracing.
+"""
+
+import json
+
+from maggy import util
+
+
+class Timeline(object):
+    """Spans and instant events per executor, with one trace thread per
+    partition id (trial slot) of the executors.
+
+    Not thread-safe, only to be used by the experiment driver worker thread.
+    """
+
+    def __init__(self, max_events=1000000):
+        """
+        :param max_events: Maximum number of recorded events, further events
+            are dropped and counted in ``dropped``.
+        :type max_events: int
+        """
+        self.max_events = max_events
+        self._events = []
+        self._partitions = set()
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def _add(self, partition_id, event):
+        if len(self._events) >= self.max_events:
+            self.dropped += 1
+            return
+        self._partitions.add(partition_id)
+        event["pid"] = 0
+        event["tid"] = partition_id
+        self._events.append(event)
+
+    def span(self, partition_id, name, start, end, category, **args):
+        """Records a span from ``start`` to ``end`` in seconds since the
+        epoch, e.g. a trial running on the executor."""
+        if end < start:
+            return
+        self._add(
+            partition_id,
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": int(start * 1e6),
+                "dur": int((end - start) * 1e6),
+                "args": args,
+            },
+        )
+
+    def instant(self, partition_id, name, timestamp, category, **args):
+        """Records an event without duration, e.g. a registration."""
+        self._add(
+            partition_id,
+            {
+                "name": name,
+                "cat": category,
+                "ph": "i",
+                "s": "t",
+                "ts": int(timestamp * 1e6),
+                "args": args,
+            },
+        )
+
+    def dumps(self, name="maggy"):
+        """Serializes the timeline as Chrome Trace Event json object."""
+        metadata = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": 0,
+                "tid": 0,
+                "args": {"name": name},
+            }
+        ]
+        for partition_id in sorted(self._partitions):
+            metadata.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": 0,
+                    "tid": partition_id,
+                    "args": {"name": "executor {}".format(partition_id)},
+                }
+            )
+            metadata.append(
+                {
+                    "name": "thread_sort_index",
+                    "ph": "M",
+                    "pid": 0,
+                    "tid": partition_id,
+                    "args": {"sort_index": partition_id},
+                }
+            )
+        return json.dumps(
+            {
+                "traceEvents": metadata + self._events,
+                "displayTimeUnit": "ms",
+                "otherData": {"dropped_events": self.dropped},
+            },
+            default=util.json_default_numpy,
+        )
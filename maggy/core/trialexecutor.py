@@ -21,13 +21,13 @@ Module to produce the wrapper function to be executed by the executors.
 import builtins as __builtin__
 import inspect
 import json
+import threading
 import traceback
 
-from hops import hdfs as hopshdfs
 from hops.experiment_impl.util import experiment_utils
 
 from maggy import util, tensorboard
-from maggy.core import rpc, exceptions
+from maggy.core import rpc, exceptions, storage
 from maggy.core.reporter import Reporter
 
 
@@ -38,9 +38,15 @@ def _prepare_func(
     map_fun,
     server_addr,
     hb_interval,
+    hb_interval_min,
+    hb_interval_max,
     secret,
     optimization_key,
     log_dir,
+    poll_timeout,
+    metric_buffer_size,
+    metric_drop_policy,
+    trials_per_executor=1,
 ):
     def _wrapper_fun(iter):
         """
@@ -58,120 +64,177 @@ def _prepare_func(
         # get task context information to determine executor identifier
         partition_id, task_attempt = util.get_partition_attempt_id()
 
-        client = rpc.Client(
-            server_addr, partition_id, task_attempt, hb_interval, secret
-        )
-        log_file = (
-            log_dir
-            + "/executor_"
-            + str(partition_id)
-            + "_"
-            + str(task_attempt)
-            + ".log"
-        )
-
         # save the builtin print
         original_print = __builtin__.print
-
-        reporter = Reporter(log_file, partition_id, task_attempt, original_print)
+        # reporter of the trial slot running in the current thread
+        slot_context = threading.local()
+        reporters = []
 
         def maggy_print(*args, **kwargs):
             """Maggy custom print() function."""
             original_print(*args, **kwargs)
-            reporter.log(" ".join(str(x) for x in args), True)
+            reporter = getattr(slot_context, "reporter", None)
+            # threads started by the training function of a single slot
+            if reporter is None and len(reporters) == 1:
+                reporter = reporters[0]
+            if reporter is not None:
+                reporter.log(" ".join(str(x) for x in args), True)
 
         # override the builtin print
         __builtin__.print = maggy_print
 
-        try:
-            client_addr = client.client_addr
-
-            host_port = client_addr[0] + ":" + str(client_addr[1])
-
-            exec_spec = {}
-            exec_spec["partition_id"] = partition_id
-            exec_spec["task_attempt"] = task_attempt
-            exec_spec["host_port"] = host_port
-            exec_spec["trial_id"] = None
-
-            reporter.log("Registering with experiment driver", False)
-            client.register(exec_spec)
-
-            client.start_heartbeat(reporter)
-
-            # blocking
-            trial_id, parameters = client.get_suggestion(reporter)
-
-            while not client.done:
-                if experiment_type == "ablation":
-                    ablation_params = {
-                        "ablated_feature": parameters.get("ablated_feature", "None"),
-                        "ablated_layer": parameters.get("ablated_layer", "None"),
-                    }
-                    parameters.pop("ablated_feature")
-                    parameters.pop("ablated_layer")
-
-                tb_logdir = log_dir + "/" + trial_id
-                trial_log_file = tb_logdir + "/output.log"
-                reporter.set_trial_id(trial_id)
-
-                # If trial is repeated, delete trial directory, except log file
-                if hopshdfs.exists(tb_logdir):
-                    util._clean_dir(tb_logdir, [trial_log_file])
-                else:
-                    hopshdfs.mkdir(tb_logdir)
-
-                reporter.init_logger(trial_log_file)
-                tensorboard._register(tb_logdir)
-                if experiment_type == "ablation":
-                    hopshdfs.dump(
-                        json.dumps(ablation_params, default=util.json_default_numpy),
-                        tb_logdir + "/.hparams.json",
-                    )
-
-                else:
-                    hopshdfs.dump(
-                        json.dumps(parameters, default=util.json_default_numpy),
-                        tb_logdir + "/.hparams.json",
-                    )
-
-                try:
-                    reporter.log("Starting Trial: {}".format(trial_id), False)
-                    reporter.log("Trial Configuration: {}".format(parameters), False)
-
-                    if experiment_type == "optimization":
-                        tensorboard._write_hparams(parameters, trial_id)
-
-                    sig = inspect.signature(map_fun)
-                    if sig.parameters.get("reporter", None):
-                        retval = map_fun(**parameters, reporter=reporter)
-                    else:
-                        retval = map_fun(**parameters)
-
-                    if experiment_type == "optimization":
-                        tensorboard._write_session_end()
-
-                    retval = util._handle_return_val(
-                        retval, tb_logdir, optimization_key, trial_log_file
-                    )
-
-                except exceptions.EarlyStopException as e:
-                    retval = e.metric
-                    reporter.log("Early Stopped Trial.", False)
-
-                reporter.log("Finished Trial: {}".format(trial_id), False)
-                reporter.log("Final Metric: {}".format(retval), False)
-                client.finalize_metric(retval, reporter)
+        def _run_slot(slot):
+            """Runs trials one after the other in trial ``slot`` of this
+            executor, which is scheduled like an executor of its own."""
+            slot_id = partition_id * trials_per_executor + slot
+
+            client = rpc.Client(
+                server_addr,
+                slot_id,
+                task_attempt,
+                hb_interval,
+                secret,
+                poll_timeout=poll_timeout,
+                hb_interval_min=hb_interval_min,
+                hb_interval_max=hb_interval_max,
+            )
+            log_file = log_dir + "/executor_" + str(partition_id)
+            if trials_per_executor > 1:
+                log_file += "_" + str(slot)
+            log_file += "_" + str(task_attempt) + ".log"
+
+            reporter = Reporter(
+                log_file,
+                slot_id,
+                task_attempt,
+                original_print,
+                metric_buffer_size,
+                metric_drop_policy,
+            )
+            slot_context.reporter = reporter
+            reporters.append(reporter)
+
+            try:
+                client_addr = client.client_addr
+
+                host_port = client_addr[0] + ":" + str(client_addr[1])
+
+                exec_spec = {}
+                exec_spec["partition_id"] = slot_id
+                exec_spec["task_attempt"] = task_attempt
+                exec_spec["host_port"] = host_port
+                exec_spec["trial_id"] = None
+                exec_spec["slot"] = slot
+
+                reporter.log("Registering with experiment driver", False)
+                client.register(exec_spec)
+
+                client.start_heartbeat(reporter)
 
                 # blocking
                 trial_id, parameters = client.get_suggestion(reporter)
 
-        except:  # noqa: E722
-            reporter.log(traceback.format_exc(), False)
-            raise
-        finally:
-            reporter.close_logger()
-            client.stop()
-            client.close()
+                while not client.done:
+                    if experiment_type == "ablation":
+                        ablation_params = {
+                            "ablated_feature": parameters.get(
+                                "ablated_feature", "None"
+                            ),
+                            "ablated_layer": parameters.get("ablated_layer", "None"),
+                        }
+                        parameters.pop("ablated_feature")
+                        parameters.pop("ablated_layer")
+
+                    tb_logdir = log_dir + "/" + trial_id
+                    trial_log_file = tb_logdir + "/output.log"
+                    reporter.set_trial_id(trial_id)
+
+                    # If trial is repeated, delete trial directory, except log file
+                    if storage.exists(tb_logdir):
+                        util._clean_dir(tb_logdir, [trial_log_file])
+                    else:
+                        storage.mkdir(tb_logdir)
+
+                    reporter.init_logger(trial_log_file)
+                    tensorboard._register(tb_logdir)
+                    if experiment_type == "ablation":
+                        storage.dump(
+                            json.dumps(
+                                ablation_params, default=util.json_default_numpy
+                            ),
+                            tb_logdir + "/.hparams.json",
+                        )
+
+                    else:
+                        storage.dump(
+                            json.dumps(parameters, default=util.json_default_numpy),
+                            tb_logdir + "/.hparams.json",
+                        )
+
+                    try:
+                        reporter.log("Starting Trial: {}".format(trial_id), False)
+                        reporter.log(
+                            "Trial Configuration: {}".format(parameters), False
+                        )
+
+                        if experiment_type == "optimization":
+                            tensorboard._write_hparams(parameters, trial_id)
+
+                        sig = inspect.signature(map_fun)
+                        if sig.parameters.get("reporter", None):
+                            retval = map_fun(**parameters, reporter=reporter)
+                        else:
+                            retval = map_fun(**parameters)
+
+                        if experiment_type == "optimization":
+                            tensorboard._write_session_end()
+
+                        retval = util._handle_return_val(
+                            retval, tb_logdir, optimization_key, trial_log_file
+                        )
+
+                    except exceptions.EarlyStopException as e:
+                        retval = e.metric
+                        reporter.log("Early Stopped Trial.", False)
+
+                    reporter.log("Finished Trial: {}".format(trial_id), False)
+                    reporter.log("Final Metric: {}".format(retval), False)
+                    client.finalize_metric(retval, reporter)
+
+                    # blocking
+                    trial_id, parameters = client.get_suggestion(reporter)
+
+            except:  # noqa: E722
+                reporter.log(traceback.format_exc(), False)
+                raise
+            finally:
+                reporter.close_logger()
+                client.stop()
+                client.close()
+
+        if trials_per_executor == 1:
+            _run_slot(0)
+            return
+
+        # run the slots in threads, the training functions of small models
+        # spend most of their time in native code releasing the GIL
+        errors = []
+
+        def _run_thread(slot):
+            try:
+                _run_slot(slot)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=_run_thread, args=(slot,))
+            for slot in range(trials_per_executor)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
 
     return _wrapper_fun
@@ -0,0 +1,96 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+"""
+Accounting of the time executors spend on trials and waiting for them.
+"""
+
+
+class Utilization(object):
+    """Seconds per category and partition id (trial slot) of the executors.
+
+    The categories don't overlap, so together they add up to the wall time
+    of the experiment times the number of trial slots:
+
+    * busy: running trials that finalized with a result.
+    * wasted: running trials that were lost to a failure (BLACK), early
+      stopped or cancelled because their speculative copy won.
+    * gap: from the final metric of a trial until the next trial was
+      assigned, without idle time.
+    * idle: parked without work, and done while other executors still run.
+    * startup: from the start of the experiment until the executor
+      registered.
+
+    Not thread-safe, only to be used by the experiment driver worker thread.
+    """
+
+    CATEGORIES = ("busy", "wasted", "gap", "idle", "startup")
+
+    def __init__(self):
+        self._partitions = {}
+        self.totals = dict.fromkeys(Utilization.CATEGORIES, 0.0)
+
+    def __contains__(self, partition_id):
+        return partition_id in self._partitions
+
+    def add(self, partition_id, category, seconds):
+        if seconds <= 0:
+            return
+        partition = self._partitions.get(partition_id)
+        if partition is None:
+            partition = self._partitions[partition_id] = dict.fromkeys(
+                Utilization.CATEGORIES, 0.0
+            )
+        partition[category] += seconds
+        self.totals[category] += seconds
+
+    def partition(self, partition_id):
+        """Returns the seconds per category of ``partition_id``."""
+        return dict(
+            self._partitions.get(
+                partition_id, dict.fromkeys(Utilization.CATEGORIES, 0.0)
+            )
+        )
+
+    def to_dict(self, wall_time, num_slots):
+        """Returns the totals, the busy fraction of the available slot time
+        and the seconds per partition.
+
+        :param wall_time: Seconds the experiment ran.
+        :type wall_time: float
+        :param num_slots: Number of trial slots of all executors.
+        :type num_slots: int
+        """
+        capacity = wall_time * num_slots
+        return {
+            "total": dict(self.totals),
+            "busy_fraction": self.totals["busy"] / capacity if capacity > 0 else 0.0,
+            "partitions": {
+                str(partition_id): dict(seconds)
+                for partition_id, seconds in sorted(self._partitions.items())
+            },
+        }
+
+    def describe(self, wall_time, num_slots):
+        """Returns a line of the aggregate percentages of the slot time."""
+        capacity = wall_time * num_slots
+        if capacity <= 0:
+            return ""
+        return ", ".join(
+            "{} {:.1f}%".format(category, 100 * self.totals[category] / capacity)
+            for category in Utilization.CATEGORIES
+        )
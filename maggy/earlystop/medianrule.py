@@ -34,16 +34,19 @@ class MedianStoppingRule(AbstractEarlyStop):
             results = []
             median = None
 
-            # count step from zero so it can be used as index for array
-            step = len(trial.metric_history)
+            # compare at the same step, which stays aligned when learning
+            # curves are downsampled, unlike the number of metrics
+            step = trial.last_step()
 
-            if step > 0:
+            if step is not None:
 
                 for fin_trial in finalized_trials:
 
-                    if len(fin_trial.metric_history) >= step:
-                        avg = sum(fin_trial.metric_history[:step]) / float(step)
-                        results.append(avg)
+                    last_step = fin_trial.last_step()
+                    if last_step is not None and last_step >= step:
+                        avg = fin_trial.mean_metric(step)
+                        if avg is not None:
+                            results.append(avg)
 
                 try:
                     median = statistics.median(results)
@@ -56,10 +59,10 @@ class MedianStoppingRule(AbstractEarlyStop):
 
                 if median is not None:
                     if direction == "max":
-                        if max(trial.metric_history) < median:
+                        if trial.max_metric() < median:
                             stop.append(trial_id)
                     elif direction == "min":
-                        if min(trial.metric_history) > median:
+                        if trial.min_metric() > median:
                             stop.append(trial_id)
 
         return stop
@@ -24,21 +24,21 @@ experiment, see examples below. Whenever a function to run an experiment is
 invoked it is also registered in the Experiments service along with the
 provided information.
 """
-import os
 import atexit
+import math
 import time
 
-from hops import util as hopsutil
-from hops import hdfs as hopshdfs
 from hops.experiment_impl.util import experiment_utils
 
 from maggy import util, tensorboard
-from maggy.core import trialexecutor, experimentdriver
+from maggy.core import trialexecutor, experimentdriver, resultcache, storage
+from maggy.core.backends import get_backend
 
 app_id = None
 running = False
 run_id = 1
 experiment_json = None
+backend = None
 
 
 def lagom(
@@ -53,10 +53,28 @@ def lagom(
     ablator=None,
     optimization_key="metric",
     hb_interval=1,
+    hb_interval_min=None,
+    hb_interval_max=None,
     es_policy="median",
     es_interval=300,
     es_min=10,
     description="",
+    server_engine="select",
+    poll_timeout=30,
+    metric_buffer_size=1000,
+    metric_drop_policy="oldest",
+    export_metric_list=False,
+    resume=None,
+    result_cache=None,
+    result_cache_size=10000,
+    result_cache_ttl=None,
+    speculation=False,
+    prefetch_depth=1,
+    trials_per_executor=1,
+    execution_backend="spark",
+    metrics_port=None,
+    max_metric_history=None,
+    trial_id_scheme="md5",
 ):
     """Launches a maggy experiment, which depending on `experiment_type` can
     either be a hyperparameter optimization or an ablation study experiment.
@@ -96,6 +114,14 @@ def lagom(
     :param hb_interval: The heartbeat interval in seconds from trial executor
         to experiment driver, defaults to 1
     :type hb_interval: int, optional
+    :param hb_interval_min: Lower bound of the heartbeat interval in seconds.
+        If the bounds differ, the experiment driver adapts the heartbeat
+        interval of the executors to its load within them. Defaults to
+        `hb_interval`.
+    :type hb_interval_min: float, optional
+    :param hb_interval_max: Upper bound of the heartbeat interval in seconds,
+        defaults to `hb_interval`.
+    :type hb_interval_max: float, optional
     :param es_policy: The earlystopping policy, defaults to 'median'
     :type es_policy: str, optional
     :param es_interval: Frequency interval in seconds to check currently
@@ -106,6 +132,82 @@ def lagom(
     :type es_min: int, optional
     :param description: A longer description of the experiment.
     :type description: str, optional
+    :param server_engine: The socket server of the experiment driver, either
+        'select' (default) or 'asyncio'. Use 'asyncio' for experiments with
+        more than a few hundred executors.
+    :type server_engine: str, optional
+    :param poll_timeout: Seconds the experiment driver holds the request of an
+        executor for its next trial, replying as soon as a trial is assigned,
+        defaults to 30. Set to 0 to let executors poll every second instead.
+    :type poll_timeout: int, optional
+    :param metric_buffer_size: Maximum number of metrics an executor buffers
+        between two heartbeats, defaults to 1000.
+    :type metric_buffer_size: int, optional
+    :param metric_drop_policy: Which metrics to drop when the buffer is full,
+        either 'oldest' (default) or 'newest'.
+    :type metric_drop_policy: str, optional
+    :param export_metric_list: Include the final metrics of all trials as
+        `metric_list` in the result, defaults to False.
+    :type export_metric_list: bool, optional
+    :param resume: Log directory of an optimization experiment that was
+        interrupted, e.g. because the driver crashed. The experiment is
+        continued from its journal: finalized trials are kept and unfinished
+        trials are run again. The optimizer has to support resuming.
+    :type resume: str, optional
+    :param result_cache: Path of a file caching the results of trials across
+        optimization experiments. Trials that were evaluated before with the
+        same training function and optimization key are not run again, their
+        cached result is used. Defaults to None, no caching.
+    :type result_cache: str, optional
+    :param result_cache_size: Maximum number of cached results, the least
+        recently used ones are evicted, defaults to 10000.
+    :type result_cache_size: int, optional
+    :param result_cache_ttl: Seconds after which a cached result expires,
+        defaults to None, results don't expire.
+    :type result_cache_ttl: float, optional
+    :param speculation: Run a copy of trials that progress much slower than
+        the others on idle executors, and use the result of the one that
+        finishes first. The other one is stopped like an early stopped trial,
+        so the training function has to use the reporter. Defaults to False.
+    :type speculation: bool, optional
+    :param prefetch_depth: Number of trials queued for each executor ahead of
+        its current trial, so it can start the next one as soon as it
+        finalizes a trial, defaults to 1. Only used with optimizers that
+        support prefetching, such as 'randomsearch'. Set to 0 to disable.
+    :type prefetch_depth: int, optional
+    :param trials_per_executor: Number of trials each executor runs at the
+        same time in separate threads, defaults to 1. Useful for small models
+        that can't use all cores of an executor. Every trial has its own
+        reporter and heartbeat.
+    :type trials_per_executor: int, optional
+    :param execution_backend: Where the trials run, either 'spark' (default)
+        to run them on the Spark executors of the application, 'local' to run
+        them in one process per cpu of the local machine without Spark and
+        Hopsworks, or a backend object such as
+        `maggy.core.backends.LocalBackend(num_executors=4, root="/tmp")`. The
+        local backend writes the experiment directory below the current
+        working directory and doesn't register the experiment with Hopsworks.
+        Its processes import the main module again, so scripts have to guard
+        the experiment with ``if __name__ == "__main__":``.
+    :type execution_backend: str, SparkBackend, LocalBackend, optional
+    :param metrics_port: Port of an HTTP endpoint of the experiment driver
+        serving its metrics at `/metrics` in the Prometheus text format, such
+        as messages handled, handler latency and trials by status. Set to 0
+        to use a free port, which is logged. Defaults to None, no endpoint.
+    :type metrics_port: int, optional
+    :param max_metric_history: Maximum number of broadcasted metrics the
+        experiment driver keeps per trial. Beyond it, every second one of the
+        older metrics is dropped, which bounds the memory of experiments with
+        many trials and long learning curves. Early stopping then compares
+        downsampled curves. Defaults to None, all metrics are kept.
+    :type max_metric_history: int, optional
+    :param trial_id_scheme: Hash function of the trial ids, which name the
+        trial directories. Either 'md5' (default), the ids of earlier
+        versions, or 'blake2b', which hashes a canonical binary encoding of
+        the parameters and is faster for experiments with many trials.
+        Resumed experiments and experiments sharing a result cache have to
+        use the same scheme.
+    :type trial_id_scheme: str, optional
     :raises RuntimeError: An experiment is currently running.
     :return: A dictionary indicating the best trial and best hyperparameter
         combination with it's performance metric
@@ -116,14 +218,15 @@ def lagom(
         raise RuntimeError("An experiment is currently running.")
 
     job_start = time.time()
-    sc = hopsutil._find_spark().sparkContext
+    global backend
+    backend = get_backend(execution_backend)
     exp_driver = None
 
     try:
         global app_id
         global experiment_json
         global run_id
-        app_id = str(sc.applicationId)
+        app_id = backend.app_id()
 
         app_id, run_id = util._validate_ml_id(app_id, run_id)
 
@@ -131,23 +234,26 @@ def lagom(
         running = True
         experiment_utils._set_ml_id(app_id, run_id)
 
-        # create experiment dir
-        hopshdfs.mkdir(experiment_utils._get_logdir(app_id, run_id))
+        # create experiment dir, or continue in the one of the resumed run
+        log_dir = resume or backend.get_logdir(app_id, run_id)
+        storage.mkdir(log_dir)
 
-        tensorboard._register(experiment_utils._get_logdir(app_id, run_id))
+        tensorboard._register(log_dir)
 
-        num_executors = util.num_executors(sc)
+        num_executors = backend.num_executors()
 
         # start experiment driver
         if experiment_type == "optimization":
 
             assert num_trials > 0, "number of trials should be greater " + "than zero"
-            tensorboard._write_hparams_config(
-                experiment_utils._get_logdir(app_id, run_id), searchspace
-            )
+            tensorboard._write_hparams_config(log_dir, searchspace)
+
+            if num_executors * trials_per_executor > num_trials:
+                num_executors = int(math.ceil(num_trials / trials_per_executor))
 
-            if num_executors > num_trials:
-                num_executors = num_trials
+            cache_fingerprint = None
+            if result_cache:
+                cache_fingerprint = resultcache.fingerprint(map_fun, optimization_key)
 
             exp_driver = experimentdriver.ExperimentDriver(
                 "optimization",
@@ -157,12 +263,28 @@ def lagom(
                 num_trials=num_trials,
                 name=name,
                 num_executors=num_executors,
+                trials_per_executor=trials_per_executor,
                 hb_interval=hb_interval,
+                hb_interval_min=hb_interval_min,
+                hb_interval_max=hb_interval_max,
                 es_policy=es_policy,
                 es_interval=es_interval,
                 es_min=es_min,
                 description=description,
-                log_dir=experiment_utils._get_logdir(app_id, run_id),
+                log_dir=log_dir,
+                server_engine=server_engine,
+                export_metric_list=export_metric_list,
+                resume=resume is not None,
+                result_cache=result_cache,
+                result_cache_size=result_cache_size,
+                result_cache_ttl=result_cache_ttl,
+                cache_fingerprint=cache_fingerprint,
+                speculation=speculation,
+                prefetch_depth=prefetch_depth,
+                backend=backend,
+                metrics_port=metrics_port,
+                max_metric_history=max_metric_history,
+                trial_id_scheme=trial_id_scheme,
             )
 
             exp_function = exp_driver.optimizer.name()
@@ -174,9 +296,19 @@ def lagom(
                 ablator=ablator,
                 name=name,
                 num_executors=num_executors,
+                trials_per_executor=trials_per_executor,
                 hb_interval=hb_interval,
+                hb_interval_min=hb_interval_min,
+                hb_interval_max=hb_interval_max,
                 description=description,
-                log_dir=experiment_utils._get_logdir(app_id, run_id),
+                log_dir=log_dir,
+                server_engine=server_engine,
+                export_metric_list=export_metric_list,
+                resume=resume is not None,
+                backend=backend,
+                metrics_port=metrics_port,
+                max_metric_history=max_metric_history,
+                trial_id_scheme=trial_id_scheme,
             )
             # using exp_driver.num_executor since
             # it has been set using ablator.get_number_of_trials()
@@ -193,27 +325,19 @@ def lagom(
                 "But it is '{0}'".format(str(experiment_type))
             )
 
-        nodeRDD = sc.parallelize(range(num_executors), num_executors)
-
         # Do provenance after initializing exp_driver, because exp_driver does
         # the type checks for optimizer and searchspace
-        sc.setJobGroup(os.environ["ML_ID"], "{0} | {1}".format(name, exp_function))
-
-        experiment_json = experiment_utils._populate_experiment(
+        experiment_json = backend.start_experiment(
+            app_id,
+            run_id,
             name,
             exp_function,
-            "MAGGY",
             exp_driver.searchspace.json(),
             description,
-            app_id,
             direction,
             optimization_key,
         )
 
-        experiment_json = experiment_utils._attach_experiment_xattr(
-            app_id, run_id, experiment_json, "CREATE"
-        )
-
         util._log(
             "Started Maggy Experiment: {0}, {1}, run {2}".format(name, app_id, run_id)
         )
@@ -223,7 +347,7 @@ def lagom(
         server_addr = exp_driver.server_addr
 
         # Force execution on executor, since GPU is located on executor
-        nodeRDD.foreachPartition(
+        backend.run(
             trialexecutor._prepare_func(
                 app_id,
                 run_id,
@@ -231,26 +355,31 @@ def lagom(
                 map_fun,
                 server_addr,
                 hb_interval,
+                hb_interval_min,
+                hb_interval_max,
                 exp_driver._secret,
                 optimization_key,
-                experiment_utils._get_logdir(app_id, run_id),
-            )
+                log_dir,
+                poll_timeout,
+                metric_buffer_size,
+                metric_drop_policy,
+                trials_per_executor,
+            ),
+            num_executors,
         )
         job_end = time.time()
 
         result = exp_driver.finalize(job_end)
-        best_logdir = (
-            experiment_utils._get_logdir(app_id, run_id) + "/" + result["best_id"]
-        )
+        best_logdir = log_dir + "/" + result["best_id"]
 
-        util._finalize_experiment(
+        backend.finalize_experiment(
             experiment_json,
             float(result["best_val"]),
             app_id,
             run_id,
             "FINISHED",
             exp_driver.duration,
-            experiment_utils._get_logdir(app_id, run_id),
+            log_dir,
             best_logdir,
             optimization_key,
         )
@@ -276,7 +405,7 @@ def lagom(
             exp_driver.stop()
         run_id += 1
         running = False
-        sc.setJobGroup("", "")
+        backend.stop()
 
     return result
 
@@ -294,9 +423,7 @@ def _exception_handler(duration):
         if running and experiment_json is not None:
             experiment_json["state"] = "FAILED"
             experiment_json["duration"] = duration
-            experiment_utils._attach_experiment_xattr(
-                app_id, run_id, experiment_json, "REPLACE"
-            )
+            backend.update_experiment(app_id, run_id, experiment_json)
     except Exception as err:
         util._log(err)
 
@@ -310,9 +437,7 @@ def _exit_handler():
         global experiment_json
         if running and experiment_json is not None:
             experiment_json["status"] = "KILLED"
-            experiment_utils._attach_experiment_xattr(
-                app_id, run_id, experiment_json, "REPLACE"
-            )
+            backend.update_experiment(app_id, run_id, experiment_json)
     except Exception as err:
         util._log(err)
 
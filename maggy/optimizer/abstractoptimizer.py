@@ -50,5 +50,32 @@ class AbstractOptimizer(ABC):
         """
         pass
 
+    def prefetch(self):
+        """
+        Return a `Trial` to be queued for an executor before its current trial
+        is finalized, so it can start it right away, or `None` if the next
+        suggestion depends on the results of running trials. The experiment
+        driver only prefetches trials from optimizers implementing this.
+
+        :rtype: `Trial` or `None`
+        """
+        return None
+
+    def restore(self, trials):
+        """
+        Rebuilds the state of the optimizer when an experiment is resumed from
+        its journal, called after `initialize`. Unfinished trials are
+        dispatched again by the experiment driver, the optimizer must not
+        return them from `get_suggestion` a second time.
+
+        :param trials: All trials created before the experiment was
+            interrupted, in creation order. Finalized trials have the status
+            `Trial.FINALIZED`.
+        :type trials: list
+        """
+        raise NotImplementedError(
+            "{} does not support resuming experiments.".format(self.name())
+        )
+
     def name(self):
         return str(self.__class__.__name__)
@@ -14,6 +14,7 @@
 #   limitations under the License.
 #
 
+import json
 import math
 
 from maggy.optimizer.abstractoptimizer import AbstractOptimizer
@@ -155,6 +156,35 @@ class Asha(AbstractOptimizer):
         self.rungs[0].append(to_return)
         return to_return
 
+    def prefetch(self):
+        # a finalized trial can make a promotion possible, which has priority
+        # over new trials in the base rung
+        return None
+
+    def restore(self, trials):
+        self.rungs = {0: []}
+        self.promoted = {0: []}
+        # trials by rung and parameters without resource, to find the trial a
+        # promoted trial originates from
+        by_params = {}
+        for trial in trials:
+            params = trial.params.copy()
+            rung = int(
+                round(
+                    math.log(
+                        params.pop("resource") / self.resource_min,
+                        self.reduction_factor,
+                    )
+                )
+            )
+            key = json.dumps(params, sort_keys=True, default=str)
+            self.rungs.setdefault(rung, []).append(trial)
+            by_params[(rung, key)] = trial
+            if rung > 0:
+                origin = by_params.get((rung - 1, key))
+                if origin is not None:
+                    self.promoted.setdefault(rung - 1, []).append(origin.trial_id)
+
     def finalize_experiment(self, trials):
         return
 
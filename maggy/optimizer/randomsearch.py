@@ -46,5 +46,13 @@ class RandomSearch(AbstractOptimizer):
         else:
             return None
 
+    def prefetch(self):
+        # trials are sampled upfront, they don't depend on results
+        return self.get_suggestion()
+
+    def restore(self, trials):
+        # only sample as many new trials as are left
+        self.trial_buffer = self.trial_buffer[: max(0, self.num_trials - len(trials))]
+
     def finalize_experiment(self, trials):
         return
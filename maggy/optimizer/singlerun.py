@@ -33,5 +33,9 @@ class SingleRun(AbstractOptimizer):
         else:
             return None
 
+    def restore(self, trials):
+        # only sample as many new trials as are left
+        self.trial_buffer = self.trial_buffer[: max(0, self.num_trials - len(trials))]
+
     def finalize_experiment(self, trials):
         return
@@ -19,6 +19,8 @@ Module to encapsulate functionality related to writing to the tensorboard
 log dir and programmatically structure the outputs.
 """
 
+import threading
+
 import tensorflow.compat.v2 as tf
 from tensorboard.plugins.hparams import summary_v2 as hp
 from tensorboard.plugins.hparams import api_pb2
@@ -28,6 +30,10 @@ __import__("tensorflow").compat.v1.enable_eager_execution()
 
 _tensorboard_dir = None
 _writer = None
+# log dir and writer of the trial running in the current thread, when an
+# executor runs several trials at once. The module attributes hold the last
+# registered ones for threads started by the training function.
+_local = threading.local()
 
 
 def _register(trial_dir):
@@ -35,6 +41,8 @@ def _register(trial_dir):
     global _writer
     _tensorboard_dir = trial_dir
     _writer = tf.summary.create_file_writer(_tensorboard_dir)
+    _local.tensorboard_dir = _tensorboard_dir
+    _local.writer = _writer
 
 
 def logdir():
@@ -48,7 +56,7 @@ def logdir():
     :rtype: str
     """
     global _tensorboard_dir
-    return _tensorboard_dir
+    return getattr(_local, "tensorboard_dir", _tensorboard_dir)
 
 
 def _create_hparams_config(searchspace):
@@ -94,14 +102,17 @@ def _write_hparams_config(log_dir, searchspace):
 
 def _write_hparams(hparams, trial_id):
     global _writer
-    with _writer.as_default():
+    with getattr(_local, "writer", _writer).as_default():
         hp.hparams(hparams, trial_id)
 
 
 def _write_session_end():
     global _writer
-    with _writer.as_default():
+    writer = getattr(_local, "writer", _writer)
+    with writer.as_default():
         protob = summary.session_end_pb(api_pb2.STATUS_SUCCESS)
         raw_pb = protob.SerializeToString()
         tf.summary.experimental.write_raw_pb(raw_pb, step=0)
-    _writer = None
+    _local.writer = None
+    if _writer is writer:
+        _writer = None
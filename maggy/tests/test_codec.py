@@ -0,0 +1,96 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import pytest
+from pyspark import cloudpickle
+
+from maggy.core import codec
+
+
+def test_codec_metric():
+
+    msg = {
+        "partition_id": 3,
+        "type": "METRIC",
+        "secret": "f00ba4",
+        "trial_id": "3d1cc9fdb1d4d001",
+        "logs": None,
+        "data": {"value": 0.25, "step": 7},
+    }
+
+    data = codec.dumps(msg)
+    decoded, version = codec.loads(data)
+
+    assert version == codec.VERSION
+    assert decoded == msg
+    assert len(data) < len(cloudpickle.dumps(msg))
+
+
+def test_codec_extras():
+
+    # a step of type float does not fit the schema and is pickled instead
+    msg = {"type": "METRIC", "partition_id": 0, "data": {"value": 1, "step": 0.5}}
+    assert codec.loads(codec.dumps(msg))[0] == msg
+
+    # trial params containing code are cloudpickled
+    msg = {"type": "TRIAL", "trial_id": "x", "data": {"fn": lambda x: x + 1}}
+    decoded, _ = codec.loads(codec.dumps(msg))
+    assert decoded["data"]["fn"](1) == 2
+
+    msg = {"type": "UNKNOWN", "data": (1, 2)}
+    assert codec.loads(codec.dumps(msg))[0] == msg
+
+
+def test_codec_legacy():
+
+    msg = {"type": "LOG", "partition_id": -1, "secret": "s", "data": None}
+
+    decoded, version = codec.loads(cloudpickle.dumps(msg))
+    assert version == codec.LEGACY
+    assert decoded == msg
+    assert codec.dumps(msg, codec.LEGACY) == cloudpickle.dumps(msg)
+
+    with pytest.raises(ValueError):
+        codec.loads(b"\x00\x01\x02\x03")
+
+
+def test_codec_request_id():
+
+    msg = {"type": "GET", "partition_id": 1, "secret": "s", "data": 30, "rid": 42}
+    data = codec.dumps(msg)
+    assert codec.loads(data) == (msg, codec.VERSION)
+    assert b"\x00\x00\x00\x2a" in data
+
+    # peers speaking version 1 have no request id in the header
+    decoded, version = codec.loads(codec.dumps(msg, 1))
+    assert version == 1
+    assert decoded == msg
+
+
+def test_codec_handshake():
+
+    for msg in [{"type": "CHALLENGE"}, {"type": "AUTH", "data": b"\x00\xff" * 16}]:
+        assert codec.loads(codec.dumps(msg))[0] == msg
+
+
+def test_codec_metric_batch():
+
+    data = {"batch": [(0, 0.5), (1, 2), (2, None)], "dropped": 3}
+    msg = {"type": "METRIC", "partition_id": 0, "trial_id": None, "data": data}
+    encoded = codec.dumps(msg)
+
+    assert codec.loads(encoded)[0] == msg
+    assert len(encoded) < len(cloudpickle.dumps(msg))
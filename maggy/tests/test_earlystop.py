@@ -0,0 +1,46 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+from maggy.earlystop.medianrule import MedianStoppingRule
+from maggy.trial import Trial
+
+
+def _trial(x, metrics, max_history=None):
+    trial = Trial({"x": x})
+    trial.max_history = max_history
+    trial.append_metrics(enumerate(metrics))
+    return trial
+
+
+def test_median_rule():
+
+    finalized = [
+        _trial(1, [0.5] * 100, max_history=8),
+        _trial(2, [0.6] * 100, max_history=8),
+        _trial(3, [0.7] * 100, max_history=8),
+    ]
+    running = {
+        "slow": _trial(4, [0.1, 0.2, 0.55]),
+        "fast": _trial(5, [0.1, 0.2, 0.65]),
+        # further than the downsampled curves hold points
+        "long": _trial(6, [0.5] * 50 + [0.55]),
+        "high": _trial(7, [0.9, 0.8, 0.9]),
+    }
+
+    stop = MedianStoppingRule.earlystop_check(running, finalized, "max")
+    assert sorted(stop) == ["long", "slow"]
+    stop = MedianStoppingRule.earlystop_check(running, finalized, "min")
+    assert stop == ["high"]
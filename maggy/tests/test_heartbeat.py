@@ -0,0 +1,91 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import pytest
+
+from maggy import Searchspace
+from maggy.core import storage
+from maggy.core.backends import LocalBackend
+from maggy.core.experimentdriver import ExperimentDriver
+from maggy.core.localfs import LocalFileSystem
+
+
+@pytest.fixture
+def driver(tmp_path):
+    previous = storage.current()
+    storage.use(LocalFileSystem(str(tmp_path)))
+    driver = ExperimentDriver(
+        "optimization",
+        searchspace=Searchspace(x=("DOUBLE", [1, 5])),
+        optimizer="randomsearch",
+        num_trials=4,
+        num_executors=4,
+        hb_interval=1,
+        hb_interval_min=0.1,
+        hb_interval_max=10,
+        es_policy="none",
+        log_dir=str(tmp_path),
+        backend=LocalBackend(4, str(tmp_path)),
+    )
+    yield driver
+    driver.stop()
+    storage.use(previous)
+
+
+def test_suggest_hb_interval(driver):
+
+    # an idle driver lets the executors send heartbeats often
+    assert driver.suggest_hb_interval() == 0.1
+
+    # the heartbeats of all executors keep the worker busy half of the time
+    driver.msg_latency = 0.1
+    assert driver.suggest_hb_interval() == pytest.approx(0.8)
+    driver.msg_latency = 0.2
+    assert driver.suggest_hb_interval() == pytest.approx(1.6)
+
+    # and less often while messages queue up
+    for _ in range(4):
+        driver.add_message({"type": None})
+    assert driver.suggest_hb_interval() == pytest.approx(3.2)
+
+    driver.msg_latency = 1
+    assert driver.suggest_hb_interval() == 10
+
+
+def test_suggest_hb_interval_slots(tmp_path, driver):
+
+    # every trial slot sends heartbeats of its own
+    slots = ExperimentDriver(
+        "optimization",
+        searchspace=Searchspace(x=("DOUBLE", [1, 5])),
+        optimizer="randomsearch",
+        num_trials=8,
+        num_executors=4,
+        trials_per_executor=2,
+        hb_interval=1,
+        hb_interval_min=0.1,
+        hb_interval_max=10,
+        es_policy="none",
+        log_dir=str(tmp_path / "slots"),
+        backend=LocalBackend(4, str(tmp_path)),
+    )
+    try:
+        driver.msg_latency = slots.msg_latency = 0.1
+        assert slots.suggest_hb_interval() == pytest.approx(
+            2 * driver.suggest_hb_interval()
+        )
+    finally:
+        slots.stop()
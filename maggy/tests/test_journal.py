@@ -0,0 +1,200 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import time
+
+from maggy.core.journal import Journal
+from maggy.core.persistence import PersistencePipeline
+from maggy.trial import Trial
+
+
+class DictFs(object):
+    """In-memory stand-in for hops.hdfs."""
+
+    def __init__(self):
+        self.files = {}
+
+    def dump(self, data, path):
+        self.files[path] = data
+
+    def load(self, path):
+        return self.files[path]
+
+    def ls(self, directory):
+        return [p for p in self.files if p.startswith(directory + "/")]
+
+    def exists(self, path):
+        return path in self.files or bool(self.ls(path))
+
+    def delete(self, path):
+        del self.files[path]
+
+
+class SyncPipeline(object):
+    def __init__(self, fs):
+        self.fs = fs
+
+    def submit(self, data, path):
+        self.fs.dump(data, path)
+
+    def run(self, func, *args):
+        func(*args)
+
+
+def _journal(fs, **kwargs):
+    return Journal("exp/journal", SyncPipeline(fs), fs=fs, **kwargs)
+
+
+def _run_trials(journal):
+    trials = [Trial({"lr": lr}) for lr in (0.1, 0.2, 0.3)]
+    for i, trial in enumerate(trials):
+        journal.created(trial)
+        journal.maybe_flush()
+        journal.scheduled(trial.trial_id, i)
+        journal.maybe_flush()
+        journal.metrics(trial.trial_id, [(0, 0.5), (1, lr_metric(trial))])
+        journal.maybe_flush()
+    trials[1].final_metric = lr_metric(trials[1])
+    trials[1].duration = 10
+    trials[1].status = Trial.FINALIZED
+    journal.finalized(trials[1])
+    journal.maybe_flush()
+    return trials
+
+
+def lr_metric(trial):
+    return trial.params["lr"] * 2
+
+
+def test_journal_replay():
+
+    fs = DictFs()
+    journal = _journal(fs, flush_events=4)
+    trials = _run_trials(journal)
+    journal.flush()
+    assert len(fs.files) == 3
+
+    restored, final_order = _journal(fs).load()
+    assert list(restored) == [t.trial_id for t in trials]
+    assert final_order == [trials[1].trial_id]
+    finalized = restored[trials[1].trial_id]
+    assert finalized.status == Trial.FINALIZED
+    assert finalized.final_metric == 0.4
+    assert finalized.metric_dict == {0: 0.5, 1: 0.4}
+    assert restored[trials[0].trial_id].status == Trial.SCHEDULED
+
+
+def test_journal_snapshot():
+
+    fs = DictFs()
+    journal = _journal(fs, snapshot_events=5)
+    trials = _run_trials(journal)
+    assert list(fs.files) == ["exp/journal/snapshot-10.json"]
+
+    # events after the snapshot are replayed on top of it
+    resumed = _journal(fs)
+    resumed.load()
+    resumed.requeued(trials[0].trial_id)
+    resumed.flush()
+    assert "exp/journal/segment-11-11.jsonl" in fs.files
+
+    restored, final_order = _journal(fs).load()
+    assert restored[trials[0].trial_id].status == Trial.PENDING
+    assert restored[trials[0].trial_id].metric_history == []
+    assert final_order == [trials[1].trial_id]
+
+
+def test_journal_missing_segment():
+
+    fs = DictFs()
+    journal = _journal(fs, flush_events=2)
+    _run_trials(journal)
+    journal.flush()
+    fs.delete("exp/journal/segment-3-4.jsonl")
+
+    restored, _ = _journal(fs).load()
+    assert len(restored) == 1
+    assert sorted(fs.files) == ["exp/journal/segment-1-2.jsonl"]
+
+
+def test_journal_pipeline_order():
+
+    fs = DictFs()
+    dump = fs.dump
+
+    def _slow_dump(data, path):
+        # snapshots take longer to write than segments
+        if "snapshot" in path:
+            time.sleep(0.1)
+        dump(data, path)
+
+    pipeline = PersistencePipeline(_slow_dump, max_workers=1)
+    journal = Journal("exp/journal", pipeline, flush_events=1, fs=fs)
+    _run_trials(journal)
+    journal.compact()
+    pipeline.close()
+
+    assert list(fs.files) == ["exp/journal/snapshot-10.json"]
+
+
+class DeferredPipeline(object):
+    """Pipeline that runs the submitted jobs when told to."""
+
+    def __init__(self, fs):
+        self.fs = fs
+        self.jobs = []
+
+    def submit(self, data, path):
+        self.jobs.append((self.fs.dump, (data, path)))
+
+    def run(self, func, *args):
+        self.jobs.append((func, args))
+
+    def run_jobs(self):
+        for func, args in self.jobs:
+            func(*args)
+        self.jobs = []
+
+
+def test_journal_snapshot_serialized_by_pipeline(monkeypatch):
+
+    fs = DictFs()
+    pipeline = DeferredPipeline(fs)
+    journal = Journal("exp/journal", pipeline, fs=fs)
+    trials = _run_trials(journal)
+    journal.flush()
+    pipeline.run_jobs()
+    trials[0].append_metrics([(0, 0.5), (1, 0.2)])
+
+    # the calling thread only copies the trials
+    calls = []
+    to_dict = Trial.to_dict
+    monkeypatch.setattr(
+        Trial, "to_dict", lambda self, *a, **k: calls.append(self) or to_dict(self)
+    )
+    journal.compact()
+    assert calls == []
+    monkeypatch.undo()
+    # later changes are not part of the snapshot
+    trials[0].append_metrics([(2, 0.9)])
+    pipeline.run_jobs()
+
+    assert list(fs.files) == ["exp/journal/snapshot-10.json"]
+    snapshot = fs.files["exp/journal/snapshot-10.json"]
+    assert "metric_dict" not in snapshot
+    restored, _ = _journal(fs).load()
+    assert restored[trials[0].trial_id].step_history == [0, 1]
+    assert restored[trials[0].trial_id].metric_dict == {0: 0.5, 1: 0.2}
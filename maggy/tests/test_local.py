@@ -0,0 +1,104 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import glob
+import time
+import types
+
+import pytest
+
+from maggy import Searchspace, experiment
+from maggy.core import rpc, storage
+from maggy.core.backends import LocalBackend
+
+
+def _train(x, reporter):
+    # defined at module level, the executor processes unpickle it by name
+    for step in range(3):
+        reporter.broadcast(metric=x * step, step=step)
+        time.sleep(0.05 * x)
+    return x
+
+
+@pytest.fixture
+def local_run(tmp_path, monkeypatch):
+    # skip the grace period for sparkmagic at the end of the experiment
+    monkeypatch.setattr(
+        experiment, "time", types.SimpleNamespace(time=time.time, sleep=lambda s: 0)
+    )
+    # bind every experiment to a new port, the listener of the previous one
+    # closes its socket only when it wakes up next
+    monkeypatch.setattr(rpc, "server_host_port", None)
+    previous = storage.current()
+
+    def _run(num_executors, **kwargs):
+        result = experiment.lagom(
+            _train,
+            searchspace=Searchspace(x=("DOUBLE", [1, 5])),
+            optimizer="randomsearch",
+            es_policy="none",
+            hb_interval=0.2,
+            execution_backend=LocalBackend(num_executors, str(tmp_path)),
+            **kwargs
+        )
+        (log_dir,) = glob.glob(str(tmp_path / "Experiments" / "*"))
+        return result, log_dir
+
+    yield _run
+    storage.use(previous)
+
+
+def test_lagom_local_backend(local_run):
+
+    result, log_dir = local_run(3, num_trials=6)
+    assert result["num_trials"] == 6
+    assert 1 <= result["best_val"] <= 5
+    assert storage.exists(log_dir + "/" + result["best_id"] + "/.outputs.json")
+    # one executor process per partition
+    executor_logs = sorted(glob.glob(log_dir + "/executor_*.log"))
+    assert [log.rsplit("/", 1)[1] for log in executor_logs] == [
+        "executor_0_0.log",
+        "executor_1_0.log",
+        "executor_2_0.log",
+    ]
+
+
+def test_lagom_trials_per_executor(local_run):
+
+    # more trials than slots, so slots take over trials queued for others
+    result, log_dir = local_run(
+        2, num_trials=7, trials_per_executor=2, prefetch_depth=2
+    )
+    assert result["num_trials"] == 7
+    finished = []
+    for partition_id in range(2):
+        for slot in range(2):
+            log_file = "{}/executor_{}_{}_0.log".format(log_dir, partition_id, slot)
+            with open(log_file) as f:
+                lines = f.read().splitlines()
+            # every slot registers with the driver as an executor of its own
+            slot_id = partition_id * 2 + slot
+            assert all(
+                "({}/0):".format(slot_id) in line for line in lines if line.strip()
+            )
+            slot_finished = [
+                line.rsplit(" ", 2)[1] for line in lines if "Finished Trial:" in line
+            ]
+            assert slot_finished
+            finished += slot_finished
+    # each trial ran exactly once
+    assert len(finished) == 7
+    assert len(set(finished)) == 7
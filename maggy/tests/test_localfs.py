@@ -0,0 +1,52 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+from maggy.core import storage
+from maggy.core.localfs import LocalFileSystem
+
+
+def test_localfs(tmp_path):
+
+    fs = LocalFileSystem(str(tmp_path))
+    trial_dir = fs.project_path() + "Experiments/app_1/trial"
+    fs.mkdir(trial_dir)
+    fs.dump('{"lr": 0.1}', trial_dir + "/.hparams.json")
+    with fs.open_file(trial_dir + "/output.log", flags="w") as f:
+        f.write("Starting Trial".encode())
+
+    assert fs.isdir(trial_dir)
+    assert fs.load(trial_dir + "/.hparams.json") == b'{"lr": 0.1}'
+    assert fs.ls(trial_dir) == [
+        trial_dir + "/.hparams.json",
+        trial_dir + "/output.log",
+    ]
+
+    fs.delete(fs.project_path() + "Experiments", recursive=True)
+    assert not fs.exists(trial_dir)
+
+
+def test_storage_use(tmp_path):
+
+    previous = storage.current()
+    fs = LocalFileSystem(str(tmp_path))
+    storage.use(fs)
+    try:
+        storage.dump("log", str(tmp_path / "maggy.log"))
+        assert storage.exists(str(tmp_path / "maggy.log"))
+        assert storage.project_name() == tmp_path.name
+    finally:
+        storage.use(previous)
@@ -0,0 +1,45 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+from maggy.core.logbuffer import LogBuffer
+
+
+def test_logbuffer_drops_oldest():
+
+    logs = LogBuffer(10)
+    logs.append("0: a\n")
+    logs.append("1: b\n")
+    assert logs.nbytes == 10
+
+    logs.append("2: c\n")
+    assert len(logs) == 2
+    assert logs.dropped_chunks == 1
+    assert logs.dropped_bytes == 5
+
+    assert logs.drain() == "1: b\n2: c\n"
+    assert logs.drain() == ""
+    assert logs.nbytes == 0
+
+
+def test_logbuffer_large_chunk():
+
+    logs = LogBuffer(4)
+    logs.append("x")
+    logs.append("abcdef")
+
+    assert logs.drain() == "cdef"
+    assert logs.dropped_chunks == 1
+    assert logs.dropped_bytes == 3
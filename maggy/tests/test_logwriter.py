@@ -0,0 +1,102 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import io
+import threading
+import time
+
+from maggy.core.logwriter import AsyncLogWriter
+
+
+class _SlowFile(io.BytesIO):
+    """In-memory file whose writes block until ``release`` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.writes = []
+
+    def write(self, data):
+        self.release.wait()
+        self.writes.append(data)
+        return super().write(data)
+
+    def close(self):
+        self.closed_value = self.getvalue()
+        super().close()
+
+
+def test_logwriter_batches_on_size():
+
+    fd = _SlowFile()
+    fd.release.set()
+    writer = AsyncLogWriter(fd, batch_bytes=4, flush_interval=60)
+    writer.write(b"ab")
+    writer.write(b"cd")
+    writer.write(b"e")
+    writer.close()
+
+    assert fd.writes == [b"abcd", b"e"]
+    assert fd.closed_value == b"abcde"
+    assert writer.writes == 2
+
+
+def test_logwriter_never_blocks():
+
+    fd = _SlowFile()
+    writer = AsyncLogWriter(fd, max_queue=2, batch_bytes=1, flush_interval=60)
+    writer.write(b"a")
+    # wait until the writer thread is stuck writing "a"
+    while writer.queue_depth > 0:
+        time.sleep(0.01)
+
+    start = time.monotonic()
+    for _ in range(5):
+        writer.write(b"b")
+    assert time.monotonic() - start < 1
+    assert writer.queue_depth == 2
+    assert writer.dropped == 3
+
+    fd.release.set()
+    writer.close()
+    assert fd.closed_value.startswith(b"abb")
+    assert b"dropped 3 messages" in fd.closed_value
+
+
+def test_logwriter_flushes_on_time():
+
+    fd = _SlowFile()
+    fd.release.set()
+    writer = AsyncLogWriter(fd, batch_bytes=1024, flush_interval=0.05)
+    writer.write(b"a")
+    time.sleep(0.5)
+
+    assert fd.writes == [b"a"]
+    writer.close()
+
+
+def test_logwriter_flushes_on_time_under_load():
+
+    fd = _SlowFile()
+    fd.release.set()
+    writer = AsyncLogWriter(fd, batch_bytes=1 << 20, flush_interval=0.05)
+    # messages keep arriving, so the queue never runs empty
+    start = time.monotonic()
+    while time.monotonic() - start < 0.5:
+        writer.write(b"a")
+
+    assert len(fd.writes) >= 2
+    writer.close()
@@ -0,0 +1,63 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+import urllib.request
+
+from maggy.core.metrics import MetricsRegistry, MetricsServer
+
+
+def test_metrics_render():
+
+    registry = MetricsRegistry()
+    messages = registry.counter("maggy_messages_total", "Messages by type.")
+    latency = registry.histogram("maggy_latency_seconds", "Latency.", (0.1, 1.0))
+    registry.gauge("maggy_queue_depth", "Queue depth.", lambda: 3)
+    messages.inc(type="METRIC")
+    messages.inc(2, type="METRIC")
+    messages.inc(type="FINAL")
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5.0)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE maggy_messages_total counter" in lines
+    assert 'maggy_messages_total{type="FINAL"} 1.0' in lines
+    assert 'maggy_messages_total{type="METRIC"} 3.0' in lines
+    assert 'maggy_latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'maggy_latency_seconds_bucket{le="1.0"} 2' in lines
+    assert 'maggy_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "maggy_latency_seconds_sum 5.55" in lines
+    assert "maggy_latency_seconds_count 3" in lines
+    assert "maggy_queue_depth 3.0" in lines
+
+
+def test_metrics_server():
+
+    registry = MetricsRegistry()
+    registry.gauge(
+        "maggy_trials", "Trials by status.", lambda: {(("status", "RUNNING"),): 2}
+    )
+    server = MetricsServer(registry, host="127.0.0.1")
+    port = server.start()
+    try:
+        url = "http://127.0.0.1:{}/metrics".format(port)
+        with urllib.request.urlopen(url, timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            body = response.read().decode()
+    finally:
+        server.stop()
+    assert 'maggy_trials{status="RUNNING"} 2.0' in body.splitlines()
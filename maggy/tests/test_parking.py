@@ -0,0 +1,47 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+from maggy.core.parking import IdleParking
+
+
+def test_parking_deadlines():
+
+    parking = IdleParking(1.0)
+    parking.park(0, now=10.0)
+    parking.park(1, now=10.5)
+
+    assert len(parking) == 2
+    assert parking.next_deadline() == 11.0
+    assert parking.due(now=10.9) == []
+    assert parking.due(now=11.0) == [0]
+
+    # renewing the deadline invalidates the old heap entry
+    parking.park(1, now=11.2)
+    assert parking.due(now=11.6) == []
+    assert parking.next_deadline() == 12.2
+
+
+def test_parking_time():
+
+    parking = IdleParking(1.0)
+    parking.park(0, now=10.0)
+    parking.park(0, now=11.0)
+
+    assert parking.parked() == [0]
+    assert parking.unpark(0, now=12.5) == 2.5
+    assert parking.unpark(0, now=13.0) is None
+    assert parking.parked_time == {0: 2.5}
+    assert parking.next_deadline() is None
@@ -0,0 +1,59 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import threading
+
+from maggy.core.persistence import PersistencePipeline
+
+
+def test_persistence_flush():
+
+    release = threading.Event()
+    written = {}
+
+    def dump(data, path):
+        release.wait()
+        written[path] = data
+
+    pipeline = PersistencePipeline(dump, max_workers=2)
+    for i in range(5):
+        pipeline.submit(str(i), "trial_{}.json".format(i))
+
+    assert not pipeline.flush(timeout=0.1)
+    release.set()
+    assert pipeline.flush()
+    assert written == {"trial_{}.json".format(i): str(i) for i in range(5)}
+    assert pipeline.written == 5
+    pipeline.close()
+
+
+def test_persistence_retries():
+
+    attempts = []
+
+    def dump(data, path):
+        attempts.append(path)
+        if path == "broken" or len(attempts) < 2:
+            raise IOError("unavailable")
+
+    pipeline = PersistencePipeline(dump, max_workers=1, retry_delay=0)
+    pipeline.submit("{}", "result.json")
+    pipeline.submit("{}", "broken")
+    pipeline.close()
+
+    assert pipeline.written == 1
+    assert pipeline.retries == 1 + pipeline.max_retries
+    assert [path for path, _ in pipeline.failed] == ["broken"]
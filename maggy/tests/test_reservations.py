@@ -0,0 +1,59 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+from maggy.core.rpc import Reservations
+
+
+def _register(reservations, partition_id):
+    reservations.add(
+        {
+            "partition_id": partition_id,
+            "host_port": "localhost:{}".format(partition_id),
+            "task_attempt": 0,
+            "trial_id": None,
+        }
+    )
+
+
+def test_reservations_prefetch():
+
+    reservations = Reservations(2)
+    _register(reservations, 0)
+    _register(reservations, 1)
+    reservations.assign_trial(0, "a")
+    reservations.prefetch_trial(0, "b")
+    reservations.prefetch_trial(0, "c")
+    assert reservations.num_prefetched(0) == 2
+
+    # the executor continues with the next queued trial
+    assert reservations.next_prefetched(0) == "b"
+    assert reservations.get_assigned_trial(0) == "b"
+
+    # an idle executor takes over the remaining queued trial
+    assert reservations.steal_prefetched() == "c"
+    assert reservations.steal_prefetched() is None
+    assert reservations.next_prefetched(0) is None
+    assert reservations.get_assigned_trial(0) is None
+
+
+def test_reservations_keep_prefetched():
+
+    reservations = Reservations(1)
+    _register(reservations, 0)
+    reservations.prefetch_trial(0, "a")
+    # a re-registering executor keeps its queued trials
+    _register(reservations, 0)
+    assert reservations.num_prefetched(0) == 1
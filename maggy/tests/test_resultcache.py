@@ -0,0 +1,78 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+from maggy.core.resultcache import ResultCache, fingerprint
+from maggy.trial import Trial
+
+
+class EmptyFs(object):
+    @staticmethod
+    def exists(path):
+        return False
+
+
+def _finalized(lr, metric):
+    trial = Trial({"lr": lr})
+    trial.append_metrics([(0, metric / 2), (1, metric)])
+    trial.final_metric = metric
+    trial.duration = 100
+    trial.status = Trial.FINALIZED
+    return trial
+
+
+def test_resultcache_lru():
+
+    cache = ResultCache("cache.json", "exp", max_entries=2, fs=EmptyFs)
+    first, second, third = (_finalized(lr, lr * 10) for lr in (0.1, 0.2, 0.3))
+    cache.put(first)
+    cache.put(second)
+    assert cache.get(first.trial_id)["final_metric"] == 1.0
+    # second is the least recently used one now
+    cache.put(third)
+
+    assert cache.get(second.trial_id) is None
+    assert cache.get(third.trial_id)["metric_history"] == [1.5, 3.0]
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # other experiments don't share results
+    other = ResultCache("cache.json", "other", fs=EmptyFs)
+    other.loads(cache.dumps())
+    assert len(other) == 2
+    assert other.get(first.trial_id) is None
+
+
+def test_resultcache_ttl():
+
+    cache = ResultCache("cache.json", "exp", ttl=60, fs=EmptyFs)
+    trial = _finalized(0.1, 1.0)
+    cache.put(trial)
+    assert cache.get(trial.trial_id) is not None
+
+    cache._entries["exp/" + trial.trial_id]["time"] -= 61
+    assert cache.get(trial.trial_id) is None
+    assert len(cache) == 0
+
+
+def test_fingerprint():
+    def train(lr):
+        return lr
+
+    def other(lr):
+        return -lr
+
+    assert fingerprint(train, "metric") == fingerprint(train, "metric")
+    assert fingerprint(train, "metric") != fingerprint(train, "loss")
+    assert fingerprint(train, "metric") != fingerprint(other, "metric")
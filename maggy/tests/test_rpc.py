@@ -0,0 +1,357 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import socket
+import threading
+import time
+
+import pytest
+
+from maggy.core import metrics, rpc
+from maggy.trial import Trial
+
+
+class FakeDriver(object):
+    """Implements the parts of ``ExperimentDriver`` the server relies on."""
+
+    experiment_type = "optimization"
+    experiment_done = False
+    num_trials = 1
+    hb_interval_min = 1
+    hb_interval_max = 1
+
+    def __init__(self, with_metrics=True):
+        self._secret = "secret"
+        self.messages = []
+        self.trials = {}
+        self.lock = threading.Lock()
+        if with_metrics:
+            registry = metrics.MetricsRegistry()
+            self.message_count = registry.counter("messages", "")
+            self.message_latency = registry.histogram("latency", "")
+
+    def add_message(self, msg):
+        with self.lock:
+            self.messages.append(msg)
+
+    def get_trial(self, trial_id):
+        return self.trials[trial_id]
+
+    def _log(self, log_msg):
+        pass
+
+
+def _drop(server, msg_type, drops):
+    """Makes ``server`` close the connection instead of answering the next
+    ``drops`` messages of type ``msg_type``."""
+    dispatch = server._dispatch
+    remaining = [drops]
+
+    def _dispatch(sock, msg, exp_driver):
+        if msg["type"] != msg_type or remaining[0] == 0:
+            return dispatch(sock, msg, exp_driver)
+        remaining[0] -= 1
+        if isinstance(sock, socket.socket):
+            # the select loop closes the socket when it notices
+            sock.shutdown(socket.SHUT_RDWR)
+        else:
+            sock.close()
+
+    server._dispatch = _dispatch
+
+
+def _free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture
+def server_addr(monkeypatch):
+    # bind to localhost without registering with Hopsworks
+    monkeypatch.setattr(rpc, "server_host_port", ("127.0.0.1", _free_port()))
+    return rpc.server_host_port
+
+
+@pytest.fixture(params=[rpc.Server, rpc.AsyncServer])
+def engine(request):
+    return request.param
+
+
+def _client(server_addr, partition_id=0, secret="secret"):
+    return rpc.Client(server_addr, partition_id, 0, 1, secret)
+
+
+def _register(server, partition_id):
+    server.reservations.add(
+        {
+            "partition_id": partition_id,
+            "host_port": "",
+            "task_attempt": 0,
+            "trial_id": None,
+        }
+    )
+
+
+def test_client_concurrent_requests(server_addr, engine):
+
+    server = engine(1)
+    driver = FakeDriver()
+    server.start(driver)
+    client = _client(server_addr)
+    try:
+        # a waiting GET does not block the requests of other threads
+        get = threading.Thread(target=client._request, args=("GET", 2))
+        get.start()
+        replies = []
+
+        def _query():
+            for _ in range(20):
+                replies.append(client._request("QUERY")["type"])
+
+        threads = [threading.Thread(target=_query) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert replies == ["QUERY"] * 80
+        assert get.is_alive()
+        get.join()
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_client_reconnects(server_addr, engine):
+
+    server = engine(1)
+    _drop(server, "QUERY", 1)
+    driver = FakeDriver()
+    server.start(driver)
+    client = _client(server_addr)
+    try:
+        first_sock = client.sock
+        # the waiting GET fails with the dropped connection and is retried
+        get_reply = []
+        get = threading.Thread(
+            target=lambda: get_reply.append(client._request("GET", 1))
+        )
+        get.start()
+        assert client._request("QUERY")["type"] == "QUERY"
+        get.join(5)
+        assert get_reply and get_reply[0]["type"] == "TRIAL"
+        assert client.sock is not first_sock
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_client_server_disconnect(server_addr, engine):
+
+    server = engine(1)
+    _drop(server, "QUERY", rpc.MAX_RETRIES)
+    driver = FakeDriver()
+    server.start(driver)
+    client = _client(server_addr)
+    try:
+        # the request fails instead of waiting for a reply forever
+        with pytest.raises(ConnectionError):
+            client._request("QUERY")
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_client_final_retry_not_repeated(server_addr, engine):
+
+    server = engine(1)
+    driver = FakeDriver()
+    server.start(driver)
+    _register(server, 0)
+    server.reservations.assign_trial(0, "a")
+    client = _client(server_addr)
+    try:
+        client._request("FINAL", 0.5, "a")
+        # the same request again, as sent by a client that lost the reply
+        client._last_rid -= 1
+        client._request("FINAL", 0.5, "a")
+        assert len(driver.messages) == 1
+        client.close()
+
+        # a new client of the executor starts with the same request ids
+        client = _client(server_addr)
+        client.register(
+            {"partition_id": 0, "host_port": "", "task_attempt": 1, "trial_id": None}
+        )
+        server.reservations.assign_trial(0, "b")
+        client._last_rid = 0
+        client._request("FINAL", 0.5, "b")
+        assert len(driver.messages) == 3
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_long_poll_get_answered(server_addr, engine):
+
+    server = engine(1)
+    driver = FakeDriver()
+    server.start(driver)
+    _register(server, 0)
+    client = _client(server_addr)
+    try:
+        replies = []
+        get = threading.Thread(
+            target=lambda: replies.append(client._request("GET", 10))
+        )
+        get.start()
+        time.sleep(0.2)
+        assert not replies
+        # the waiting GET is answered as soon as a trial is assigned
+        trial = Trial({"x": 1})
+        driver.trials[trial.trial_id] = trial
+        server.reservations.assign_trial(0, trial.trial_id)
+        get.join(2)
+        assert replies[0]["type"] == "TRIAL"
+        assert replies[0]["trial_id"] == trial.trial_id
+        assert replies[0]["data"] == {"x": 1}
+        assert trial.status == Trial.RUNNING
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_long_poll_get_timeout(server_addr, engine):
+
+    server = engine(1)
+    driver = FakeDriver()
+    server.start(driver)
+    _register(server, 0)
+    client = _client(server_addr)
+    try:
+        start = time.monotonic()
+        reply = client._request("GET", 0.5)
+        assert time.monotonic() - start >= 0.45
+        # no trial was assigned in time
+        assert reply["type"] == "TRIAL"
+        assert reply["trial_id"] is None
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_handshake_wrong_secret(server_addr, engine):
+
+    server = engine(1)
+    driver = FakeDriver()
+    server.start(driver)
+    try:
+        # the server closes the connection instead of confirming the handshake
+        with pytest.raises(Exception, match="closed|reset"):
+            _client(server_addr, secret="wrong")
+        # unauthenticated messages without the secret are not answered either
+        sock = socket.create_connection(server_addr)
+        rpc.MessageSocket().send(sock, {"type": "QUERY", "partition_id": 0})
+        sock.settimeout(5)
+        with pytest.raises(Exception, match="closed|reset"):
+            rpc.MessageSocket().receive(sock)
+        sock.close()
+        assert not driver.messages
+        client = _client(server_addr)
+        assert client._request("QUERY")["type"] == "QUERY"
+        client.close()
+    finally:
+        server.stop()
+
+
+def test_metric_without_batch(server_addr, engine):
+
+    server = engine(1)
+    driver = FakeDriver()
+    server.start(driver)
+    trial = Trial({"x": 1})
+    driver.trials[trial.trial_id] = trial
+    client = _client(server_addr)
+    try:
+        # heartbeats of clients that send the latest metric only
+        client._request("METRIC", {"value": 0.5, "step": 3}, trial.trial_id)
+        client._request("METRIC", {"value": None, "step": None}, trial.trial_id)
+        assert [msg["data"] for msg in driver.messages] == [
+            {"batch": [(3, 0.5)], "dropped": 0},
+            {"batch": [], "dropped": 0},
+        ]
+    finally:
+        client.close()
+        server.stop()
+
+
+@pytest.mark.parametrize("with_metrics", [True, False])
+def test_server_metrics(server_addr, engine, with_metrics):
+
+    server = engine(1)
+    driver = FakeDriver(with_metrics)
+    server.start(driver)
+    client = _client(server_addr)
+    try:
+        # drivers without metrics are served all the same
+        assert client._request("QUERY")["type"] == "QUERY"
+        assert client._request("QUERY")["type"] == "QUERY"
+        if with_metrics:
+            # messages are counted after the reply was sent
+            deadline = time.monotonic() + 5
+            while (
+                driver.message_count.get(type="QUERY") < 2
+                and time.monotonic() < deadline
+            ):
+                time.sleep(0.01)
+            assert driver.message_count.get(type="QUERY") == 2
+    finally:
+        client.close()
+        server.stop()
+
+
+def test_hb_interval_suggestion(server_addr, engine):
+
+    server = engine(1)
+    driver = FakeDriver()
+    driver.hb_interval_max = 5
+    driver.suggest_hb_interval = lambda: 30
+    server.start(driver)
+    client = rpc.Client(
+        server_addr, 0, 0, 1, "secret", hb_interval_min=0.5, hb_interval_max=5
+    )
+    try:
+        reply = client._request("METRIC", None, None)
+        assert reply["hb_interval"] == 30
+        # the client keeps the suggestion within its own bounds
+        client._handle_message(reply)
+        assert client.hb_interval == 5
+        client._handle_message({"type": "OK", "hb_interval": 0.1})
+        assert client.hb_interval == 0.5
+        client._handle_message({"type": "OK", "hb_interval": 2})
+        assert client.hb_interval == 2
+        # replies without a suggestion keep the interval
+        client._handle_message({"type": "OK"})
+        assert client.hb_interval == 2
+
+        # a fixed interval is not suggested
+        driver.hb_interval_max = driver.hb_interval_min
+        assert "hb_interval" not in client._request("METRIC", None, None)
+    finally:
+        client.close()
+        server.stop()
@@ -0,0 +1,190 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import socket
+import time
+
+import pytest
+
+from maggy import Searchspace
+from maggy.core import rpc, storage
+from maggy.core.backends import LocalBackend
+from maggy.core.experimentdriver import ExperimentDriver
+from maggy.core.localfs import LocalFileSystem
+from maggy.trial import Trial
+
+
+def _free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture
+def driver(tmp_path, monkeypatch):
+    # bind to localhost without registering with Hopsworks
+    monkeypatch.setattr(rpc, "server_host_port", ("127.0.0.1", _free_port()))
+    previous = storage.current()
+    storage.use(LocalFileSystem(str(tmp_path)))
+    driver = ExperimentDriver(
+        "optimization",
+        searchspace=Searchspace(x=("DOUBLE", [1, 5])),
+        optimizer="randomsearch",
+        num_trials=4,
+        num_executors=3,
+        hb_interval=1,
+        es_policy="none",
+        speculation=True,
+        prefetch_depth=0,
+        log_dir=str(tmp_path),
+        backend=LocalBackend(3, str(tmp_path)),
+    )
+    for partition_id in range(3):
+        driver.server.reservations.add(
+            {
+                "partition_id": partition_id,
+                "host_port": "",
+                "task_attempt": 0,
+                "trial_id": None,
+            }
+        )
+    yield driver
+    driver.stop()
+    storage.use(previous)
+
+
+def _running(driver, partition_id, trial, started):
+    driver._assign_trial(partition_id, trial)
+    with trial.lock:
+        trial.status = Trial.RUNNING
+        trial.start = started
+
+
+def _straggler(driver):
+    """Runs a trial on executor 0 that is much slower than the finalized
+    ones and launches its speculative copy on the parked executor 1."""
+    trial = Trial({"x": 1.0})
+    _running(driver, 0, trial, time.time() - 100)
+    # finalized trials took a second for 10 steps
+    driver._run_times.update(1.0)
+    driver._step_rates.update(10.0)
+    driver._idle.park(1)
+
+    driver._speculate()
+
+    copy_id = trial.trial_id + ExperimentDriver.SPECULATIVE_SUFFIX
+    assert driver._speculative == {copy_id: trial}
+    assert driver.server.reservations.get_assigned_trial(1) == copy_id
+    assert 1 not in driver._idle.parked()
+    copy = driver.get_trial(copy_id)
+    with copy.lock:
+        copy.status = Trial.RUNNING
+    return trial, copy
+
+
+def test_speculate_stragglers_only(driver):
+
+    trial = Trial({"x": 2.0})
+    _running(driver, 2, trial, time.time() - 100)
+    trial.append_metrics([(step, 0.5) for step in range(2000)])
+    _straggler(driver)
+    # the trial with a normal step rate, and the copies, are not copied
+    driver._speculation_check = 0
+    driver._idle.park(2)
+    driver._speculate()
+    assert len(driver._speculative) == 1
+    assert driver.speculative_launches == 1
+
+
+def test_copy_wins(driver):
+
+    trial, copy = _straggler(driver)
+    copy.append_metrics([(0, 0.1), (1, 0.2)])
+
+    assert driver._resolve_run(copy.trial_id) is trial
+    assert driver.speculative_wins == 1
+    assert trial.metric_history == [0.1, 0.2]
+    # the original run is stopped through an object of its own
+    assert trial.trial_id in driver._cancelled
+    attempt = driver.get_trial(trial.trial_id)
+    assert attempt is not trial
+    assert attempt.early_stop
+    assert attempt.start == trial.start
+    assert not trial.early_stop
+
+    # the final metric of the stopped original is discarded
+    assert driver._resolve_run(trial.trial_id) is None
+    assert not driver._cancelled
+    assert not driver._trial_store
+
+
+def test_original_wins(driver):
+
+    trial, copy = _straggler(driver)
+
+    assert driver._resolve_run(trial.trial_id) is trial
+    assert driver.speculative_wins == 0
+    assert not driver._speculative
+    assert copy.trial_id in driver._cancelled
+    assert copy.early_stop
+    assert driver.get_trial(copy.trial_id) is copy
+
+    assert driver._resolve_run(copy.trial_id) is None
+    assert not driver._cancelled
+    assert not driver._trial_store
+
+
+def test_cancelled_final_discarded(driver):
+
+    trial, copy = _straggler(driver)
+    driver.init(time.time())
+    driver.add_message(
+        {"type": "FINAL", "partition_id": 1, "trial_id": copy.trial_id, "data": 0.75}
+    )
+    driver.add_message(
+        {"type": "FINAL", "partition_id": 0, "trial_id": trial.trial_id, "data": 0.25}
+    )
+
+    deadline = time.monotonic() + 5
+    while trial.trial_id in driver._trial_store and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert driver.exception is None
+    assert driver._final_store == [trial]
+    assert trial.final_metric == 0.75
+    assert driver.result["num_trials"] == 1
+    assert not driver._cancelled
+
+
+def test_unfinished_keeps_parked_executors(driver, monkeypatch):
+
+    # the optimizer has no more trials
+    monkeypatch.setattr(driver, "_get_suggestion", lambda *args, **kwargs: None)
+    trial, copy = _straggler(driver)
+
+    # executor 2 is kept for copies while the straggler runs
+    assert driver._unfinished()
+    driver._schedule_next(2)
+    assert driver._idle.parked() == [2]
+    assert not driver.experiment_done
+
+    # cancelled runs don't keep executors
+    driver._resolve_run(copy.trial_id)
+    assert not driver._unfinished()
+    driver._schedule_next(1)
+    assert driver.experiment_done
+    assert driver.server.reservations.get_assigned_trial(1) is None
@@ -0,0 +1,62 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+import random
+
+import numpy as np
+import pytest
+
+from maggy.core.statistics import P2Quantile, RunningStatistics
+
+
+def test_running_statistics():
+
+    stats = RunningStatistics()
+    values = [0.5, 2.0, 0.25, 2.0, 1.0]
+    for i, value in enumerate(values):
+        stats.update(value, "t{}".format(i))
+
+    assert stats.count == 5
+    assert stats.mean == pytest.approx(np.mean(values))
+    assert stats.variance == pytest.approx(np.var(values, ddof=1))
+    assert (stats.min, stats.min_id) == (0.25, "t2")
+    # ties keep the first trial
+    assert (stats.max, stats.max_id) == (2.0, "t1")
+    assert stats.median == 1.0
+    assert stats.values is None
+    assert "values" not in stats.to_dict()
+
+    stats = RunningStatistics(keep_values=True)
+    stats.update(3)
+    assert stats.to_dict()["values"] == [3]
+
+
+def test_p2_quantile():
+
+    rng = random.Random(1)
+    values = [rng.gauss(0, 1) for _ in range(10000)]
+
+    for p in [0.5, 0.9]:
+        quantile = P2Quantile(p)
+        for value in values:
+            quantile.add(value)
+        assert quantile.value() == pytest.approx(np.quantile(values, p), abs=0.05)
+
+    quantile = P2Quantile(0.9)
+    assert quantile.value() is None
+    for value in [1, 2, 3]:
+        quantile.add(value)
+    assert quantile.value() == pytest.approx(2.8)
@@ -0,0 +1,45 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+import json
+
+from maggy.core.timeline import Timeline
+
+
+def test_timeline_chrome_trace():
+
+    timeline = Timeline(max_events=3)
+    timeline.instant(1, "REG", 10.0, "executor")
+    timeline.span(1, "wait", 10.0, 10.5, "executor")
+    timeline.span(1, "abc", 10.5, 12.0, "trial", metric=0.9)
+    timeline.span(2, "idle", 11.0, 12.0, "executor")
+    assert timeline.dropped == 1
+
+    trace = json.loads(timeline.dumps("exp"))
+    events = [e for e in trace["traceEvents"] if e["ph"] != "M"]
+    assert [e["name"] for e in events] == ["REG", "wait", "abc"]
+    assert events[2]["ts"] == 10500000
+    assert events[2]["dur"] == 1500000
+    assert events[2]["tid"] == 1
+    assert events[2]["args"] == {"metric": 0.9}
+    names = [
+        (e["name"], e["args"]["name"])
+        for e in trace["traceEvents"]
+        if e["ph"] == "M" and "name" in e["args"]
+    ]
+    assert names == [("process_name", "exp"), ("thread_name", "executor 1")]
+    assert trace["otherData"]["dropped_events"] == 1
@@ -18,7 +18,9 @@ import pytest
 import time
 import random
 
-from maggy import Trial
+import numpy as np
+
+from maggy.trial import Trial
 
 
 def test_trial_init():
@@ -46,3 +48,95 @@ def test_trial_serialization():
     assert new_trial.params == exp
     assert new_trial.status == Trial.PENDING
     assert new_trial.trial_id == "3d1cc9fdb1d4d001"
+
+
+def test_trial_append_metrics():
+
+    trial = Trial({"param1": 5, "param2": "ada"})
+
+    trial.append_metrics([(0, 0.1), (1, None), (2, 0.3)])
+    trial.append_metrics([(2, 0.4), (3, 0.5)])
+
+    assert trial.metric_history == [0.1, 0.3, 0.5]
+    assert trial.step_history == [0, 2, 3]
+
+
+def test_trial_float_steps():
+
+    trial = Trial({"param1": 5, "param2": "ada"})
+
+    trial.append_metrics([(1, 0.1), (2, 0.2)])
+    trial.append_metrics([(2.5, 0.3)])
+
+    assert trial.step_history == [1, 2, 2.5]
+    assert trial.metric_dict == {1: 0.1, 2: 0.2, 2.5: 0.3}
+
+
+def test_trial_max_history():
+
+    trial = Trial({"param1": 5, "param2": "ada"})
+    trial.max_history = 8
+
+    trial.append_metrics([(step, float(step)) for step in range(10)])
+
+    # the newest points are kept, older ones are thinned out
+    assert len(trial.step_history) <= 8
+    assert trial.step_history[-4:] == [6, 7, 8, 9]
+    assert trial.step_history[0] == 0
+    assert trial.metric_history == [float(step) for step in trial.step_history]
+
+    new_trial = Trial.from_json(trial.to_json())
+    assert new_trial.step_history == trial.step_history
+
+    # progress and extremes cover the points that were thinned out
+    assert trial.num_metrics() == len(trial.step_history)
+    assert trial.num_steps == new_trial.num_steps == 10
+    assert trial.last_step() == 9
+    assert trial.max_metric() == 9.0
+    assert trial.min_metric() == 0.0
+
+
+def test_trial_metric_accessors():
+
+    trial = Trial({"param1": 5, "param2": "ada"})
+    assert trial.num_metrics() == 0
+    assert trial.last_step() is None
+    assert trial.max_metric() is None
+    assert trial.mean_metric(10) is None
+
+    trial.append_metrics([(1, 0.4), (2, 0.1), (4, 0.7)])
+    assert trial.num_metrics() == trial.num_steps == 3
+    assert trial.last_step() == 4
+    assert trial.max_metric() == 0.7
+    assert trial.min_metric() == 0.1
+    assert trial.mean_metric(0) is None
+    assert trial.mean_metric(3) == pytest.approx(0.25)
+
+    other = Trial({"param1": 6})
+    other.copy_metrics(trial)
+    trial.clear_metrics()
+    assert trial.num_steps == 0 and trial.max_metric() is None
+    assert other.num_steps == 3 and other.max_metric() == 0.7
+
+
+def test_trial_id_schemes():
+
+    params = {"param1": 5, "param2": "ada", "param3": 0.1, "param4": [1, "a"]}
+    reordered = {key: params[key] for key in reversed(list(params))}
+
+    Trial.set_id_scheme("blake2b")
+    try:
+        trial_id = Trial(params).trial_id
+        assert len(trial_id) == 16
+        assert Trial(reordered).trial_id == trial_id
+        # numbers keep their type
+        assert Trial({"param1": 5}).trial_id != Trial({"param1": 5.0}).trial_id
+        assert Trial({"param1": np.int64(5)}).trial_id == Trial({"param1": 5}).trial_id
+        with pytest.raises(ValueError):
+            Trial({1: 5})
+    finally:
+        Trial.set_id_scheme("md5")
+
+    assert Trial({"param1": 5, "param2": "ada"}).trial_id == "3d1cc9fdb1d4d001"
+    with pytest.raises(ValueError):
+        Trial.set_id_scheme("sha1")
@@ -0,0 +1,44 @@
+#
+#   Copyright 2020 Logical Clocks AB
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+#
+
+
+from maggy.core.utilization import Utilization
+
+
+def test_utilization():
+
+    utilization = Utilization()
+    utilization.add(0, "startup", 1.0)
+    utilization.add(0, "busy", 6.0)
+    utilization.add(0, "gap", 0.5)
+    utilization.add(1, "startup", 2.0)
+    utilization.add(1, "wasted", 3.0)
+    utilization.add(1, "idle", 2.5)
+    # negative durations from clock differences are ignored
+    utilization.add(1, "gap", -0.1)
+
+    assert 0 in utilization and 2 not in utilization
+    result = utilization.to_dict(wall_time=7.5, num_slots=2)
+    assert result["total"] == {
+        "busy": 6.0,
+        "wasted": 3.0,
+        "gap": 0.5,
+        "idle": 2.5,
+        "startup": 3.0,
+    }
+    assert result["busy_fraction"] == 0.4
+    assert result["partitions"]["1"]["gap"] == 0.0
+    assert utilization.describe(7.5, 2).startswith("busy 40.0%, wasted 20.0%")
@@ -15,11 +15,112 @@
 #
 
 import json
+import struct
 import threading
 import hashlib
+from array import array
+from bisect import bisect_right
+
+import numpy as np
 
 from maggy import util
 
+# encodes parameters exactly like json.dumps(params, sort_keys=True), without
+# creating an encoder per call
+_LEGACY_ENCODER = json.JSONEncoder(sort_keys=True)
+# canonical encoding of values nested in parameters, e.g. lists
+_NESTED_ENCODER = json.JSONEncoder(
+    sort_keys=True, separators=(",", ":"), default=util.json_default_numpy
+)
+_LENGTH = struct.Struct(">I").pack
+_FLOAT = struct.Struct(">d").pack
+# sorted names and their encodings by the names of parameter dicts in
+# insertion order, which is the same for all dicts of a searchspace
+_KEY_LAYOUTS = {}
+_MAX_KEY_LAYOUTS = 1024
+
+
+def _key_layout(params):
+    keys = tuple(params)
+    layout = _KEY_LAYOUTS.get(keys)
+    if layout is None:
+        if not all(isinstance(k, str) for k in keys):
+            raise ValueError("All hyperparameter names have to be strings.")
+        order = sorted(keys)
+        encoded = []
+        for key in order:
+            key_bytes = key.encode("utf-8")
+            encoded.append(b"s" + _LENGTH(len(key_bytes)) + key_bytes)
+        if len(_KEY_LAYOUTS) >= _MAX_KEY_LAYOUTS:
+            _KEY_LAYOUTS.clear()
+        layout = _KEY_LAYOUTS[keys] = (order, encoded)
+    return layout
+
+
+# encodings of string values, which repeat for categorical parameters
+_STRINGS = {}
+_MAX_STRINGS = 4096
+
+
+def _encode_other(value, nested):
+    """Encodes values other than floats, strings and ints. Nested values,
+    e.g. lists, are collected in ``nested`` and encoded together."""
+    if value is None:
+        return b"n"
+    if value is True:
+        return b"T"
+    if value is False:
+        return b"F"
+    # numpy scalars encode like the python numbers they stand for
+    if isinstance(value, np.integer):
+        return b"i%d;" % int(value)
+    if isinstance(value, (float, np.floating)):
+        return b"f" + _FLOAT(float(value))
+    nested.append(value)
+    return b"j"
+
+
+def encode_params(params):
+    """Encodes a parameter dictionary canonically as bytes: equal
+    dictionaries encode the same independent of their key order, numbers
+    keep their type and floats are encoded with their exact binary value.
+
+    :param params: Hyperparameters with string names.
+    :type params: dict
+    :raises ValueError: All hyperparameter names have to be strings.
+    :return: The encoding
+    :rtype: bytes
+    """
+    order, encoded_keys = _key_layout(params)
+    parts = [b"d", _LENGTH(len(order))]
+    append = parts.append
+    nested = []
+    for key, encoded_key in zip(order, encoded_keys):
+        append(encoded_key)
+        value = params[key]
+        value_type = type(value)
+        if value_type is float:
+            append(b"f" + _FLOAT(value))
+        elif value_type is str:
+            encoded = _STRINGS.get(value)
+            if encoded is None:
+                value_bytes = value.encode("utf-8")
+                encoded = b"s" + _LENGTH(len(value_bytes)) + value_bytes
+                if len(_STRINGS) >= _MAX_STRINGS:
+                    _STRINGS.clear()
+                _STRINGS[value] = encoded
+            append(encoded)
+        elif value_type is int:
+            append(b"i%d;" % value)
+        else:
+            append(_encode_other(value, nested))
+    if nested:
+        # one json array of all nested values in key order
+        nested_bytes = _NESTED_ENCODER.encode(nested).encode("utf-8")
+        append(_LENGTH(len(nested_bytes)))
+        append(nested_bytes)
+    return b"".join(parts)
+
 
 class Trial(object):
     """A Trial object contains all relevant information about the evaluation
@@ -28,14 +129,42 @@ class Trial(object):
     It is used as shared memory between
     the worker thread and rpc server thread. The server thread performs only
     lookups on the `early_stop` and `params` attributes.
+
+    Experiments can hold many trials with long learning curves, so trials
+    have no instance dictionary and store the curve as typed arrays of steps
+    and metrics. Readers in the scheduling loop use the accessors like
+    `num_metrics` and `max_metric`, the history properties return copies.
     """
 
+    __slots__ = (
+        "trial_type",
+        "trial_id",
+        "params",
+        "status",
+        "early_stop",
+        "final_metric",
+        "start",
+        "duration",
+        "lock",
+        "max_history",
+        "num_steps",
+        "_steps",
+        "_metrics",
+        "_max_metric",
+        "_min_metric",
+    )
+
     PENDING = "PENDING"
     SCHEDULED = "SCHEDULED"
     RUNNING = "RUNNING"
     ERROR = "ERROR"
     FINALIZED = "FINALIZED"
 
+    # hash functions of trial ids, 'md5' ids stay compatible with trial
+    # directories of experiments from earlier versions
+    ID_SCHEMES = ("md5", "blake2b")
+    _id_scheme = "md5"
+
     def __init__(self, params, trial_type="optimization"):
         """Create a new trial object from a hyperparameter combination
         ``params``.
@@ -62,12 +191,118 @@ class Trial(object):
         self.status = Trial.PENDING
         self.early_stop = False
         self.final_metric = None
-        self.metric_history = []
-        self.step_history = []
-        self.metric_dict = {}
         self.start = None
         self.duration = None
         self.lock = threading.RLock()
+        # maximum number of points of the learning curve, older points are
+        # downsampled beyond it, None to keep all
+        self.max_history = None
+        # number of metrics appended, including the ones downsampled since
+        self.num_steps = 0
+        # integer steps, converted to floats when a float step is reported
+        self._steps = array("q")
+        self._metrics = array("d")
+        # extremes of all metrics appended
+        self._max_metric = None
+        self._min_metric = None
+
+    @property
+    def metric_history(self):
+        """Metrics of the learning curve, as a new list."""
+        return self._metrics.tolist()
+
+    @metric_history.setter
+    def metric_history(self, metrics):
+        self._metrics = array("d", metrics)
+        self.num_steps = len(self._metrics)
+        self._max_metric = max(self._metrics, default=None)
+        self._min_metric = min(self._metrics, default=None)
+
+    @property
+    def step_history(self):
+        """Steps of the learning curve, as a new list."""
+        return self._steps.tolist()
+
+    @step_history.setter
+    def step_history(self, steps):
+        try:
+            self._steps = array("q", steps)
+        except TypeError:
+            self._steps = array("d", steps)
+
+    @property
+    def metric_dict(self):
+        """Metrics of the learning curve by step, as a new dictionary."""
+        return dict(zip(self._steps.tolist(), self._metrics.tolist()))
+
+    def num_metrics(self):
+        """Number of points of the learning curve. Can be lower than
+        `num_steps` if the curve was downsampled."""
+        return len(self._metrics)
+
+    def last_step(self):
+        """Step of the latest metric, or None."""
+        steps = self._steps
+        return steps[-1] if steps else None
+
+    def max_metric(self):
+        """Largest metric appended so far, or None."""
+        return self._max_metric
+
+    def min_metric(self):
+        """Smallest metric appended so far, or None."""
+        return self._min_metric
+
+    def mean_metric(self, step):
+        """Mean of the metrics up to and including ``step``, or None if there
+        are none. If the curve was downsampled, it is the mean of the points
+        that were kept, which weighs later points more.
+
+        :param step: Last step to include.
+        :type step: int or float
+        :rtype: float
+        """
+        with self.lock:
+            count = bisect_right(self._steps, step)
+            if count == 0:
+                return None
+            return sum(self._metrics[:count]) / count
+
+    def clear_metrics(self):
+        """Removes the learning curve, e.g. before the trial is run again."""
+        with self.lock:
+            self._steps = array("q")
+            self._metrics = array("d")
+            self.num_steps = 0
+            self._max_metric = None
+            self._min_metric = None
+
+    def copy_metrics(self, other):
+        """Replaces the learning curve with the one of trial ``other``."""
+        with self.lock:
+            self._steps = array(other._steps.typecode, other._steps)
+            self._metrics = array("d", other._metrics)
+            self.num_steps = other.num_steps
+            self._max_metric = other._max_metric
+            self._min_metric = other._min_metric
+
+    def snapshot(self):
+        """Returns a copy of the trial to serialize later, e.g. in a background
+        thread while the trial keeps changing. Copying the learning curve
+        arrays is much cheaper than converting them. The parameters are
+        shared with the trial.
+
+        :return: Copy of the trial with the same id.
+        :rtype: Trial
+        """
+        copy = Trial.__new__(Trial)
+        with self.lock:
+            for name in Trial.__slots__:
+                setattr(copy, name, getattr(self, name))
+            copy._steps = self._steps[:]
+            copy._metrics = self._metrics[:]
+        copy.lock = threading.RLock()
+        return copy
 
     def get_early_stop(self):
         """Return the early stopping flag of the trial."""
@@ -81,41 +316,93 @@ class Trial(object):
 
     def append_metric(self, metric_data):
         """Append a metric from the heartbeats to the history."""
+        self.append_metrics([(metric_data["step"], metric_data["value"])])
+
+    def append_metrics(self, metrics):
+        """Append a batch of metrics from a heartbeat to the history.
+
+        Reporters enforce increasing steps, so a metric is only appended if
+        its step is greater than the last one, which drops repeated steps.
+
+        :param metrics: (step, metric) pairs in the order they were reported.
+        :type metrics: list
+        """
         with self.lock:
-            # from python 3.7 dicts are insertion ordered,
-            # so two of these data structures can be removed
-            if (
-                metric_data["step"] not in self.metric_dict
-                and metric_data["value"] is not None
-            ):
-                self.metric_dict[metric_data["step"]] = metric_data["value"]
-                self.metric_history.append(metric_data["value"])
-                self.step_history.append(metric_data["step"])
+            steps = self._steps
+            num_metrics = len(self._metrics)
+            for step, value in metrics:
+                if value is None or (steps and step <= steps[-1]):
+                    continue
+                try:
+                    steps.append(step)
+                except TypeError:
+                    steps = self._steps = array("d", steps)
+                    steps.append(step)
+                self._metrics.append(value)
+            added = self._metrics[num_metrics:]
+            if added:
+                self.num_steps += len(added)
+                if self._max_metric is None:
+                    self._max_metric = self._min_metric = added[0]
+                self._max_metric = max(self._max_metric, max(added))
+                self._min_metric = min(self._min_metric, min(added))
+            if self.max_history is not None:
+                while len(self._steps) > self.max_history:
+                    self._downsample()
+
+    def _downsample(self):
+        """Keeps the newer half of ``max_history`` points and every second
+        point of the older ones."""
+        old = len(self._steps) - self.max_history // 2
+        self._steps = self._steps[:old:2] + self._steps[old:]
+        self._metrics = self._metrics[:old:2] + self._metrics[old:]
+
+    @classmethod
+    def set_id_scheme(cls, scheme):
+        """Selects how ids of new trials are generated.
+
+        'md5' (default) hashes the parameters serialized as sorted json, the
+        ids of earlier versions. 'blake2b' hashes their canonical binary
+        encoding, see `encode_params`, which is faster. Both ids have sixteen
+        characters. Experiments that are resumed or share a result cache
+        must use the same scheme.
+
+        :param scheme: Either 'md5' or 'blake2b'.
+        :type scheme: str
+        :raises ValueError: Unknown scheme.
+        """
+        if scheme not in cls.ID_SCHEMES:
+            raise ValueError(
+                "Unknown trial id scheme: should be either 'md5' or 'blake2b', "
+                "but it is '{0}'.".format(str(scheme))
+            )
+        cls._id_scheme = scheme
 
     @classmethod
     def _generate_id(cls, params):
         """
         Class method to generate a hash from a hyperparameter dictionary.
 
-        All keys in the dictionary have to be strings. The hash is a to 16
-        characters truncated md5 hash and stable across processes.
+        All keys in the dictionary have to be strings. The hash has 16
+        characters and is stable across processes, see `set_id_scheme`.
 
         :param params: Hyperparameters
         :type params: dictionary
         :raises ValueError: All hyperparameter names have to be strings.
         :raises ValueError: Hyperparameters need to be a dictionary.
-        :return: Sixteen character truncated md5 hash
+        :return: Sixteen character hash
         :rtype: str
         """
 
         # ensure params is a dictionary
         if isinstance(params, dict):
-            # check that all keys are strings
-            if False in set(isinstance(k, str) for k in params.keys()):
-                raise ValueError("All hyperparameter names have to be strings.")
+            if cls._id_scheme == "blake2b":
+                return hashlib.blake2b(encode_params(params), digest_size=8).hexdigest()
 
+            # checks that all keys are strings
+            _key_layout(params)
             return hashlib.md5(
-                json.dumps(params, sort_keys=True).encode("utf-8")
+                _LEGACY_ENCODER.encode(params).encode("utf-8")
             ).hexdigest()[:16]
 
         raise ValueError("Hyperparameters need to be a dictionary.")
@@ -123,16 +410,34 @@ class Trial(object):
     def to_json(self):
         return json.dumps(self.to_dict(), default=util.json_default_numpy)
 
-    def to_dict(self):
-        obj_dict = {"__class__": self.__class__.__name__}
+    def to_dict(self, metric_dict=True):
+        """Returns the trial as a json serializable dictionary.
 
-        temp_dict = self.__dict__.copy()
-        temp_dict.pop("lock")
-        temp_dict.pop("start")
-
-        obj_dict.update(temp_dict)
-
-        return obj_dict
+        :param metric_dict: Include the metrics by step, which `from_dict`
+            does not need as it rebuilds them from the histories, defaults to
+            True.
+        :type metric_dict: bool, optional
+        :rtype: dict
+        """
+        with self.lock:
+            steps = self._steps.tolist()
+            metrics = self._metrics.tolist()
+        trial_dict = {
+            "__class__": self.__class__.__name__,
+            "trial_type": self.trial_type,
+            "trial_id": self.trial_id,
+            "params": self.params,
+            "status": self.status,
+            "early_stop": self.early_stop,
+            "final_metric": self.final_metric,
+            "metric_history": metrics,
+            "step_history": steps,
+            "num_steps": self.num_steps,
+            "duration": self.duration,
+        }
+        if metric_dict:
+            trial_dict["metric_dict"] = dict(zip(steps, metrics))
+        return trial_dict
 
     @classmethod
     def from_json(cls, json_str):
@@ -149,13 +454,38 @@ class Trial(object):
         temp_dict = json.loads(json_str)
         if temp_dict.get("__class__", None) != "Trial":
             raise ValueError("json_str is not a Trial object.")
+        return cls.from_dict(temp_dict)
+
+    @classmethod
+    def from_dict(cls, temp_dict):
+        """Creates a Trial instance from a dictionary produced by `to_dict`,
+        after a round trip through json.
+
+        :param temp_dict: Dictionary containing the object.
+        :type temp_dict: dict
+        :return: Instantiated object instance of Trial.
+        :rtype: Trial
+        """
         if temp_dict.get("params", None) is not None:
-            instance = cls(temp_dict.get("params"))
+            instance = cls(
+                temp_dict.get("params"),
+                trial_type=temp_dict.get("trial_type", "optimization"),
+            )
             instance.trial_id = temp_dict["trial_id"]
             instance.status = temp_dict["status"]
             instance.early_stop = temp_dict.get("early_stop", False)
             instance.final_metric = temp_dict["final_metric"]
-            instance.metric_history = temp_dict["metric_history"]
             instance.duration = temp_dict["duration"]
+            # json turns the integer keys of metric_dict into strings, so it
+            # is rebuilt from the histories
+            metric_history = temp_dict["metric_history"]
+            step_history = temp_dict.get("step_history")
+            if step_history is None or len(step_history) != len(metric_history):
+                # older trials only stored the metrics
+                step_history = range(len(metric_history))
+            instance.step_history = step_history
+            instance.metric_history = metric_history
+            # the histories might have been downsampled
+            instance.num_steps = temp_dict.get("num_steps", instance.num_steps)
 
         return instance
@@ -27,7 +27,10 @@ from hops import hdfs as hopshdfs
 from hops.experiment_impl.util import experiment_utils
 
 from maggy import constants
-from maggy.core import exceptions
+from maggy.core import exceptions, storage
+
+# partition id of the executor processes of the local backend
+LOCAL_PARTITION_ENV_VAR = "MAGGY_LOCAL_PARTITION_ID"
 
 DEBUG = True
 
@@ -73,6 +76,9 @@ def get_partition_attempt_id():
         partitionId, attemptNumber -- [description]
     """
     task_context = TaskContext.get()
+    if task_context is None:
+        # executor process of the local backend, which doesn't retry
+        return int(os.environ[LOCAL_PARTITION_ENV_VAR]), 0
     return task_context.partitionId(), task_context.attemptNumber()
 
 
@@ -124,10 +130,10 @@ def _finalize_experiment(
     outputs = _build_summary_json(logdir)
 
     if outputs:
-        hopshdfs.dump(outputs, logdir + "/.summary.json")
+        storage.dump(outputs, logdir + "/.summary.json")
 
     if best_logdir:
-        experiment_json["bestDir"] = best_logdir[len(hopshdfs.project_path()) :]
+        experiment_json["bestDir"] = best_logdir[len(storage.project_path()) :]
     experiment_json["optimizationKey"] = optimization_key
     experiment_json["metric"] = metric
     experiment_json["state"] = state
@@ -143,11 +149,11 @@ def _build_summary_json(logdir):
     """
     combinations = []
 
-    for trial in hopshdfs.ls(logdir):
-        if hopshdfs.isdir(trial):
+    for trial in storage.ls(logdir):
+        if storage.isdir(trial):
             return_file = trial + "/.outputs.json"
             hparams_file = trial + "/.hparams.json"
-            if hopshdfs.exists(return_file) and hopshdfs.exists(hparams_file):
+            if storage.exists(return_file) and storage.exists(hparams_file):
                 metric_arr = experiment_utils._convert_return_file_to_arr(return_file)
                 hparams_dict = _load_hparams(hparams_file)
                 combinations.append({"parameters": hparams_dict, "outputs": metric_arr})
@@ -158,7 +164,7 @@ def _build_summary_json(logdir):
 def _load_hparams(hparams_file):
     """Loads the HParams configuration from a hparams file of a trial.
     """
-    hparams_file_contents = hopshdfs.load(hparams_file)
+    hparams_file_contents = storage.load(hparams_file)
     hparams = json.loads(hparams_file_contents)
 
     return hparams
@@ -167,7 +173,9 @@ def _load_hparams(hparams_file):
 def _handle_return_val(return_val, log_dir, optimization_key, log_file):
     """Handles the return value of the user defined training function.
     """
-    experiment_utils._upload_file_output(return_val, log_dir)
+    if storage.current() is hopshdfs:
+        # on the local backend output files stay where they are
+        experiment_utils._upload_file_output(return_val, log_dir)
 
     # Return type validation
     if not optimization_key:
@@ -195,13 +203,13 @@ def _handle_return_val(return_val, log_dir, optimization_key, log_file):
     # for key, value in return_val.items():
     #    return_val[key] = value if isinstance(value, str) else str(value)
 
-    return_val["log"] = log_file.replace(hopshdfs.project_path(), "")
+    return_val["log"] = log_file.replace(storage.project_path(), "")
 
     return_file = log_dir + "/.outputs.json"
-    hopshdfs.dump(json.dumps(return_val, default=json_default_numpy), return_file)
+    storage.dump(json.dumps(return_val, default=json_default_numpy), return_file)
 
     metric_file = log_dir + "/.metric"
-    hopshdfs.dump(json.dumps(opt_val, default=json_default_numpy), metric_file)
+    storage.dump(json.dumps(opt_val, default=json_default_numpy), metric_file)
 
     return opt_val
 
@@ -209,14 +217,14 @@ def _handle_return_val(return_val, log_dir, optimization_key, log_file):
 def _clean_dir(clean_dir, keep=[]):
     """Deletes all files in a directory but keeps a few.
     """
-    if not hopshdfs.isdir(clean_dir):
+    if not storage.isdir(clean_dir):
         raise ValueError(
             "{} is not a directory. Use `hops.hdfs.delete()` to delete single "
             "files.".format(clean_dir)
         )
-    for path in hopshdfs.ls(clean_dir):
+    for path in storage.ls(clean_dir):
         if path not in keep:
-            hopshdfs.delete(path, recursive=True)
+            storage.delete(path, recursive=True)
 
 
 def _validate_ml_id(app_id, run_id):